@@ -0,0 +1,107 @@
+import os
+import time
+import logging
+import threading
+from collections import Counter
+
+# Number of executor runs stopped by each budget, since the process started
+_exceeded = Counter()
+_exceeded_lock = threading.Lock()
+
+
+class BudgetExceeded(Exception):
+    """
+    Raised by the executor loop when a run goes over its budget, or by the planner when the plan
+    does not come before the deadline. The steps executed so far are kept (the run's unit of work
+    still commits them): the run ends with a partial result.
+
+    Attributes:
+    - reason (dict): Which budget was exceeded ("max_turns", "max_prompt_tokens",
+      "max_completion_tokens" or "deadline"), its limit and the usage of the run.
+    - messages (list): The executor conversation up to the stop.
+    """
+    def __init__(self, reason, messages=None):
+        super().__init__(f"Executor budget exceeded: {reason['budget']} ({reason['used']} >= {reason['limit']})")
+        self.reason = reason
+        self.messages = messages or []
+
+
+class RunBudget:
+    """
+    Limits of one executor run; a limit of 0 (or None) is not enforced.
+
+    Args:
+    - max_turns (int): Model calls.
+    - max_prompt_tokens (int): Prompt tokens summed over the model calls.
+    - max_completion_tokens (int): Completion tokens summed over the model calls.
+    - deadline_seconds (float): Wall-clock time since the run started.
+    """
+    def __init__(self, max_turns=20, max_prompt_tokens=200000, max_completion_tokens=20000, deadline_seconds=300):
+        self.max_turns = max_turns
+        self.max_prompt_tokens = max_prompt_tokens
+        self.max_completion_tokens = max_completion_tokens
+        self.deadline_seconds = deadline_seconds
+        self.started = time.monotonic()
+
+    def elapsed_seconds(self):
+        return round(time.monotonic() - self.started, 3)
+
+    def remaining_seconds(self):
+        """
+        Seconds left before the deadline, None without a deadline.
+        """
+        if not self.deadline_seconds:
+            return None
+        return max(0.0, self.deadline_seconds - (time.monotonic() - self.started))
+
+    def check(self, usage, messages=None):
+        """
+        Raises BudgetExceeded if the run cannot make another model call.
+
+        Args:
+        - usage (dict): The run usage so far (iterations, prompt_tokens, completion_tokens).
+        - messages (list): The executor conversation, attached to the exception.
+        """
+        elapsed = self.elapsed_seconds()
+        for budget, limit, used in (
+            ("max_turns", self.max_turns, usage["iterations"]),
+            ("max_prompt_tokens", self.max_prompt_tokens, usage["prompt_tokens"]),
+            ("max_completion_tokens", self.max_completion_tokens, usage["completion_tokens"]),
+            ("deadline", self.deadline_seconds, elapsed),
+        ):
+            if limit and used >= limit:
+                self.exceeded(budget, limit, used, usage, messages)
+
+    def exceeded(self, budget, limit, used, usage, messages=None):
+        reason = {
+            "budget": budget,
+            "limit": limit,
+            "used": used,
+            "elapsed_s": self.elapsed_seconds(),
+            "usage": dict(usage),
+        }
+        with _exceeded_lock:
+            _exceeded[budget] += 1
+        logging.warning(f"Executor run stopped, budget exceeded: {reason}")
+        raise BudgetExceeded(reason, messages)
+
+
+def get_run_budget():
+    """
+    Returns a new RunBudget with the limits AO_MAX_TURNS, AO_MAX_PROMPT_TOKENS, AO_MAX_COMPLETION_TOKENS
+    and AO_RUN_DEADLINE_SECONDS; the deadline starts now.
+    """
+    return RunBudget(
+        max_turns=int(os.getenv("AO_MAX_TURNS", "20")),
+        max_prompt_tokens=int(os.getenv("AO_MAX_PROMPT_TOKENS", "200000")),
+        max_completion_tokens=int(os.getenv("AO_MAX_COMPLETION_TOKENS", "20000")),
+        deadline_seconds=float(os.getenv("AO_RUN_DEADLINE_SECONDS", "300")),
+    )
+
+
+def budget_exceeded_counts():
+    """
+    Number of executor runs stopped by each budget since the process started.
+    """
+    with _exceeded_lock:
+        return dict(_exceeded)
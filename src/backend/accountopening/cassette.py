@@ -0,0 +1,291 @@
+import os
+import json
+import gzip
+import time
+import asyncio
+import hashlib
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+
+
+# Track of the run in progress (its clientID): different prospects can get the same plan
+_track = contextvars.ContextVar("cassette_track", default="")
+
+
+@contextmanager
+def cassette_track(name):
+    """
+    Records (and replays) the model calls of the enclosed run under `name`, e.g. the prospect's clientID.
+    """
+    token = _track.set(str(name or ""))
+    try:
+        yield
+    finally:
+        _track.reset(token)
+
+
+class CassetteMiss(LookupError):
+    """
+    Raised in replay mode when the cassette has no response recorded for a request.
+    """
+
+
+def _digest(value):
+    return hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+def _message(message):
+    return message if isinstance(message, dict) else message.model_dump()
+
+
+def request_key(kwargs):
+    """
+    Identifies a chat completions request by its run track, its conversation and its position in it:
+    the first message (the planner prompt, or the executor system prompt holding the plan) and the last
+    assistant message (its tool call ids, or its content). Tool outputs are not part of the key, so a
+    replayed run matches the recording even though the tools ran again (new timestamps and event ids).
+    """
+    messages = [_message(message) for message in kwargs["messages"]]
+    kind = "executor" if kwargs.get("tools") else "planner"
+    assistant = next((m for m in reversed(messages) if m.get("role") == "assistant"), None)
+    if assistant is None:
+        position = "start"
+    elif assistant.get("tool_calls"):
+        position = _digest([call["id"] for call in assistant["tool_calls"]])
+    else:
+        position = _digest(assistant.get("content"))
+    return f"{kind}:{_track.get()}:{_digest(messages[0].get('content'))}:{position}"
+
+
+def _completion_from_chunks(chunks):
+    # A streamed response is recorded as the completion it adds up to
+    first = chunks[0]
+    usage = next((chunk.usage for chunk in chunks if getattr(chunk, "usage", None) is not None), None)
+    content = "".join(chunk.choices[0].delta.content or "" for chunk in chunks if chunk.choices)
+    return {
+        "id": first.id,
+        "object": "chat.completion",
+        "created": first.created,
+        "model": first.model,
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+        "usage": usage.model_dump(exclude_none=True) if usage is not None else None,
+    }
+
+
+def _chunks(completion, include_usage, pieces=20):
+    content = completion.choices[0].message.content or ""
+    step = max(1, len(content) // pieces)
+    chunks = [ChatCompletionChunk.model_validate({
+        "id": completion.id,
+        "object": "chat.completion.chunk",
+        "created": completion.created,
+        "model": completion.model,
+        "choices": [{"index": 0, "delta": {"content": content[start:start + step]}, "finish_reason": None}],
+    }) for start in range(0, len(content), step)]
+    if include_usage and completion.usage is not None:
+        chunks.append(ChatCompletionChunk.model_validate({
+            "id": completion.id,
+            "object": "chat.completion.chunk",
+            "created": completion.created,
+            "model": completion.model,
+            "choices": [],
+            "usage": completion.usage.model_dump(),
+        }))
+    return chunks
+
+
+class Cassette:
+    """
+    On-disk recording of chat completions: one compact JSON line per response (gzip-compressed if the
+    path ends with .gz) with its request key and latency.
+
+    Args:
+    - path (str): The cassette file; recording appends to it.
+    - speed (float): Replay speed: 1 serves responses with their recorded latency, 2 twice as fast,
+      0 without any delay.
+    """
+    def __init__(self, path, speed=1.0):
+        self.path = path
+        self.speed = speed
+        self._entries = None
+        self._file = None
+        self._lock = threading.Lock()
+
+    def _open(self, mode):
+        if self.path.endswith(".gz"):
+            return gzip.open(self.path, mode + "t", encoding="utf-8")
+        return open(self.path, mode, encoding="utf-8")
+
+    def record(self, kwargs, response, latency):
+        entry = {
+            "key": request_key(kwargs),
+            "latency_ms": round(latency * 1000, 1),
+            "response": response if isinstance(response, dict) else response.model_dump(exclude_none=True),
+        }
+        line = json.dumps(entry, separators=(",", ":"), ensure_ascii=False) + "\n"
+        with self._lock:
+            if self._file is None:
+                self._file = self._open("a")
+            self._file.write(line)
+            self._file.flush()
+
+    def lookup(self, kwargs):
+        """
+        Returns the recorded (ChatCompletion, replay delay in seconds) of a request.
+
+        Raises:
+            CassetteMiss: If no response was recorded for this request.
+        """
+        if self._entries is None:
+            with self._lock:
+                if self._entries is None:
+                    self._entries = self._load()
+        key = request_key(kwargs)
+        entry = self._entries.get(key)
+        if entry is None:
+            raise CassetteMiss(f"No response recorded for {key} in {self.path}")
+        delay = entry["latency_ms"] / 1000 / self.speed if self.speed else 0.0
+        return ChatCompletion.model_validate(entry["response"]), delay
+
+    def _load(self):
+        entries = {}
+        with self._open("r") as file:
+            for line in file:
+                if line.strip():
+                    entry = json.loads(line)
+                    entries[entry["key"]] = entry
+        logging.info(f"Cassette loaded: {len(entries)} responses from {self.path}")
+        return entries
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class _Namespace:
+    pass
+
+
+class _CassetteClient:
+    def __init__(self, cassette, client=None):
+        self.cassette = cassette
+        self.client = client
+        self.chat = _Namespace()
+        self.chat.completions = _Namespace()
+        self.chat.completions.create = self._create
+
+
+class RecordingClient(_CassetteClient):
+    """
+    Wraps an AzureOpenAI client and records every chat completion it returns.
+    """
+    def _create(self, **kwargs):
+        started = time.perf_counter()
+        response = self.client.chat.completions.create(**kwargs)
+        self.cassette.record(kwargs, response, time.perf_counter() - started)
+        return response
+
+
+class AsyncRecordingClient(_CassetteClient):
+    """
+    Wraps an AsyncAzureOpenAI client and records every chat completion it returns (streams once consumed).
+    """
+    async def _create(self, **kwargs):
+        started = time.perf_counter()
+        response = await self.client.chat.completions.create(**kwargs)
+        if kwargs.get("stream"):
+            return self._record_stream(kwargs, response, started)
+        self.cassette.record(kwargs, response, time.perf_counter() - started)
+        return response
+
+    async def _record_stream(self, kwargs, stream, started):
+        chunks = []
+        async for chunk in stream:
+            chunks.append(chunk)
+            yield chunk
+        if chunks:
+            self.cassette.record(kwargs, _completion_from_chunks(chunks), time.perf_counter() - started)
+
+
+class ReplayClient(_CassetteClient):
+    """
+    Serves the recorded chat completions instead of calling the model.
+    """
+    def _create(self, **kwargs):
+        response, delay = self.cassette.lookup(kwargs)
+        time.sleep(delay)
+        return response
+
+
+class AsyncReplayClient(_CassetteClient):
+    """
+    asyncio flavour of ReplayClient; streamed requests get the recorded response in chunks.
+    """
+    async def _create(self, **kwargs):
+        response, delay = self.cassette.lookup(kwargs)
+        if kwargs.get("stream"):
+            include_usage = (kwargs.get("stream_options") or {}).get("include_usage", False)
+            return self._stream(_chunks(response, include_usage), delay)
+        await asyncio.sleep(delay)
+        return response
+
+    async def _stream(self, chunks, delay):
+        for chunk in chunks:
+            await asyncio.sleep(delay / len(chunks))
+            yield chunk
+
+
+# Record/replay of the planner and executor model calls: AO_LLM_CASSETTE_MODE off|record|replay,
+# cassette file AO_LLM_CASSETTE, replay speed AO_LLM_CASSETTE_SPEED
+_cassettes = {}
+_cassettes_lock = threading.Lock()
+
+
+def cassette_mode():
+    mode = os.getenv("AO_LLM_CASSETTE_MODE", "off").lower()
+    if mode not in ("off", "record", "replay"):
+        raise ValueError(f"Unknown cassette mode: {mode}")
+    return mode
+
+
+def get_cassette(path=None):
+    """
+    Returns the shared Cassette of the file AO_LLM_CASSETTE (default "llm_cassette.jsonl.gz").
+    """
+    path = path or os.getenv("AO_LLM_CASSETTE", "llm_cassette.jsonl.gz")
+    with _cassettes_lock:
+        cassette = _cassettes.get(path)
+        if cassette is None:
+            cassette = Cassette(path, speed=float(os.getenv("AO_LLM_CASSETTE_SPEED", "1")))
+            _cassettes[path] = cassette
+    return cassette
+
+
+def cassette_client(client_factory, asynchronous=False):
+    """
+    Applies the cassette mode to a model client: the client itself when off, wrapped to record its
+    responses in record mode, and a replay client (the real client is not created) in replay mode.
+
+    Args:
+    - client_factory: function returning the real (pooled) client.
+    - asynchronous (bool): Whether the client is an AsyncAzureOpenAI client.
+    """
+    mode = cassette_mode()
+    if mode == "off":
+        return client_factory()
+    if mode == "replay":
+        return (AsyncReplayClient if asynchronous else ReplayClient)(get_cassette())
+    return (AsyncRecordingClient if asynchronous else RecordingClient)(get_cassette(), client_factory())
+
+
+def close_cassettes():
+    with _cassettes_lock:
+        for cassette in _cassettes.values():
+            cassette.close()
+        _cassettes.clear()
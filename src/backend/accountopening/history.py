@@ -0,0 +1,135 @@
+import os
+import json
+from typing import Dict, Any, List
+
+
+class HistoryPolicy:
+    """
+    Decides which part of the executor conversation is sent to the model at each iteration.
+    The executor keeps the full conversation; `prepare` returns the messages of the next request.
+    """
+    def prepare(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        return messages
+
+
+class FullHistory(HistoryPolicy):
+    """
+    Resends the whole conversation: input tokens grow quadratically with the number of steps.
+    """
+
+
+class CompactHistory(HistoryPolicy):
+    """
+    Keeps the request size bounded: the system prompt (the plan) is always sent, the last
+    `keep_turns` turns are sent in full, older tool outputs are replaced by compact summaries and
+    turns older than `window_turns` are folded into a single recap message.
+
+    A turn is an assistant message followed by the outputs of the tools it called, which are kept
+    together (a tool call must always be answered in the request).
+
+    Args:
+    - keep_turns (int): Number of most recent turns sent with their full tool outputs.
+    - window_turns (int): Number of turns sent as messages (older ones are recapped), None for no limit.
+    - max_tool_chars (int): Tool outputs longer than this are truncated, even in recent turns.
+    """
+    def __init__(self, keep_turns=2, window_turns=None, max_tool_chars=4000):
+        self.keep_turns = keep_turns
+        self.window_turns = window_turns
+        self.max_tool_chars = max_tool_chars
+
+    def prepare(self, messages):
+        head, turns = _split_turns(messages)
+        recent = len(turns) - self.keep_turns
+        prepared = [
+            [self._truncate(message) if index >= recent else self._compact(message) for message in turn]
+            for index, turn in enumerate(turns)
+        ]
+        if self.window_turns is not None and len(prepared) > self.window_turns:
+            dropped = len(prepared) - self.window_turns
+            recap = _recap(turns[:dropped])
+            prepared = prepared[dropped:]
+            head = head + [recap]
+        return head + [message for turn in prepared for message in turn]
+
+    def _compact(self, message):
+        if message.get("role") != "tool":
+            return message
+        return {**message, "content": summarize_tool_output(message.get("content"), self.max_tool_chars)}
+
+    def _truncate(self, message):
+        if message.get("role") != "tool":
+            return message
+        return {**message, "content": truncate(message.get("content"), self.max_tool_chars)}
+
+
+def summarize_tool_output(content: str, max_chars: int = 4000) -> str:
+    """
+    Compact form of a tool output: scalar fields are kept, lists and objects are replaced by their
+    size (e.g. the onboarding log by "[12 items]"), and the result is truncated to `max_chars`.
+    """
+    try:
+        value = json.loads(content) if isinstance(content, str) else content
+    except ValueError:
+        return truncate(content, max_chars)
+    if isinstance(value, dict):
+        value = {key: _scalar(item) for key, item in value.items()}
+    else:
+        value = _scalar(value)
+    return truncate(json.dumps(value, default=str), max_chars)
+
+
+def truncate(content: str, max_chars: int) -> str:
+    if content is None or len(content) <= max_chars:
+        return content
+    return content[:max_chars] + f"... [truncated {len(content) - max_chars} chars]"
+
+
+def _scalar(value):
+    if isinstance(value, list):
+        return f"[{len(value)} items]"
+    if isinstance(value, dict):
+        return f"{{{len(value)} fields}}"
+    return value
+
+
+def _split_turns(messages):
+    head, turns = [], []
+    for message in messages:
+        if message.get("role") == "assistant":
+            turns.append([message])
+        elif turns:
+            turns[-1].append(message)
+        else:
+            head.append(message)
+    return head, turns
+
+
+def _recap(turns):
+    lines = []
+    for turn in turns:
+        outputs = {m.get("tool_call_id"): m.get("content") for m in turn if m.get("role") == "tool"}
+        for tool_call in turn[0].get("tool_calls") or []:
+            output = outputs.get(tool_call["id"])
+            summary = summarize_tool_output(output, 300) if output is not None else "no output"
+            lines.append(f"- {tool_call['function']['name']}: {summary}")
+    return {
+        "role": "user",
+        "content": "Steps already executed (outputs summarized):\n" + "\n".join(lines)
+    }
+
+
+def get_history_policy(name: str = None) -> HistoryPolicy:
+    """
+    Returns the executor history policy configured by AO_EXECUTOR_HISTORY ("compact" or "full").
+    """
+    name = name or os.getenv("AO_EXECUTOR_HISTORY", "compact")
+    if name == "full":
+        return FullHistory()
+    if name == "compact":
+        window = os.getenv("AO_EXECUTOR_HISTORY_WINDOW", "4")
+        return CompactHistory(
+            keep_turns=int(os.getenv("AO_EXECUTOR_HISTORY_KEEP_TURNS", "2")),
+            window_turns=int(window) if window else None,
+            max_tool_chars=int(os.getenv("AO_EXECUTOR_TOOL_MAX_CHARS", "4000")),
+        )
+    raise ValueError(f"Unknown executor history policy: {name}")
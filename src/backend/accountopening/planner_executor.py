@@ -1,36 +1,47 @@
 import json
 import os
+import time
+import asyncio
 import logging
-from typing import Dict, Any, List
-from datetime import datetime
-import random
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 
-from azure.core.credentials import AzureKeyCredential
-from azure.identity import DefaultAzureCredential
-from skills.account_opening_tools import *
+from skills.account_opening_tools import FUNCTION_MAPPING, ASYNC_FUNCTION_MAPPING, TOOLS, TOOLS_JSON, TOOL_EFFECTS
 
-from openai import AzureOpenAI
+from openai import APITimeoutError
+from llm_clients import get_pooled_openai_client, get_pooled_async_openai_client
+from accountopening.prompt_builder import PlannerPromptBuilder, cached_prompt_tokens
+from accountopening.history import get_history_policy
+from accountopening.tool_calls import tool_call_waves
+from accountopening.budget import get_run_budget
+from accountopening.cassette import cassette_client
+from unit_of_work import current_unit_of_work
+from telemetry import tracer, set_attributes, record_usage, hash_client_id
+from metrics import PLANNER_SECONDS, EXECUTOR_SECONDS, observe_tokens
 
-# Initialize OpenAI clients
+# Get the pooled OpenAI clients (one per endpoint/deployment for the app lifetime)
+# (recorded to, or replayed from, a cassette with AO_LLM_CASSETTE_MODE=record|replay)
 def get_openai_client(key, endpoint, deployment):
-    return AzureOpenAI(
+    return cassette_client(lambda: get_pooled_openai_client(
         api_key=os.getenv(key),
-        api_version="2025-01-01-preview",
-        azure_endpoint=os.getenv(endpoint),
-        azure_deployment=os.getenv(deployment)
-    )
+        endpoint=os.getenv(endpoint),
+        deployment=os.getenv(deployment)
+    ))
+
+
+def get_async_openai_client(key, endpoint, deployment):
+    return cassette_client(lambda: get_pooled_async_openai_client(
+        api_key=os.getenv(key),
+        endpoint=os.getenv(endpoint),
+        deployment=os.getenv(deployment)
+    ), asynchronous=True)
 
 
-def call_o1(client, scenario):
-        
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        file_path = os.path.join(script_dir, 'business_logic.txt')
-        business_logic = ""
-        with open(file_path, 'r') as file:
-            business_logic = file.read()
-    
-        # Prompt templates
-        O1_PROMPT = """
+# Let the executor issue several tool calls per turn (the independent ones run concurrently)
+PARALLEL_TOOL_CALLS = os.getenv("AO_PARALLEL_TOOL_CALLS", "true").lower() == "true"
+
+# Prompt templates
+O1_PROMPT = """
 You are a an account opening assistant focusing on orchestrating a full end to end workflow of private banking investement account opening
 that involve several steps.
 You are a planner. The input you will receive (the scenario) include the current status of the workflow in the field "status" of the prospect_data.
@@ -54,9 +65,6 @@ When creating a plan for the LLM to execute, break your instructions into a logi
     - **Generate summary** Before the `instructions_complete` ask the LLM to make a summary of the actions.
 Use markdown format when generating the plan with each step and sub-step.
 
-Please find the scenario below.
-{scenario}
-
 ---
 
 ### Guidance Plan
@@ -67,22 +75,13 @@ Below is the ruleset of how you need to structure your final plan, including con
 
 **End of Plan**
 
-"""       
-        
-        prompt= O1_PROMPT.replace("{tools}",str(TOOLS)).replace("{scenario}",str(scenario))
-     
-        response = client.chat.completions.create(
-            model=os.getenv("O1_OPENAI_DEPLOYMENT_NAME"),
-            messages=[{'role': 'user', 'content': prompt}]
-        )
-        
-        plan = response.choices[0].message.content
-        print(f"📟 Response from o1 plan: {plan}")
-        return plan
-
-
-def call_gpt4o(client, plan):
-        GPT4O_SYSTEM_PROMPT = """
+---
+
+Please find the scenario below.
+{scenario}
+"""
+
+GPT4O_SYSTEM_PROMPT = """
 You are a helpful assistant responsible for executing a plan about account opening.
 Your task is to:
 1. Follow the plan exactly as written
@@ -92,52 +91,403 @@ Your task is to:
 5. Call the instructions_complete function only when all steps are done
 6. Never write or execute code
 7. In your response, do not add things like "I have succesfully do this and that..." or "This should provide you with the content you asked for..."
+8. Only call several functions in the same response when none of them depends on the result of another: a step the plan runs only if the previous step returned a given status must wait for that result
 
 PLAN TO EXECUTE:
 {plan}
 
 Remember to explain each action you take and provide status updates.
 """
-        
-        gpt4o_policy_prompt = GPT4O_SYSTEM_PROMPT.replace("{plan}", plan)
-        messages = [{'role': 'system', 'content': gpt4o_policy_prompt}]
 
+CONTINUE_PROMPT = "Continue with the next step of the plan, or call the instructions_complete function if all steps are done."
+
+
+# Static prefix compiled once (recompiled when business_logic.txt changes), scenario last
+PLANNER_PROMPT = PlannerPromptBuilder(
+    O1_PROMPT,
+    TOOLS,
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'business_logic.txt'),
+    tools_json=TOOLS_JSON,
+    effects=TOOL_EFFECTS
+)
+
+
+def build_o1_prompt(scenario):
+    return PLANNER_PROMPT.build(scenario)[0]
+
+
+def build_o1_prompt_with_stats(scenario):
+    """
+    Builds the planner prompt with the projection of the scenario on the fields the ruleset and the
+    tools use, and returns it with its prompt token counts, with and without the projection.
+    """
+    return PLANNER_PROMPT.build(scenario)
+
+
+def _log_prompt_stats(stats, response=None, on_event=None):
+    usage = getattr(response, "usage", None) if response is not None else None
+    if usage is not None:
+        stats["prompt_tokens_billed"] = usage.prompt_tokens
+        stats["prompt_tokens_cached"] = cached_prompt_tokens(usage)
+    logging.info(f"o1 planner prompt tokens: {stats}")
+    if on_event is not None:
+        on_event({"type": "planner_prompt", **stats})
+
+
+def _log_executor_usage(response, usage):
+    """
+    Logs the token usage of an executor iteration and adds it to the run totals in `usage`.
+    """
+    usage["iterations"] += 1
+    if getattr(response, "usage", None) is None:
+        return
+    usage["prompt_tokens"] += response.usage.prompt_tokens
+    usage["completion_tokens"] += response.usage.completion_tokens
+    usage["cached_tokens"] += cached_prompt_tokens(response.usage)
+    logging.info(f"gpt-4o executor iteration {usage['iterations']}: prompt tokens {response.usage.prompt_tokens} "
+                 f"(cached: {cached_prompt_tokens(response.usage)}), run total {usage['prompt_tokens']}")
+
+
+def _executor_usage():
+    return {"iterations": 0, "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0}
+
+
+def _trace_planner(span, stats, usage):
+    set_attributes(span, {
+        "gen_ai.operation.name": "chat",
+        "gen_ai.request.model": os.getenv("O1_OPENAI_DEPLOYMENT_NAME"),
+        "ao.client_id_hash": hash_client_id(stats.get("clientID")),
+        "ao.prompt.prefix_tokens": stats.get("prefix_tokens"),
+        "ao.prompt.scenario_tokens": stats.get("projected_scenario_tokens"),
+    })
+    record_usage(span, usage)
+    observe_tokens(os.getenv("O1_OPENAI_DEPLOYMENT_NAME"), usage)
+
+
+def _trace_turn(span, usage, response):
+    tool_calls = response.choices[0].message.tool_calls or []
+    set_attributes(span, {
+        "gen_ai.operation.name": "chat",
+        "gen_ai.request.model": os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME"),
+        "ao.executor.iteration": usage["iterations"],
+        "ao.executor.tool_calls": [tool.function.name for tool in tool_calls],
+    })
+    record_usage(span, getattr(response, "usage", None))
+    observe_tokens(os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME"), getattr(response, "usage", None))
+
+
+def _trace_executor(span, usage):
+    set_attributes(span, {f"ao.executor.{key}": value for key, value in usage.items()})
+
+
+def _log_plan(plan):
+    logging.info(f"o1 plan: {plan}")
+    return plan
+
+
+def _executor_messages(plan):
+    gpt4o_policy_prompt = GPT4O_SYSTEM_PROMPT.replace("{plan}", plan)
+    return [{'role': 'system', 'content': gpt4o_policy_prompt}]
+
+
+def _executor_request(messages):
+    return dict(
+        model=os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME"),
+        messages=messages,
+        tools=TOOLS,
+        parallel_tool_calls=PARALLEL_TOOL_CALLS
+    )
+
+
+def _tool_error_message(tool, error):
+    # Every tool call must be answered: the model gets the error instead of a result
+    logging.error(f"Error in {tool.function.name}: {str(error)}")
+    return {
+        "role": "tool",
+        "tool_call_id": tool.id,
+        "content": json.dumps({"error": f"{tool.function.name} failed with error: {str(error)}"})
+    }
+
+
+def _until_complete(tool_calls):
+    # The calls issued before instructions_complete are executed, the run ends with it
+    for index, tool in enumerate(tool_calls):
+        if tool.function.name == 'instructions_complete':
+            return tool_calls[:index], True
+    return tool_calls, False
+
+
+def _continue_message():
+    # The model answered without calling a tool: ask for the next step rather than resending the same conversation
+    return {"role": "user", "content": CONTINUE_PROMPT}
+
+
+def _tool_message(tool, function_response):
+    function_name = tool.function.name
+    logging.debug(f"{function_name} returned: {json.dumps(function_response)}")
+    return {
+        "role": "tool",
+        "tool_call_id": tool.id,
+        "content": json.dumps(function_response)
+    }
+
+
+def _planner_request(prompt, **kwargs):
+    return dict(model=os.getenv("O1_OPENAI_DEPLOYMENT_NAME"), messages=[{'role': 'user', 'content': prompt}], **kwargs)
+
+
+def _planned(span, prompt_stats, plan, usage_response, on_event=None):
+    # The plan received (in one response or streamed): its prompt stats and usage are logged and traced
+    _log_prompt_stats(prompt_stats, usage_response, on_event)
+    _trace_planner(span, prompt_stats, getattr(usage_response, "usage", None))
+    return _log_plan(plan)
+
+
+def _planner_deadline_exceeded(budget):
+    # The run deadline includes the planner: a plan not received in time stops the run like the executor
+    budget.exceeded("deadline", budget.deadline_seconds, budget.elapsed_seconds(), _executor_usage())
+
+
+def call_o1(client, scenario, budget=None):
+    if client is None:
+        client = get_openai_client("O1_OPENAI_API_KEY", "O1_OPENAI_ENDPOINT", "O1_OPENAI_DEPLOYMENT_NAME")
+
+    with tracer.start_as_current_span("ao.planner") as span, PLANNER_SECONDS.time():
+        prompt, prompt_stats = build_o1_prompt_with_stats(scenario)
+
+        request = _planner_request(prompt)
+        if budget is not None and budget.remaining_seconds() is not None:
+            request["timeout"] = budget.remaining_seconds()
+        try:
+            response = client.chat.completions.create(**request)
+        except APITimeoutError:
+            if budget is None:
+                raise
+            _planner_deadline_exceeded(budget)
+        return _planned(span, prompt_stats, response.choices[0].message.content, response)
+
+
+def _execute_tool(tool):
+    function_name = tool.function.name
+    logging.info(f"Executing function: {function_name}")
+    try:
+        arguments = json.loads(tool.function.arguments)
+        logging.debug(f"{function_name} arguments: {arguments}")
+        function_response = FUNCTION_MAPPING[function_name](**arguments)
+        return _tool_message(tool, function_response)
+
+    except Exception as e:
+        return _tool_error_message(tool, e)
+
+
+def _execute_forked(tool, fork):
+    with fork.activate():
+        return _execute_tool(tool)
+
+
+def _execute_tool_calls(tool_calls):
+    """
+    Runs the tool calls of a turn, the independent ones concurrently on threads (each in a fork of
+    the run's unit of work, joined in the order of the calls), and returns their tool messages.
+    """
+    messages = []
+    uow = current_unit_of_work()
+    for wave in tool_call_waves(tool_calls):
+        if len(wave) == 1 or uow is None:
+            results = [_execute_tool(tool) for tool in wave]
+        else:
+            forks = [uow.fork() for _ in wave]
+            with ThreadPoolExecutor(max_workers=len(wave)) as pool:
+                # each call runs in a copy of the caller's context (ThreadPoolExecutor does not propagate it)
+                futures = [pool.submit(contextvars.copy_context().run, _execute_forked, tool, fork)
+                           for tool, fork in zip(wave, forks)]
+                results = [future.result() for future in futures]
+            uow.join(forks)
+        messages += [message for message in results if message is not None]
+    return messages
+
+
+def _executor_turns(plan, history=None, budget=None):
+    """
+    The executor loop, shared by call_gpt4o and acall_gpt4o. Yields what the caller does, sync or async:
+    ("chat", request) for a model call and ("tools", tool_calls) for the tool calls of a turn; is sent
+    back the response / the tool messages (or thrown the error) and returns the conversation once the
+    model calls instructions_complete.
+    """
+    history = history or get_history_policy()
+
+    budget = budget or get_run_budget()
+
+    messages = _executor_messages(plan)
+    usage = _executor_usage()
+
+    with tracer.start_as_current_span("ao.executor") as executor_span, EXECUTOR_SECONDS.time():
         while True:
-            response = client.chat.completions.create(
-                model=os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME"),
-                messages=messages,
-                tools=TOOLS,
-                parallel_tool_calls=False
-            )
-            #self.logger.info(f" Response from 4o agent:\n {response}")
-            
-            assistant_message = response.choices[0].message.model_dump()
-            messages.append(assistant_message)
-   
-            if not response.choices[0].message.tool_calls:
-                continue
-
-            for tool in response.choices[0].message.tool_calls:
-                if tool.function.name == 'instructions_complete':
-                    return messages
-
-                function_name = tool.function.name 
-              
-                print(f"📟 Executing function: {function_name}")
+            budget.check(usage, messages)
+            with tracer.start_as_current_span("ao.executor.turn") as span:
+                request = _executor_request(history.prepare(messages))
+                if budget.remaining_seconds() is not None:
+                    request["timeout"] = budget.remaining_seconds()
                 try:
-                    arguments = json.loads(tool.function.arguments)
-                    print(f"📟 ...with arguments: {arguments}")
-                    function_response = FUNCTION_MAPPING[function_name](**arguments)
-                  
-                    print( f"{function_name}: {json.dumps(function_response)}")
-                    print("Function executed successfully!")
-                    #print(function_response)
-                    
-                    messages.append({
-                        "role": "tool",
-                        "tool_call_id": tool.id,
-                        "content": json.dumps(function_response)
-                    })
-                    
-                except Exception as e:
-                    print('error', f"Error in {function_name}: {str(e)}")
\ No newline at end of file
+                    response = yield "chat", request
+                except (APITimeoutError, asyncio.TimeoutError):
+                    budget.exceeded("deadline", budget.deadline_seconds, budget.elapsed_seconds(), usage, messages)
+                _log_executor_usage(response, usage)
+                _trace_turn(span, usage, response)
+                #self.logger.info(f" Response from 4o agent:\n {response}")
+
+                assistant_message = response.choices[0].message.model_dump()
+                messages.append(assistant_message)
+
+                if not response.choices[0].message.tool_calls:
+                    messages.append(_continue_message())
+                    continue
+
+                tool_calls, complete = _until_complete(response.choices[0].message.tool_calls)
+                messages += yield "tools", tool_calls
+            if complete:
+                logging.info(f"gpt-4o executor run usage: {usage}")
+                _trace_executor(executor_span, usage)
+                return messages
+
+
+def call_gpt4o(client, plan, history=None, budget=None):
+    if client is None:
+        client = get_openai_client("AZURE_OPENAI_API_KEY", "AZURE_OPENAI_ENDPOINT", "AZURE_OPENAI_DEPLOYMENT_NAME")
+
+    turns = _executor_turns(plan, history, budget)
+    result, error = None, None
+    try:
+        while True:
+            try:
+                action, payload = turns.throw(error) if error is not None else turns.send(result)
+            except StopIteration as done:
+                return done.value
+            try:
+                if action == "chat":
+                    result, error = client.chat.completions.create(**payload), None
+                else:
+                    result, error = _execute_tool_calls(payload), None
+            except Exception as e:
+                result, error = None, e
+    finally:
+        # ends the run's spans here if it is interrupted
+        turns.close()
+
+
+# Async variants: same prompts and loop, on AsyncAzureOpenAI and the async tools (ASYNC_FUNCTION_MAPPING).
+
+async def acall_o1(client, scenario, on_event=None, budget=None):
+    if client is None:
+        client = get_async_openai_client("O1_OPENAI_API_KEY", "O1_OPENAI_ENDPOINT", "O1_OPENAI_DEPLOYMENT_NAME")
+
+    with tracer.start_as_current_span("ao.planner") as span, PLANNER_SECONDS.time():
+        try:
+            return await asyncio.wait_for(
+                _aplan(client, scenario, span, on_event),
+                timeout=budget.remaining_seconds() if budget is not None else None
+            )
+        except asyncio.TimeoutError:
+            if budget is None:
+                raise
+            _planner_deadline_exceeded(budget)
+
+
+async def _aplan(client, scenario, span, on_event=None):
+    prompt, prompt_stats = build_o1_prompt_with_stats(scenario)
+
+    if on_event is None:
+        response = await client.chat.completions.create(**_planner_request(prompt))
+        return _planned(span, prompt_stats, response.choices[0].message.content, response)
+
+    # Streamed: every planner token is forwarded as soon as it is generated
+    stream = await client.chat.completions.create(
+        **_planner_request(prompt, stream=True, stream_options={"include_usage": True})
+    )
+    plan, usage_chunk = [], None
+    async for chunk in stream:
+        # Azure OpenAI sends chunks without choices (e.g. content filter results, final usage)
+        if getattr(chunk, "usage", None) is not None:
+            usage_chunk = chunk
+        content = chunk.choices[0].delta.content if chunk.choices else None
+        if content:
+            if not plan:
+                span.add_event("first_token")
+            plan.append(content)
+            on_event({"type": "plan_token", "content": content})
+    return _planned(span, prompt_stats, "".join(plan), usage_chunk, on_event)
+
+
+async def _aexecute_tool(tool, on_event=None):
+    function_name = tool.function.name
+
+    logging.info(f"Executing function: {function_name}")
+    try:
+        arguments = json.loads(tool.function.arguments)
+        logging.debug(f"{function_name} arguments: {arguments}")
+        if on_event is not None:
+            on_event({"type": "tool_call", "name": function_name, "arguments": arguments})
+        started = time.perf_counter()
+        function_response = await ASYNC_FUNCTION_MAPPING[function_name](**arguments)
+        if on_event is not None:
+            on_event({
+                "type": "tool_result",
+                "name": function_name,
+                "duration_ms": round((time.perf_counter() - started) * 1000, 2),
+                "result": function_response
+            })
+        return _tool_message(tool, function_response)
+
+    except Exception as e:
+        return _tool_error_message(tool, e)
+
+
+async def _aexecute_forked(tool, on_event, fork):
+    # runs in its own task (and context copy): the fork is the current unit of work of this call only
+    with fork.activate():
+        return await _aexecute_tool(tool, on_event)
+
+
+async def _aexecute_tool_calls(tool_calls, on_event=None):
+    """
+    Async variant of _execute_tool_calls: the independent calls of a wave run as concurrent tasks.
+    """
+    messages = []
+    uow = current_unit_of_work()
+    for wave in tool_call_waves(tool_calls):
+        if len(wave) == 1 or uow is None:
+            results = [await _aexecute_tool(tool, on_event) for tool in wave]
+        else:
+            forks = [uow.fork() for _ in wave]
+            results = await asyncio.gather(*(
+                asyncio.create_task(_aexecute_forked(tool, on_event, fork)) for tool, fork in zip(wave, forks)
+            ))
+            await uow.ajoin(forks)
+        messages += [message for message in results if message is not None]
+    return messages
+
+
+async def acall_gpt4o(client, plan, on_event=None, history=None, budget=None):
+    if client is None:
+        client = get_async_openai_client("AZURE_OPENAI_API_KEY", "AZURE_OPENAI_ENDPOINT", "AZURE_OPENAI_DEPLOYMENT_NAME")
+
+    turns = _executor_turns(plan, history, budget)
+    result, error = None, None
+    try:
+        while True:
+            try:
+                action, payload = turns.throw(error) if error is not None else turns.send(result)
+            except StopIteration as done:
+                return done.value
+            try:
+                if action == "chat":
+                    # the deadline is enforced on the event loop rather than by the client
+                    timeout = payload.pop("timeout", None)
+                    result, error = await asyncio.wait_for(client.chat.completions.create(**payload), timeout=timeout), None
+                else:
+                    result, error = await _aexecute_tool_calls(payload, on_event), None
+            except Exception as e:
+                result, error = None, e
+    finally:
+        # ends the run's spans here if it is cancelled
+        turns.close()
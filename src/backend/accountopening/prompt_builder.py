@@ -0,0 +1,97 @@
+import os
+import json
+import logging
+import threading
+
+from accountopening.scenario import projected_fields, project_scenario, count_tokens
+
+SCENARIO_PLACEHOLDER = "{scenario}"
+
+
+class PlannerPromptBuilder:
+    """
+    Builds the o1 planner prompt as a static prefix (instructions, tools, business logic) followed by
+    the scenario, so that consecutive plans share the prefix and hit the provider's prompt cache.
+
+    The prefix is compiled once and recompiled only when the business logic file changes on disk
+    (its mtime), so editing business_logic.txt does not need a restart.
+
+    Args:
+    - template (str): The prompt template; it must end with the {scenario} placeholder.
+    - tools (list): The executor tool definitions substituted for {tools}.
+    - business_logic_path (str): The ruleset file substituted for {business_logic}.
+    - tools_json (str): The serialized tool definitions, if already cached (e.g. ToolRegistry.schemas_json()).
+    - effects (dict): The fields the tools read and write (ToolRegistry.effects()): the scenario is
+      projected on the fields they read and the fields the business logic conditions test.
+    """
+    def __init__(self, template, tools, business_logic_path, tools_json=None, effects=None):
+        if not template.rstrip().endswith(SCENARIO_PLACEHOLDER):
+            raise ValueError("The planner prompt template must end with the {scenario} placeholder")
+        self.template = template.rstrip()[:-len(SCENARIO_PLACEHOLDER)]
+        self.tools = tools
+        self.tools_json = tools_json or json.dumps(tools, separators=(",", ":"))
+        self.effects = effects or {}
+        self.business_logic_path = business_logic_path
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._compiled = None
+
+    def compile(self):
+        """
+        Returns the compiled prefix as (prefix, prefix_tokens, projected_fields), reloading the
+        business logic if the file changed since the last compilation.
+        """
+        mtime = os.stat(self.business_logic_path).st_mtime_ns
+        if self._compiled is not None and mtime == self._mtime:
+            return self._compiled
+
+        with self._lock:
+            if self._compiled is None or mtime != self._mtime:
+                with open(self.business_logic_path, 'r') as file:
+                    business_logic = file.read()
+                prefix = (self.template
+                          .replace("{tools}", self.tools_json)
+                          .replace("{business_logic}", business_logic))
+                self._compiled = (prefix, count_tokens(prefix), projected_fields(business_logic, self.effects))
+                if self._mtime is not None:
+                    logging.info(f"Planner prompt recompiled: {self.business_logic_path} changed")
+                self._mtime = mtime
+        return self._compiled
+
+    def build(self, scenario):
+        """
+        Builds the planner prompt for a scenario.
+
+        Args:
+        - scenario (dict | str): The prospect; a dict is projected on the fields the ruleset and tools use.
+
+        Returns:
+        - (str, dict): The prompt and its token counts (static prefix, scenario with and without projection).
+        """
+        prefix, prefix_tokens, fields = self.compile()
+
+        full_scenario = str(scenario)
+        if isinstance(scenario, dict):
+            projected_scenario = project_scenario(scenario, fields)
+        else:
+            projected_scenario = full_scenario
+
+        scenario_tokens = count_tokens(full_scenario)
+        projected_tokens = count_tokens(projected_scenario)
+        stats = {
+            "clientID": scenario.get("clientID") if isinstance(scenario, dict) else None,
+            "scenario_tokens": scenario_tokens,
+            "projected_scenario_tokens": projected_tokens,
+            "prefix_tokens": prefix_tokens,
+            "prompt_tokens_unprojected": prefix_tokens + scenario_tokens,
+            "prompt_tokens": prefix_tokens + projected_tokens,
+        }
+        return prefix + projected_scenario + "\n", stats
+
+
+def cached_prompt_tokens(usage):
+    """
+    Prompt tokens served from the provider's prompt cache, as reported in a response's usage (0 if not reported).
+    """
+    details = getattr(usage, "prompt_tokens_details", None) if usage is not None else None
+    return (getattr(details, "cached_tokens", None) or 0) if details is not None else 0
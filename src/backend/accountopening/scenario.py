@@ -0,0 +1,64 @@
+import re
+import json
+import functools
+from typing import Dict, Any
+
+try:
+    import tiktoken
+except ImportError:  # optional: token counts are estimated without it
+    tiktoken = None
+
+# Always sent to the planner: it identifies the prospect and resumes the workflow from its status,
+# and pep_status (a politically exposed person) weighs on its escalations although no rule tests it
+ALWAYS_PROJECTED = ("clientID", "fullName", "status", "pep_status")
+
+# Conditions of the ruleset on a prospect field, e.g. `"risk_level"` is `"High"`
+# (not on a tool result: 'the returned "status" is ...')
+_CONDITION_FIELD = re.compile(r'(?<!returned )`?"([A-Za-z_][A-Za-z0-9_]*)"`?\s+is\s')
+
+
+@functools.lru_cache(maxsize=4)
+def _projected_fields(business_logic: str, reads: tuple) -> tuple:
+    fields = list(ALWAYS_PROJECTED) + list(reads) + _CONDITION_FIELD.findall(business_logic)
+    return tuple(dict.fromkeys(fields))
+
+
+def projected_fields(business_logic: str, effects: Dict[str, Dict[str, Any]]) -> tuple:
+    """
+    The prospect fields the planner needs: the fields the tools declare they read (the ToolRegistry
+    effects, e.g. documents_provided; "*" is not a field) and the fields the ruleset conditions test
+    (e.g. "risk_level").
+    """
+    reads = {field for effect in effects.values() for field in effect["reads"] or () if field != "*"}
+    return _projected_fields(business_logic, tuple(sorted(reads)))
+
+
+def project_scenario(scenario: Dict[str, Any], fields: tuple) -> str:
+    """
+    Serialises the projection of the prospect on `fields` as compact JSON: history logs,
+    portfolios and any field the ruleset does not use are left out of the planner prompt.
+    """
+    projection = {field: scenario[field] for field in fields if field in scenario}
+    return json.dumps(projection, separators=(",", ":"), ensure_ascii=False, default=str)
+
+
+def count_tokens(text: str) -> int:
+    """
+    Prompt tokens of `text` (o200k_base, the o1/4o encoding) with tiktoken, estimated at 4 characters
+    per token when tiktoken is not installed.
+    """
+    encoding = _encoding()
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+@functools.lru_cache(maxsize=1)
+def _encoding():
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding("o200k_base")
+    except Exception:
+        # the encoding file could not be loaded (e.g. offline)
+        return None
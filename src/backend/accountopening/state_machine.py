@@ -0,0 +1,224 @@
+import os
+import re
+import time
+import json
+import inspect
+import logging
+from typing import Dict, Any, List, Optional
+
+from skills.account_opening_tools import FUNCTION_MAPPING, ASYNC_FUNCTION_MAPPING
+
+BUSINESS_LOGIC_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'business_logic.txt')
+
+# Statuses of prospects on which no workflow step has run yet
+INITIAL_STATUSES = {"", "new", "active", "New prospect - KYC pending"}
+
+_STEP_HEADER = re.compile(r'^(\d+)\.\s+\*\*(.+?)\*\*', re.M)
+_FUNCTION_CALL = re.compile(r'call the (\w+) function')
+_STATUS_CONDITION = re.compile(r'"(status|overall_status)" is "([^"]+)"')
+_NEXT_STEP = re.compile(r'proceed to step:\s*\*\*(.+?)\*\*')
+_FIELDS_NOT_EMPTY = re.compile(r'all the fields above are not empty', re.I)
+_JSON_KEY = re.compile(r'"(\w+)"\s*:')
+_NON_FIELD_KEYS = {"name", "arguments", "prospect_data"}
+
+
+class UnsupportedScenario(Exception):
+    """
+    Raised when the compiled ruleset cannot decide the next step for a prospect
+    (the LLM planner has to handle it).
+    """
+
+
+class State:
+    """
+    One workflow step compiled from business_logic.txt.
+
+    - function: the FUNCTION_MAPPING tool to call
+    - expected_status: the "status" the tool must return to proceed (None: no status condition)
+    - status_field: the result field holding that status ("status", "overall_status" for the compliance assessment)
+    - required_fields: prospect fields that must not be empty to proceed (None: no field condition)
+    - next_state: title of the step to proceed to, None when the process stops after this step
+    """
+    def __init__(self, number, title, function, expected_status=None, required_fields=None, next_state=None,
+                 status_field="status"):
+        self.number = number
+        self.title = title
+        self.function = function
+        self.expected_status = expected_status
+        self.status_field = status_field
+        self.required_fields = required_fields
+        self.next_state = next_state
+
+    def __repr__(self):
+        return (f"State({self.number}, {self.title!r}, {self.function}, status={self.expected_status!r}, "
+                f"fields={self.required_fields}, next={self.next_state!r})")
+
+
+class WorkflowStateMachine:
+    """
+    Deterministic executor for the account opening ruleset: resumes from the prospect "status",
+    calls the tools directly and follows the status conditions, without any LLM call.
+    """
+    def __init__(self, states: List[State]):
+        self.states = {state.title: state for state in states}
+        self.first_state = states[0].title
+        # A step that succeeded resumes the workflow at the step it proceeds to
+        self.resume_after = {
+            state.expected_status: state.next_state
+            for state in states if state.expected_status and state.next_state
+        }
+
+    def start_state(self, prospect: Dict[str, Any]) -> Optional[State]:
+        status = (prospect.get("status") or "").strip()
+        if status in INITIAL_STATUSES or status.startswith("KYC "):
+            return self.states[self.first_state]
+        if status in self.resume_after:
+            return self.states[self.resume_after[status]]
+        raise UnsupportedScenario(f"No rule to resume from status '{status}'")
+
+    def arguments(self, state: State, prospect: Dict[str, Any], results: Dict[str, Any]) -> Dict[str, Any]:
+        arguments = {}
+        for name in inspect.signature(FUNCTION_MAPPING[state.function]).parameters:
+            if name == "prospect_data":
+                arguments[name] = prospect
+            elif name in prospect:
+                # e.g. name_screening_result: latest tool output first, then the stored field
+                arguments[name] = results.get(name, prospect[name])
+            elif name in results:
+                arguments[name] = results[name]
+            else:
+                raise UnsupportedScenario(f"Cannot resolve argument '{name}' of {state.function}")
+        return arguments
+
+    def next_state(self, state: State, prospect: Dict[str, Any], result: Any) -> Optional[State]:
+        if not isinstance(result, dict) or "error" in result:
+            return None
+        if state.required_fields is not None and any(not prospect.get(f) for f in state.required_fields):
+            return None
+        if state.expected_status is not None and result.get(state.status_field) != state.expected_status:
+            return None
+        return self.states.get(state.next_state) if state.next_state else None
+
+    def _report(self, prospect, steps, started):
+        return {
+            "engine": "state_machine",
+            "clientID": prospect.get("clientID"),
+            "steps": steps,
+            "final_status": prospect.get("status"),
+            "duration_ms": round((time.perf_counter() - started) * 1000, 2),
+        }
+
+    def run(self, prospect: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Runs the workflow on the (mutable) prospect with the sync tools and returns a run report.
+        Raises UnsupportedScenario when the prospect must be planned by the LLM.
+        """
+        started = time.perf_counter()
+        state, steps, results = self.start_state(prospect), [], {}
+        while state is not None:
+            step_started = time.perf_counter()
+            result = FUNCTION_MAPPING[state.function](**self.arguments(state, prospect, results))
+            steps.append(_step_report(state, result, step_started))
+            if isinstance(result, dict):
+                results.update(result)
+            state = self.next_state(state, prospect, result)
+        return self._report(prospect, steps, started)
+
+    async def arun(self, prospect: Dict[str, Any], on_event=None) -> Dict[str, Any]:
+        """
+        Async variant of run, on ASYNC_FUNCTION_MAPPING.
+        `on_event`, if given, is called with a "tool_call" and a "tool_result" event for every step.
+        """
+        started = time.perf_counter()
+        state, steps, results = self.start_state(prospect), [], {}
+        while state is not None:
+            step_started = time.perf_counter()
+            arguments = self.arguments(state, prospect, results)
+            if on_event is not None:
+                on_event({"type": "tool_call", "name": state.function,
+                          "arguments": {k: v for k, v in arguments.items() if k != "prospect_data"}})
+            result = await ASYNC_FUNCTION_MAPPING[state.function](**arguments)
+            steps.append(_step_report(state, result, step_started))
+            if on_event is not None:
+                on_event({"type": "tool_result", "name": state.function,
+                          "duration_ms": steps[-1]["duration_ms"], "result": result})
+            if isinstance(result, dict):
+                results.update(result)
+            state = self.next_state(state, prospect, result)
+        return self._report(prospect, steps, started)
+
+
+def _step_report(state, result, started):
+    logging.info(f"State machine executed: {state.function}")
+    return {
+        "step": state.title,
+        "function": state.function,
+        "result": result,
+        "duration_ms": round((time.perf_counter() - started) * 1000, 2),
+    }
+
+
+def compile_business_logic(text: str) -> WorkflowStateMachine:
+    """
+    Compiles the natural language ruleset into a WorkflowStateMachine.
+
+    Each numbered step becomes a State: the function comes from "call the X function", the
+    transition from "proceed to step: **Y**" and its condition from either a
+    '"status" is "..."' test or the "all the fields above are not empty" check.
+    Raises ValueError when a step proceeds to an unknown step or cannot be reached from the first one.
+    """
+    headers = list(_STEP_HEADER.finditer(text))
+    states = []
+    for i, header in enumerate(headers):
+        block = text[header.end():headers[i + 1].start() if i + 1 < len(headers) else len(text)]
+        function = _FUNCTION_CALL.search(block)
+        if function is None or function.group(1) not in FUNCTION_MAPPING or function.group(1) == "instructions_complete":
+            continue
+
+        next_step = _NEXT_STEP.search(block)
+        status = _STATUS_CONDITION.search(block)
+        required_fields = None
+        if _FIELDS_NOT_EMPTY.search(block):
+            required_fields = [key for key in _JSON_KEY.findall(block) if key not in _NON_FIELD_KEYS]
+
+        states.append(State(
+            number=int(header.group(1)),
+            title=header.group(2).strip(),
+            function=function.group(1),
+            expected_status=status.group(2) if status and next_step else None,
+            status_field=status.group(1) if status else "status",
+            required_fields=required_fields,
+            next_state=next_step.group(1).strip() if next_step else None,
+        ))
+
+    if not states:
+        raise ValueError("No executable step found in the business logic")
+    for state in states:
+        if state.next_state and state.next_state not in {s.title for s in states}:
+            raise ValueError(f"Step '{state.title}' proceeds to unknown step '{state.next_state}'")
+    # A step no transition leads to would never run (e.g. a "proceed to" line missing from the step before)
+    by_title = {state.title: state for state in states}
+    reachable, state = set(), states[0]
+    while state is not None and state.title not in reachable:
+        reachable.add(state.title)
+        state = by_title.get(state.next_state)
+    unreachable = [state.title for state in states if state.title not in reachable]
+    if unreachable:
+        raise ValueError(f"Steps not reachable from '{states[0].title}': {', '.join(unreachable)}")
+    return WorkflowStateMachine(states)
+
+
+_compiled = {"mtime": None, "machine": None}
+
+
+def get_state_machine(path: str = BUSINESS_LOGIC_PATH) -> WorkflowStateMachine:
+    """
+    Returns the state machine compiled from business_logic.txt, recompiled when the file changes.
+    """
+    mtime = os.path.getmtime(path)
+    if _compiled["mtime"] != mtime:
+        with open(path, 'r') as file:
+            _compiled["machine"] = compile_business_logic(file.read())
+        _compiled["mtime"] = mtime
+        logging.info(f"Business logic compiled into {len(_compiled['machine'].states)} states")
+    return _compiled["machine"]
@@ -0,0 +1,48 @@
+from typing import Dict, Any, List
+
+from skills.account_opening_tools import TOOL_EFFECTS, ORDERED_FIELDS
+
+# Tools without declared effects are assumed to read and write the whole profile
+_UNKNOWN_EFFECTS = {"reads": {"*"}, "writes": {"*"}}
+
+
+def _overlap(fields, other_fields):
+    if not fields or not other_fields:
+        return False
+    return "*" in fields or "*" in other_fields or bool(fields & other_fields)
+
+
+def conflicts(effects: Dict[str, set], other_effects: Dict[str, set]) -> bool:
+    """
+    Two tool calls conflict when one writes a field the other reads, or both write the same field
+    (except ORDERED_FIELDS, whose writes are applied in the order of the calls). A write of "status"
+    therefore conflicts with every tool reading it: the steps the ruleset gates on the status returned
+    by the previous step never run together.
+    """
+    reads, writes = effects["reads"], effects["writes"]
+    other_reads, other_writes = other_effects["reads"], other_effects["writes"]
+    return (_overlap(writes, other_reads) or _overlap(other_writes, reads)
+            or _overlap(writes - ORDERED_FIELDS, other_writes - ORDERED_FIELDS))
+
+
+def tool_call_waves(tool_calls: List[Any], effects: Dict[str, Dict[str, set]] = None) -> List[List[Any]]:
+    """
+    Splits the tool calls of an executor turn into consecutive waves of calls that do not conflict
+    with each other. The calls of a wave can run concurrently; waves run one after the other, so
+    every call still observes the writes of the conflicting calls issued before it.
+
+    Args:
+    - tool_calls (list): The tool calls of the turn, in the order the model issued them.
+    - effects (dict): Tool name -> {"reads": fields, "writes": fields}, defaults to TOOL_EFFECTS.
+    """
+    effects = TOOL_EFFECTS if effects is None else effects
+    waves = []
+    for tool_call in tool_calls:
+        call_effects = effects.get(tool_call.function.name, _UNKNOWN_EFFECTS)
+        wave = waves[-1] if waves else None
+        if wave is not None and not any(
+                conflicts(call_effects, effects.get(other.function.name, _UNKNOWN_EFFECTS)) for other in wave):
+            wave.append(tool_call)
+        else:
+            waves.append([tool_call])
+    return waves
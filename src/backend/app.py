@@ -1,25 +1,121 @@
-from fastapi import FastAPI, HTTPException, Body  
-from fastapi.responses import JSONResponse 
+from fastapi import FastAPI, HTTPException, Body, Depends, Request
+from fastapi.responses import StreamingResponse, Response
 import os
+import copy
 import json
-import datetime
+import asyncio
+import time
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
-from azure.identity import DefaultAzureCredential  
-from pydantic import BaseModel
-from typing import Optional, List
 import logging
 
-from openai import AzureOpenAI
-from crm_store import CRMStore  
-from accountopening.planner_executor import *
+from crm_store import PreconditionFailedError, PROSPECT_LIST_FIELDS, close_crm_stores
+from crm_store_async import AsyncCRMStore, get_async_crm_store, close_async_crm_stores
+from llm_clients import close_openai_clients, close_async_openai_clients
+from unit_of_work import async_unit_of_work
+from event_store import AsyncEventStore, get_async_event_store, clear_event_stores
+from jobs import JobWorkerPool, get_job_queue, close_job_queue, job_status, run_batch
+from patching import JsonPatchError, ProtectedPropertyError, apply_json_patch, apply_merge_patch, check_writable, diff
+from accountopening.planner_executor import PLANNER_PROMPT, acall_o1, acall_gpt4o, get_async_openai_client
+from accountopening.state_machine import get_state_machine, UnsupportedScenario
+from accountopening.budget import BudgetExceeded, get_run_budget
+from accountopening.cassette import cassette_track, close_cassettes
+from skills.tool_random import seeded_tool_random, get_run_seed
+from telemetry import tracer, configure_tracing, shutdown_tracing, set_attributes, hash_client_id
+from request_charges import charge_scope, query_shapes
+from metrics import track_run, observe_request, observe_run, render as render_metrics
+from opentelemetry.trace import SpanKind
 
 load_dotenv()
-app = FastAPI()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Provision the database/container once and keep the Cosmos client + credential for the app lifetime
+    global _job_workers
+    # Spans exported as configured by AO_TRACING (otlp, file), before any client is created
+    configure_tracing()
+    await get_async_crm_store()
+    await get_async_event_store()
+    # Compile the static part of the planner prompt up front (it is recompiled when business_logic.txt changes)
+    PLANNER_PROMPT.compile()
+    # Agent runs are executed by background workers, off the request path
+    _job_workers = JobWorkerPool(
+        get_job_queue(),
+        {"run_ao_agents": _run_agents_job, "run_ao_agents_batch": _run_agents_batch_job},
+        concurrency=int(os.getenv("AO_JOB_WORKERS", "4"))
+    )
+    _job_workers.start()
+    yield
+    await _job_workers.stop()
+    close_job_queue()
+    clear_event_stores()
+    await close_async_crm_stores()
+    await close_async_openai_clients()
+    close_crm_stores()
+    close_openai_clients()
+    close_cassettes()
+    shutdown_tracing()
+
+
+app = FastAPI(lifespan=lifespan)
+_job_workers = None
+
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    """
+    One server span per request, named after the endpoint route (streamed responses: until the stream starts).
+    """
+    with tracer.start_as_current_span(f"{request.method} {request.url.path}", kind=SpanKind.SERVER) as span:
+        response = await call_next(request)
+        route = request.scope.get("route")
+        if route is not None:
+            span.update_name(f"{request.method} {route.path}")
+            span.set_attribute("http.route", route.path)
+        span.set_attribute("http.request.method", request.method)
+        span.set_attribute("http.response.status_code", response.status_code)
+        return response
+
+
+@app.middleware("http")
+async def account_requests(request: Request, call_next):
+    """
+    Observes the request latency per endpoint route (ao_http_request_duration_seconds) and returns the
+    Cosmos DB request units, operations and time of the request in x-ao-request-* headers
+    (streamed responses: until the stream starts).
+    """
+    started = time.perf_counter()
+    with charge_scope() as charges:
+        response = await call_next(request)
+    route = request.scope.get("route")
+    # Route templates only (/jobs/{job_id}): unknown paths must not create series
+    observe_request(request.method, route.path if route is not None else "unmatched", response.status_code,
+                    time.perf_counter() - started)
+    response.headers.update(charges.headers())
+    return response
+
+
+async def crm_store() -> AsyncCRMStore:
+    """
+    FastAPI dependency returning the event-loop wide AsyncCRMStore.
+    """
+    return await get_async_crm_store()
+
+
+async def event_store() -> AsyncEventStore:
+    """
+    FastAPI dependency returning the event-loop wide AsyncEventStore (prospects history).
+    """
+    return await get_async_event_store()
+
 
 @app.post("/prospects")
-def get_all_prospects(request: dict = Body(...)):
+async def get_all_prospects(request: dict = Body(...), crm_db: AsyncCRMStore = Depends(crm_store)):
     """
-    Return all records from Cosmos DB whose clientID starts with 'PRO'.
+    Return one page of the prospects (clientID starting with 'PRO'), with the continuation token of the next page.
+    Optional: page_size (default 50, at most 200), continuation_token (returned with the previous page),
+    status (only the prospects at this status) and fields (default: clientID, fullName, dateOfBirth, status).
     The request body must include a user_id for demonstration/authorization purposes.
     """
      
@@ -32,29 +128,79 @@ def get_all_prospects(request: dict = Body(...)):
         raise HTTPException(status_code=400, detail="<user_id> is required!")
    
     try:
-        # Example of how to pull from environment variables:
-        cosmosdb_endpoint = os.getenv("COSMOSDB_ENDPOINT") or ""
-        crm_database_name = os.getenv("COSMOSDB_DATABASE_NAME") or ""
-        crm_container_name = os.getenv("COSMOSDB_CONTAINER_CLIENT_NAME") or ""
-        key=DefaultAzureCredential()
-        
-        crm_db = CRMStore(
-             url=cosmosdb_endpoint,
-             key=key,
-             database_name=crm_database_name,
-             container_name=crm_container_name
+        prospects, continuation_token = await crm_db.list_prospects(
+            status=request.get('status'),
+            page_size=max(1, min(int(request.get('page_size', 50)), 200)),
+            continuation_token=request.get('continuation_token'),
+            fields=tuple(request.get('fields') or PROSPECT_LIST_FIELDS)
         )
+        return json.dumps({"prospects": prospects, "continuation_token": continuation_token})
 
-        prospects = crm_db.load_all_prospects()
-        return json.dumps(prospects) if prospects else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logging.error(f"Error in get_all_prospects: {str(e)}")
+        return json.dumps({"error": f"get_all_prospects failed with error: {str(e)}"})
+
+
+@app.post("/prospect")
+async def get_prospect(request: dict = Body(...), crm_db: AsyncCRMStore = Depends(crm_store)):
+    """
+    Return the full profile of a prospect (point read).
+    The request body must include a user_id and a client_id.
+    """
+
+    logging.info('Moneta o1 agents - <POST get_prospect> triggered...')
+
+    user_id = request.get('user_id')
+    client_id = request.get('client_id')
+    if not user_id:
+        raise HTTPException(status_code=400, detail="<user_id> is required!")
+    if not client_id:
+        raise HTTPException(status_code=400, detail="<client_id> is required!")
+
+    try:
+        prospect = await crm_db.get_customer_profile_by_client_id(client_id)
+    except Exception as e:
+        logging.error(f"Error in get_prospect: {str(e)}")
+        return json.dumps({"error": f"get_prospect failed with error: {str(e)}"})
+    if prospect is None:
+        raise HTTPException(status_code=404, detail=f"Prospect {client_id} not found")
+    return json.dumps(prospect)
+
+
+@app.post("/search_prospects")
+async def search_prospects(request: dict = Body(...), crm_db: AsyncCRMStore = Depends(crm_store)):
+    """
+    Return the profiles whose name best matches a (partial, misspelled, unaccented) name, best first:
+    {"matches": [{"clientID", "fullName", "score"}]}, score 1.0 for the same name up to accents, case and word order.
+    The request body must include a user_id and a query. Optional: limit (default 10, at most 50).
+    """
+
+    logging.info('Moneta o1 agents - <POST search_prospects> triggered...')
+
+    user_id = request.get('user_id')
+    query = request.get('query')
+    if not user_id:
+        raise HTTPException(status_code=400, detail="<user_id> is required!")
+    if not query:
+        raise HTTPException(status_code=400, detail="<query> is required!")
 
+    try:
+        matches = await crm_db.search_customer_profiles_by_name(
+            query, limit=max(1, min(int(request.get('limit', 10)), 50))
+        )
+        return json.dumps({"matches": matches})
+
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        logging.error(f"Error in load_all_prospects: {str(e)}")
-        return json.dumps({"error": f"load_all_prospects failed with error: {str(e)}"})
+        logging.error(f"Error in search_prospects: {str(e)}")
+        return json.dumps({"error": f"search_prospects failed with error: {str(e)}"})
 
 
 @app.post("/update_prospect")
-def update_prospect(request: dict = Body(...)):
+async def update_prospect(request: dict = Body(...), crm_db: AsyncCRMStore = Depends(crm_store)):
     """
     Update prospect_data into the CRM_Store
     The request body must include a user_id for demonstration/authorization purposes.
@@ -69,33 +215,227 @@ def update_prospect(request: dict = Body(...)):
         raise HTTPException(status_code=400, detail="<user_id> is required!")
    
     try:
-        # Example of how to pull from environment variables:
-        cosmosdb_endpoint = os.getenv("COSMOSDB_ENDPOINT") or ""
-        crm_database_name = os.getenv("COSMOSDB_DATABASE_NAME") or ""
-        crm_container_name = os.getenv("COSMOSDB_CONTAINER_CLIENT_NAME") or ""
-        key=DefaultAzureCredential()
-        
-        crm_db = CRMStore(
-             url=cosmosdb_endpoint,
-             key=key,
-             database_name=crm_database_name,
-             container_name=crm_container_name
-        )
-
-        prospect_data = json.loads(request.get('prospect_data'))
-        prospects = crm_db.update_customer_profile(prospect_data["clientID"], prospect_data)
+        prospect_data = request.get('prospect_data')
+        if isinstance(prospect_data, str):
+            prospect_data = json.loads(prospect_data)
+        prospects = await crm_db.update_customer_profile(prospect_data["clientID"], prospect_data)
         return json.dumps(prospects) if prospects else None
 
     except Exception as e:
-        logging.error(f"Error in load_all_prospects: {str(e)}")
-        return json.dumps({"error": f"load_all_prospects failed with error: {str(e)}"})
+        logging.error(f"Error in update_prospect: {str(e)}")
+        return json.dumps({"error": f"update_prospect failed with error: {str(e)}"})
+
+
+@app.post("/patch_prospect")
+async def patch_prospect(request: dict = Body(...), crm_db: AsyncCRMStore = Depends(crm_store)):
+    """
+    Apply a delta to a prospect in the CRM_Store: either a JSON Patch (RFC 6902) list in `patch`
+    or a JSON merge patch (RFC 7386) object in `merge_patch`.
+    Patches that change nothing are not written.
+    The request body must include a user_id for demonstration/authorization purposes.
+    """
+
+    logging.info('Moneta o1 agents - <POST patch_prospect> triggered...')
+
+    # Extract parameters from the request body
+    user_id = request.get('user_id')
+    client_id = request.get('client_id')
+    patch = request.get('patch')
+    merge_patch = request.get('merge_patch')
+    # Validate required parameters
+    if not user_id:
+        raise HTTPException(status_code=400, detail="<user_id> is required!")
+    if not client_id:
+        raise HTTPException(status_code=400, detail="<client_id> is required!")
+    if (patch is None) == (merge_patch is None):
+        raise HTTPException(status_code=400, detail="Exactly one of <patch> or <merge_patch> is required!")
+
+    try:
+        check_writable(patch, merge_patch)
+    except ProtectedPropertyError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except JsonPatchError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    try:
+        existing = await crm_db.get_customer_profile_by_client_id(client_id)
+        if not existing:
+            raise HTTPException(status_code=404, detail=f"Prospect {client_id} not found")
+        updated = apply_json_patch(existing, patch) if patch is not None else apply_merge_patch(existing, merge_patch)
+        operations = diff(existing, updated)
+        if not operations:
+            return json.dumps(existing)
+        prospect = await crm_db.patch_customer_profile(client_id, operations, etag=existing.get("_etag"), current=existing)
+        return json.dumps(prospect) if prospect else None
+
+    except HTTPException:
+        raise
+    except JsonPatchError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except PreconditionFailedError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        logging.error(f"Error in patch_prospect: {str(e)}")
+        return json.dumps({"error": f"patch_prospect failed with error: {str(e)}"})
 
 
+@app.post("/prospect_history")
+async def prospect_history(request: dict = Body(...), events_db: AsyncEventStore = Depends(event_store)):
+    """
+    Return one page of the onboarding / KYC review history of a prospect, most recent first.
+    The request body must include a user_id and a client_id; optional: kind ("onboarding", "kyc_review"),
+    page_size (default 20, at most 100) and the continuation_token returned with the previous page.
+    """
+
+    logging.info('Moneta o1 agents - <POST prospect_history> triggered...')
+
+    # Extract parameters from the request body
+    user_id = request.get('user_id')
+    client_id = request.get('client_id')
+    # Validate required parameters
+    if not user_id:
+        raise HTTPException(status_code=400, detail="<user_id> is required!")
+    if not client_id:
+        raise HTTPException(status_code=400, detail="<client_id> is required!")
+
+    try:
+        events, continuation_token = await events_db.list_events(
+            client_id,
+            kind=request.get('kind'),
+            page_size=max(1, min(int(request.get('page_size', 20)), 100)),
+            continuation_token=request.get('continuation_token')
+        )
+        return json.dumps({"events": events, "continuation_token": continuation_token})
+
+    except Exception as e:
+        logging.error(f"Error in prospect_history: {str(e)}")
+        return json.dumps({"error": f"prospect_history failed with error: {str(e)}"})
+
+
+async def _run_agents(crm_db: AsyncCRMStore, prospect_data: dict, on_event=None, seed=None):
+    """
+    Runs the account opening agents on a prospect.
+    `on_event`, if given, receives the run events (planner tokens, tool calls, status changes).
+    `seed` (default AO_TOOL_SEED) makes the tools' random outcomes reproducible (name screening, risk score).
+
+    Returns:
+    - (dict, dict): The prospect as committed and the run outcome: {"run_status": "completed"}, or
+      {"run_status": "partial", "stop_reason": {...}} when the run went over its budget (the planner
+      counts towards the deadline; the steps executed until then are committed), with the Cosmos DB request_charges of the run.
+    """
+    outcome = {"run_status": "completed"}
+    # Turns, tokens and deadline of the run (the deadline includes the planner)
+    budget = get_run_budget()
+    with tracer.start_as_current_span("ao.run") as run_span, charge_scope() as charges, \
+            track_run(prospect_data.get('status')):
+        set_attributes(run_span, {
+            "ao.client_id_hash": hash_client_id(prospect_data.get('clientID')),
+            "ao.engine": os.getenv("AO_ENGINE", "llm"),
+            "ao.status.initial": prospect_data.get('status'),
+        })
+        # One unit of work per run: tools stage their writes, committed once with an ETag check
+        async with async_unit_of_work(crm_db, on_event=on_event) as uow:
+            # The engines start from the stored profile, not from the (possibly older) copy of the caller:
+            # a copy, the tools stage their writes through the unit of work
+            prospect = await uow.aget(prospect_data['clientID'])
+            if prospect is None:
+                raise ValueError(f"Prospect {prospect_data['clientID']} not found")
+            prospect = copy.deepcopy(prospect)
+            # Tool randomness of the run (name screening, risk score), reproducible when seeded;
+            # model calls recorded/replayed under the prospect's clientID (AO_LLM_CASSETTE_MODE)
+            with seeded_tool_random(get_run_seed(seed)), cassette_track(prospect_data.get('clientID')):
+                # Deterministic engine first (AO_ENGINE=auto|state_machine), LLM planner/executor otherwise:
+                # only auto falls back to the LLM, state_machine runs without any model call and fails the
+                # run on a scenario the compiled ruleset does not cover (e.g. an unknown status)
+                engine = os.getenv("AO_ENGINE", "llm")
+                sm_report = None
+                if engine in ("auto", "state_machine"):
+                    try:
+                        sm_report = await get_state_machine().arun(prospect, on_event=on_event)
+                    except UnsupportedScenario as e:
+                        if engine == "state_machine":
+                            raise
+                        logging.info(f"State machine fallback to LLM planner: {str(e)}")
+
+                if sm_report is None:
+                    o1_client = get_async_openai_client("O1_OPENAI_API_KEY", "O1_OPENAI_ENDPOINT", "O1_OPENAI_DEPLOYMENT_NAME")
+                    client = get_async_openai_client("AZURE_OPENAI_API_KEY", "AZURE_OPENAI_ENDPOINT", "AZURE_OPENAI_DEPLOYMENT_NAME")
+                    try:
+                        #o1 planner agent part
+                        o1_response = await acall_o1(o1_client, prospect, on_event=on_event, budget=budget)
+
+                        #4o executor agent part
+                        await acall_gpt4o(client, o1_response, on_event=on_event, budget=budget)
+                    except BudgetExceeded as e:
+                        outcome = {"run_status": "partial", "stop_reason": e.reason}
+                        if on_event is not None:
+                            on_event({"type": "budget_exceeded", **e.reason})
+
+        # prospect after agentic workflow run (the committed working copy, read if the run wrote nothing)...
+        upd_prospect = await uow.aget(prospect_data['clientID'])
+        outcome["request_charges"] = charges.to_dict()
+        set_attributes(run_span, {
+            "ao.status.final": (upd_prospect or {}).get('status'),
+            "ao.run_status": outcome["run_status"],
+            "ao.stop_reason": outcome.get("stop_reason", {}).get("budget"),
+            "ao.request_charge": outcome["request_charges"]["request_units"],
+        })
+        observe_run((upd_prospect or {}).get('status'), outcome["run_status"])
+        return upd_prospect, outcome
+
+
+async def _run_agents_job(payload: dict, progress):
+    # The prospect is read when the job starts, not when it was queued (jobs queued by older versions carry prospect_data)
+    client_id = payload.get("client_id") or payload["prospect_data"]["clientID"]
+    crm_db = await get_async_crm_store()
+    prospect = await crm_db.get_customer_profile_by_client_id(client_id)
+    if prospect is None:
+        raise ValueError(f"Prospect {client_id} not found")
+    upd_prospect, outcome = await _run_agents(crm_db, prospect, seed=payload.get("seed"))
+    return {**outcome, "prospect": upd_prospect}
+
+
+async def _run_agents_batch_job(payload: dict, progress):
+    crm_db = await get_async_crm_store()
+    client_ids = payload.get("client_ids")
+    if client_ids is None:
+        batch_filter = payload.get("filter") or {}
+        client_ids = await crm_db.find_client_ids(batch_filter.get("prefix", "PRO"), batch_filter.get("status"))
+
+    async def run_item(client_id):
+        prospect = await crm_db.get_customer_profile_by_client_id(client_id)
+        if prospect is None:
+            raise ValueError(f"Prospect {client_id} not found")
+        initial_status = prospect.get("status")
+        upd_prospect, outcome = await _run_agents(crm_db, prospect, seed=payload.get("seed"))
+        return {"initial_status": initial_status, "final_status": (upd_prospect or {}).get("status"), **outcome}
+
+    return await run_batch(client_ids, run_item, payload["concurrency"], progress=progress)
+
+
+def _requested_prospect(request):
+    """
+    The prospect_data of an agent run request (an object or its JSON), which must have a clientID.
+    Raises a 400 HTTPException otherwise.
+    """
+    prospect_data = request.get('prospect_data')
+    if isinstance(prospect_data, str):
+        try:
+            prospect_data = json.loads(prospect_data)
+        except ValueError:
+            prospect_data = None
+    if not isinstance(prospect_data, dict) or not prospect_data.get('clientID'):
+        raise HTTPException(status_code=400, detail="<prospect_data> with a clientID is required!")
+    return prospect_data
+
 
 @app.post("/run_ao_agents")
-def run_ao_agents(request: dict = Body(...)):
+async def run_ao_agents(request: dict = Body(...)):
     """
-    Run the agentic account opening process to re-evaulate the prospect status 
+    Queue the agentic account opening process to re-evaulate the prospect status.
+    Returns the job_id right away: poll GET /jobs/{job_id} for the status and the result: the updated
+    prospect and the run_status ("partial", with the stop_reason, if the run went over its budget).
+    An optional `seed` makes the tools' random outcomes reproducible (default AO_TOOL_SEED).
     The request body must include a user_id for demonstration/authorization purposes.
     """
      
@@ -106,44 +446,161 @@ def run_ao_agents(request: dict = Body(...)):
     # Validate required parameters
     if not user_id:
         raise HTTPException(status_code=400, detail="<user_id> is required!")
+    prospect_data = _requested_prospect(request)
    
     try:
-        prospect_data = json.loads(request.get('prospect_data'))
-
-        o1_client = get_openai_client("O1_OPENAI_API_KEY", "O1_OPENAI_ENDPOINT", "O1_OPENAI_DEPLOYMENT_NAME")
-        #o1 planner agent part
-        o1_response = call_o1(o1_client, prospect_data)
-
-        #4o executor agent part
-        client = get_openai_client("AZURE_OPENAI_API_KEY", "AZURE_OPENAI_ENDPOINT", "AZURE_OPENAI_DEPLOYMENT_NAME")
-        ex_response = call_gpt4o(client, o1_response)
-
-        # Filter assistant messages that have actual content
-        assistants_4o_contents = [
-            msg['content'] for msg in ex_response 
-            if msg.get('role') == 'assistant' and msg.get('content') is not None
-        ]
-
-        #TODO think about filtering or what to do to return to the frontend all this chain of messages...
-        
-         # reload prospect after agentic workflow run...
-        cosmosdb_endpoint = os.getenv("COSMOSDB_ENDPOINT") or ""
-        crm_database_name = os.getenv("COSMOSDB_DATABASE_NAME") or ""
-        crm_container_name = os.getenv("COSMOSDB_CONTAINER_CLIENT_NAME") or ""
-        key=DefaultAzureCredential()
-        
-        crm_db = CRMStore(
-             url=cosmosdb_endpoint,
-             key=key,
-             database_name=crm_database_name,
-             container_name=crm_container_name
+        # Only the clientID is queued: the job runs on the profile as stored when it starts
+        job_id = await asyncio.to_thread(
+            get_job_queue().enqueue, "run_ao_agents",
+            {"user_id": user_id, "client_id": prospect_data['clientID'], "seed": request.get('seed')}
         )
-
-        upd_prospect = crm_db.get_customer_profile_by_client_id(prospect_data['clientID'])
-        return json.dumps(upd_prospect) if upd_prospect else None
+        if _job_workers is not None:
+            _job_workers.notify()
+        return json.dumps({"job_id": job_id, "status": "queued"})
 
     except Exception as e:
         logging.error(f"Error in run_ao_agents: {str(e)}")
         return json.dumps({"error": f"run_ao_agents failed with error: {str(e)}"})
-    
 
+
+@app.post("/run_ao_agents/batch")
+async def run_ao_agents_batch(request: dict = Body(...)):
+    """
+    Queue the agentic account opening process for many prospects: either a list of `client_ids`
+    or a `filter` ({"prefix": "PRO", "status": "..."}, e.g. every prospect stuck at a status).
+    At most `concurrency` prospects (default AO_BATCH_CONCURRENCY, capped by AO_BATCH_MAX_CONCURRENCY)
+    are run at the same time. Returns the job_id: GET /jobs/{job_id} returns the per-prospect results
+    done so far and, once the job succeeded, the aggregate report. An optional `seed` seeds the tools of every run.
+    The request body must include a user_id for demonstration/authorization purposes.
+    """
+
+    logging.info('Moneta o1 agents - <POST run_ao_agents/batch> triggered...')
+
+    # Extract parameters from the request body
+    user_id = request.get('user_id')
+    client_ids = request.get('client_ids')
+    batch_filter = request.get('filter')
+    # Validate required parameters
+    if not user_id:
+        raise HTTPException(status_code=400, detail="<user_id> is required!")
+    if (client_ids is None) == (batch_filter is None):
+        raise HTTPException(status_code=400, detail="Exactly one of <client_ids> or <filter> is required!")
+    if client_ids is not None and not isinstance(client_ids, list):
+        raise HTTPException(status_code=400, detail="<client_ids> must be a list of clientIDs!")
+
+    concurrency = int(request.get('concurrency') or os.getenv("AO_BATCH_CONCURRENCY", "5"))
+    concurrency = max(1, min(concurrency, int(os.getenv("AO_BATCH_MAX_CONCURRENCY", "20"))))
+    try:
+        job_id = await asyncio.to_thread(
+            get_job_queue().enqueue, "run_ao_agents_batch",
+            {"user_id": user_id, "client_ids": client_ids, "filter": batch_filter, "concurrency": concurrency,
+             "seed": request.get('seed')}
+        )
+        if _job_workers is not None:
+            _job_workers.notify()
+        return json.dumps({"job_id": job_id, "status": "queued", "concurrency": concurrency})
+
+    except Exception as e:
+        logging.error(f"Error in run_ao_agents_batch: {str(e)}")
+        return json.dumps({"error": f"run_ao_agents_batch failed with error: {str(e)}"})
+
+
+@app.get("/metrics")
+async def metrics():
+    """
+    Prometheus metrics: request latency per endpoint, agent runs in flight and by final status, planner and
+    executor latency, tokens per model, tool calls and latency, Cosmos DB request units and throttling,
+    executor budget stops.
+    """
+    content, content_type = render_metrics()
+    return Response(content=content, media_type=content_type)
+
+
+@app.post("/request_charges")
+async def request_charges(request: dict = Body(...)):
+    """
+    Return the Cosmos DB query shapes (container, operation, parameterized statement, cross-partition or not)
+    that cost the most request units since startup, with their count and mean/max charge.
+    The request body must include a user_id; optional: limit (default 20) and reset (clear the tally).
+    """
+    user_id = request.get('user_id')
+    if not user_id:
+        raise HTTPException(status_code=400, detail="<user_id> is required!")
+
+    shapes = query_shapes.top(int(request.get('limit', 20)))
+    if request.get('reset'):
+        query_shapes.reset()
+    return json.dumps({"query_shapes": shapes})
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """
+    Return the status of a queued agent run and, once succeeded, its result (the updated prospect).
+    """
+    job = await asyncio.to_thread(get_job_queue().get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return json.dumps(job_status(job))
+
+
+def _sse(event: dict) -> str:
+    return f"event: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n"
+
+
+# Runs whose stream was closed by the client keep going until committed
+_background_runs = set()
+
+
+@app.post("/run_ao_agents/stream")
+async def run_ao_agents_stream(request: dict = Body(...), crm_db: AsyncCRMStore = Depends(crm_store)):
+    """
+    Same as /run_ao_agents, streamed as Server-Sent Events while the run progresses:
+    plan_token, tool_call, tool_result, status and commit events, then a final "result"
+    (the updated prospect and the run_status, "partial" if the run went over its budget) or "error" event. Comment lines are sent every SSE_KEEPALIVE_SECONDS
+    so that proxies do not time out long runs.
+    The request body must include a user_id for demonstration/authorization purposes.
+    """
+
+    logging.info('Moneta o1 agents - <POST run_ao_agents/stream> triggered...')
+
+    # Extract parameters from the request body
+    user_id = request.get('user_id')
+    # Validate required parameters
+    if not user_id:
+        raise HTTPException(status_code=400, detail="<user_id> is required!")
+
+    # Validated before the stream starts: a bad request is a 400, not an SSE "error" event
+    prospect_data = _requested_prospect(request)
+    keepalive = float(os.getenv("SSE_KEEPALIVE_SECONDS", "15"))
+    queue = asyncio.Queue()
+
+    async def run():
+        try:
+            upd_prospect, outcome = await _run_agents(crm_db, prospect_data, on_event=queue.put_nowait,
+                                                      seed=request.get('seed'))
+            queue.put_nowait({"type": "result", "prospect": upd_prospect, **outcome})
+        except Exception as e:
+            logging.error(f"Error in run_ao_agents/stream: {str(e)}")
+            queue.put_nowait({"type": "error", "error": f"run_ao_agents failed with error: {str(e)}"})
+
+    task = asyncio.create_task(run())
+    _background_runs.add(task)
+    task.add_done_callback(_background_runs.discard)
+
+    async def events():
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout=keepalive)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            yield _sse(event)
+            if event["type"] in ("result", "error"):
+                return
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -0,0 +1,112 @@
+"""
+How many in-flight /run_ao_agents runs one worker can hold: async path vs sync path.
+
+The sync handlers run in Starlette's threadpool (40 threads by default), so at most 40 runs
+make progress at a time. The async path (AsyncAzureOpenAI, azure.cosmos.aio, async tools)
+holds every run on the event loop. Both paths are driven end to end (planner, executor loop,
+tools, final reload) against stand-in LLM and Cosmos backends with simulated latency.
+
+Usage (from src/backend):
+    python benchmarks/bench_async_concurrency.py --levels 10 50 200 --planner-ms 500 --executor-ms 100 --cosmos-ms 10
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import crm_store  # noqa: E402
+import crm_store_async  # noqa: E402
+import event_store  # noqa: E402
+from accountopening.planner_executor import call_o1, call_gpt4o, acall_o1, acall_gpt4o  # noqa: E402
+from stand_ins import (StandInChatClient, StandInAsyncChatClient, StandInCRMStore,  # noqa: E402
+                       StandInAsyncCRMStore, StandInEventStore, StandInAsyncEventStore,
+                       make_prospects)
+
+THREADPOOL_SIZE = 40  # anyio's default thread limiter used by Starlette for sync endpoints
+
+
+class InFlight:
+    def __init__(self):
+        self.current = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        with self._lock:
+            self.current += 1
+            self.peak = max(self.peak, self.current)
+
+    def __exit__(self, *exc):
+        with self._lock:
+            self.current -= 1
+
+
+def sync_run(prospect, args, store, in_flight):
+    with in_flight:
+        client = StandInChatClient(prospect, args.planner_ms / 1000, args.executor_ms / 1000)
+        plan = call_o1(client, prospect)
+        call_gpt4o(client, plan)
+        store.get_customer_profile_by_client_id(prospect["clientID"])
+
+
+async def async_run(prospect, args, store, in_flight):
+    with in_flight:
+        client = StandInAsyncChatClient(prospect, args.planner_ms / 1000, args.executor_ms / 1000)
+        plan = await acall_o1(client, prospect)
+        await acall_gpt4o(client, plan)
+        await store.get_customer_profile_by_client_id(prospect["clientID"])
+
+
+def bench_sync(level, args):
+    store = StandInCRMStore(latency=args.cosmos_ms / 1000)
+    prospects = make_prospects(level)
+    store.seed(prospects)
+    crm_store.set_crm_store(store)
+    event_store.set_event_store(StandInEventStore(latency=args.cosmos_ms / 1000))
+    in_flight = InFlight()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=THREADPOOL_SIZE) as pool:
+        list(pool.map(lambda p: sync_run(p, args, store, in_flight), prospects))
+    return time.perf_counter() - start, in_flight.peak
+
+
+def bench_async(level, args):
+    async def main():
+        store = StandInAsyncCRMStore(latency=args.cosmos_ms / 1000)
+        prospects = make_prospects(level)
+        store.seed(prospects)
+        crm_store_async.set_async_crm_store(store)
+        event_store.set_async_event_store(StandInAsyncEventStore(latency=args.cosmos_ms / 1000))
+        in_flight = InFlight()
+        start = time.perf_counter()
+        await asyncio.gather(*(async_run(p, args, store, in_flight) for p in prospects))
+        return time.perf_counter() - start, in_flight.peak
+
+    return asyncio.run(main())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--levels", type=int, nargs="+", default=[10, 50, 200])
+    parser.add_argument("--planner-ms", type=float, default=500.0)
+    parser.add_argument("--executor-ms", type=float, default=100.0)
+    parser.add_argument("--cosmos-ms", type=float, default=10.0)
+    args = parser.parse_args()
+
+    print(f"{'path':<6} {'concurrent':>10} {'peak in-flight':>15} {'wall s':>8} {'runs/s':>8}")
+    for level in args.levels:
+        for name, bench in (("sync", bench_sync), ("async", bench_async)):
+            with contextlib.redirect_stdout(io.StringIO()):
+                elapsed, peak = bench(level, args)
+            print(f"{name:<6} {level:>10} {peak:>15} {elapsed:>8.2f} {level / elapsed:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Batch re-run throughput: prospects per minute processed by jobs.run_batch at a given concurrency cap.
+
+Each item runs what /run_ao_agents/batch runs per prospect (point read, o1 plan, 4o executor loop
+with the async tools, one unit of work commit) against stand-in LLM and Cosmos backends with
+simulated latency. Throughput should grow linearly with the cap until the backends saturate.
+With --store sqlite the profiles and events live in the embedded local store (CRM_BACKEND=sqlite) instead
+of the in-memory stand-ins.
+
+Usage (from src/backend):
+    python benchmarks/bench_batch_throughput.py --prospects 200 --concurrency 1 5 20 50 --planner-ms 500 --executor-ms 100 --cosmos-ms 10
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import crm_store_async  # noqa: E402
+import event_store  # noqa: E402
+from jobs import run_batch  # noqa: E402
+from unit_of_work import async_unit_of_work  # noqa: E402
+from local_store import LocalDatabase, AsyncSQLiteCRMStore, AsyncSQLiteEventStore  # noqa: E402
+from accountopening.planner_executor import acall_o1, acall_gpt4o  # noqa: E402
+from stand_ins import StandInAsyncChatClient, StandInAsyncCRMStore, StandInAsyncEventStore, make_prospects  # noqa: E402
+
+
+def bench(concurrency, args):
+    async def main():
+        if args.store == "sqlite":
+            database = LocalDatabase(":memory:")
+            store = AsyncSQLiteCRMStore(database, "prospects")
+            events = AsyncSQLiteEventStore(database, "prospectevents")
+            for prospect in make_prospects(args.prospects):
+                await store.create_customer_profile(prospect)
+        else:
+            store = StandInAsyncCRMStore(latency=args.cosmos_ms / 1000)
+            events = StandInAsyncEventStore(latency=args.cosmos_ms / 1000)
+            store.seed(make_prospects(args.prospects))
+        crm_store_async.set_async_crm_store(store)
+        event_store.set_async_event_store(events)
+        client_ids = await store.find_client_ids("PROBENCH", status="new")
+
+        async def run_item(client_id):
+            prospect = await store.get_customer_profile_by_client_id(client_id)
+            client = StandInAsyncChatClient(prospect, args.planner_ms / 1000, args.executor_ms / 1000)
+            async with async_unit_of_work(store, events=events) as uow:
+                plan = await acall_o1(client, prospect)
+                await acall_gpt4o(client, plan)
+            return {"final_status": (await uow.aget(client_id)).get("status")}
+
+        return await run_batch(client_ids, run_item, concurrency)
+
+    return asyncio.run(main())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--prospects", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 5, 20, 50])
+    parser.add_argument("--planner-ms", type=float, default=500.0)
+    parser.add_argument("--executor-ms", type=float, default=100.0)
+    parser.add_argument("--cosmos-ms", type=float, default=10.0)
+    parser.add_argument("--store", choices=["stand-in", "sqlite"], default="stand-in")
+    args = parser.parse_args()
+
+    print(f"{'concurrency':>11} {'prospects':>10} {'failed':>7} {'wall s':>8} {'prospects/min':>14}")
+    for concurrency in args.concurrency:
+        with contextlib.redirect_stdout(io.StringIO()):
+            report = bench(concurrency, args)
+        print(f"{concurrency:>11} {report['total']:>10} {report['failed']:>7} "
+              f"{report['duration_s']:>8.2f} {report['items_per_minute']:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Record/replay of the planner and executor model calls: replay rate and reproducibility.
+
+Records the model calls of seeded runs (app._run_agents on the stand-in LLM, which takes
+--planner-ms/--executor-ms per call) into a cassette, then replays the same runs from the cassette
+at each --speeds value (1 = recorded latency, 0 = no delay). With the same seed, every replayed run
+must end with the same profile outcome (status, name screening, risk score) as the recorded one.
+
+Usage (from src/backend):
+    python benchmarks/bench_cassette_replay.py --prospects 100 --concurrency 20 --speeds 1 10 0 --planner-ms 500 --executor-ms 100
+"""
+import argparse
+import asyncio
+import contextlib
+import contextvars
+import io
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+import crm_store_async  # noqa: E402
+import event_store  # noqa: E402
+from jobs import run_batch  # noqa: E402
+from accountopening.cassette import Cassette, AsyncRecordingClient, AsyncReplayClient  # noqa: E402
+from stand_ins import StandInAsyncChatClient, StandInAsyncCRMStore, StandInAsyncEventStore, make_prospects  # noqa: E402
+
+# Model client of the run in progress (app._run_agents gets its clients from the pool)
+_run_client = contextvars.ContextVar("run_client")
+OUTCOME_FIELDS = ("status", "name_screening_result", "risk_level", "risk_score")
+
+
+def bench(make_client, args):
+    async def main():
+        store = StandInAsyncCRMStore(latency=args.cosmos_ms / 1000)
+        store.seed(make_prospects(args.prospects))
+        crm_store_async.set_async_crm_store(store)
+        event_store.set_async_event_store(StandInAsyncEventStore(latency=args.cosmos_ms / 1000))
+
+        async def run_item(client_id):
+            prospect = await store.get_customer_profile_by_client_id(client_id)
+            _run_client.set(make_client(prospect))
+            upd_prospect, outcome = await app._run_agents(store, prospect, seed=args.seed)
+            return {"outcome_fields": {field: upd_prospect.get(field) for field in OUTCOME_FIELDS}, **outcome}
+
+        return await run_batch(sorted(store.items), run_item, args.concurrency)
+
+    return asyncio.run(main())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--prospects", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--speeds", type=float, nargs="+", default=[1, 10, 0])
+    parser.add_argument("--planner-ms", type=float, default=500.0)
+    parser.add_argument("--executor-ms", type=float, default=100.0)
+    parser.add_argument("--cosmos-ms", type=float, default=10.0)
+    parser.add_argument("--seed", default="bench")
+    args = parser.parse_args()
+
+    app.get_async_openai_client = lambda *a: _run_client.get()
+    path = os.path.join(tempfile.mkdtemp(), "cassette.jsonl.gz")
+    recorder = Cassette(path)
+
+    def record(prospect):
+        stand_in = StandInAsyncChatClient(prospect, args.planner_ms / 1000, args.executor_ms / 1000)
+        return AsyncRecordingClient(recorder, stand_in)
+
+    print(f"{'mode':<14} {'runs':>5} {'failed':>7} {'wall s':>8} {'runs/min':>10} {'same outcome':>13}")
+    with contextlib.redirect_stdout(io.StringIO()):
+        recorded = bench(record, args)
+    recorder.close()
+    expected = [item.get("outcome_fields") for item in recorded["items"]]
+    print(f"{'record':<14} {recorded['total']:>5} {recorded['failed']:>7} {recorded['duration_s']:>8.2f} "
+          f"{recorded['items_per_minute']:>10.1f} {'-':>13}")
+
+    for speed in args.speeds:
+        player = Cassette(path, speed=speed)
+        with contextlib.redirect_stdout(io.StringIO()):
+            replayed = bench(lambda prospect: AsyncReplayClient(player), args)
+        same = sum(1 for item, outcome in zip(replayed["items"], expected)
+                   if outcome is not None and item.get("outcome_fields") == outcome)
+        print(f"{f'replay x{speed:g}':<14} {replayed['total']:>5} {replayed['failed']:>7} {replayed['duration_s']:>8.2f} "
+              f"{replayed['items_per_minute']:>10.1f} {f'{same}/{len(expected)}':>13}")
+    print(f"\nCassette: {path} ({os.path.getsize(path) / 1024:.1f} KiB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""
+Per-run Cosmos DB overhead: per-call CRMStore construction vs the pooled store registry.
+
+Cosmos and Entra ID are simulated with configurable latencies so the benchmark measures the
+cost of the access pattern (token acquisition, connection setup, control-plane calls) and not
+network noise. One "run" replays the store accesses of an account opening agent run:
+7 workflow tools each persisting the prospect (lookup + replace), the first line of defence
+reload and the final reload done by /run_ao_agents.
+
+Usage (from src/backend):
+    python benchmarks/bench_crm_store.py --runs 20 --token-ms 150 --connect-ms 40 --control-ms 25 --data-ms 8
+"""
+import argparse
+import os
+import sys
+import time
+from collections import Counter
+
+from azure.core.credentials import AccessToken
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import crm_store  # noqa: E402
+
+COUNTERS = Counter()
+LATENCY = {"token": 0.0, "connect": 0.0, "control": 0.0, "data": 0.0}
+
+# (operation, ...) issued against a store acquired right before it, in the order of one agent run
+RUN_PATTERN = (
+    ["query", "replace"] * 7      # collect_kyc_info ... perform_compliance_risk_assessment, assign_first_line_of_defence
+    + ["query"]                   # assign_first_line_of_defence reload
+    + ["query"]                   # /run_ao_agents final reload
+)
+
+
+def _sleep(kind):
+    COUNTERS[kind] += 1
+    time.sleep(LATENCY[kind])
+
+
+class SimulatedCredential:
+    def get_token(self, *scopes, **kwargs):
+        _sleep("token")
+        return AccessToken("token", int(time.time()) + 3600)
+
+    def close(self):
+        pass
+
+
+class _SimulatedContainer:
+    def __init__(self, client):
+        self._client = client
+
+    def read(self, **kwargs):
+        self._client._request("control")
+        return {"id": "c", "partitionKey": {"paths": ["/clientID"], "kind": "Hash"}}
+
+    def read_item(self, item, partition_key, **kwargs):
+        self._client._request("data")
+        return {"id": item, "clientID": partition_key, "status": "new"}
+
+    def query_items(self, query, parameters=None, enable_cross_partition_query=None, **kwargs):
+        self._client._request("data")
+        return [{"id": "PRO1", "clientID": "PRO1", "status": "new"}]
+
+    def replace_item(self, item, body, **kwargs):
+        self._client._request("data")
+        return body
+
+
+class _SimulatedDatabase:
+    def __init__(self, client):
+        self._client = client
+
+    def create_container_if_not_exists(self, id, partition_key=None, offer_throughput=None, **kwargs):
+        self._client._request("control")
+        return _SimulatedContainer(self._client)
+
+    def get_container_client(self, container):
+        return _SimulatedContainer(self._client)
+
+
+class SimulatedCosmosClient:
+    def __init__(self, url, credential=None, **kwargs):
+        self._credential = credential
+        self._connected = False
+        self._token = None
+
+    def _request(self, kind):
+        if self._token is None or self._token.expires_on <= time.time():
+            self._token = self._credential.get_token("https://cosmos.azure.com/.default")
+        if not self._connected:
+            _sleep("connect")
+            self._connected = True
+        _sleep(kind)
+
+    def create_database_if_not_exists(self, id, **kwargs):
+        self._request("control")
+        return _SimulatedDatabase(self)
+
+    def get_database_client(self, database):
+        return _SimulatedDatabase(self)
+
+    def close(self):
+        pass
+
+
+def run_per_call_construction():
+    for op in RUN_PATTERN:
+        store = crm_store.CRMStore(url="https://sim", key=SimulatedCredential(), database_name="db", container_name="c")
+        _issue(store, op)
+
+
+def run_registry():
+    for op in RUN_PATTERN:
+        _issue(crm_store.get_crm_store(), op)
+
+
+def _issue(store, op):
+    if op == "query":
+        store.get_customer_profile_by_client_id("PRO1")
+    else:
+        store.container.replace_item(item="PRO1", body={"id": "PRO1", "clientID": "PRO1"})
+
+
+def measure(name, fn, runs):
+    COUNTERS.clear()
+    start = time.perf_counter()
+    for _ in range(runs):
+        fn()
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    print(
+        f"{name:<26} {elapsed_ms / runs:9.1f} ms/run   "
+        f"tokens/run={COUNTERS['token'] / runs:5.2f}  connects/run={COUNTERS['connect'] / runs:5.2f}  "
+        f"control/run={COUNTERS['control'] / runs:5.2f}  data/run={COUNTERS['data'] / runs:5.2f}"
+    )
+    return elapsed_ms / runs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--token-ms", type=float, default=150.0)
+    parser.add_argument("--connect-ms", type=float, default=40.0)
+    parser.add_argument("--control-ms", type=float, default=25.0)
+    parser.add_argument("--data-ms", type=float, default=8.0)
+    args = parser.parse_args()
+
+    LATENCY.update(token=args.token_ms / 1000, connect=args.connect_ms / 1000,
+                   control=args.control_ms / 1000, data=args.data_ms / 1000)
+
+    crm_store.CosmosClient = SimulatedCosmosClient
+    crm_store.DefaultAzureCredential = SimulatedCredential
+
+    print(f"{len(RUN_PATTERN)} store accesses per run, {args.runs} runs\n")
+    before = measure("per-call construction", run_per_call_construction, args.runs)
+    crm_store.close_crm_stores()
+    crm_store.get_crm_store()  # startup provisioning, paid once per process
+    after = measure("pooled registry", run_registry, args.runs)
+    print(f"\nCosmos overhead per run reduced by {before - after:.1f} ms ({(1 - after / before) * 100:.0f}%)")
+
+
+if __name__ == "__main__":
+    main()
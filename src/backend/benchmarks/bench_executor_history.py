@@ -0,0 +1,90 @@
+"""
+Executor context growth: prompt tokens sent per executor iteration, and per run, with the full
+conversation resent at every iteration vs the compact history policy.
+
+Runs the gpt-4o executor loop for one prospect (async tools, stand-in LLM and Cosmos backends)
+whose profile already holds `--history` onboarding entries, once per policy.
+
+Usage (from src/backend):
+    python benchmarks/bench_executor_history.py --history 5 --keep-turns 2 --window 3
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import crm_store_async  # noqa: E402
+import event_store  # noqa: E402
+from unit_of_work import async_unit_of_work  # noqa: E402
+from accountopening.history import FullHistory, CompactHistory  # noqa: E402
+from accountopening.planner_executor import acall_o1, acall_gpt4o  # noqa: E402
+from stand_ins import StandInAsyncChatClient, StandInAsyncCRMStore, StandInAsyncEventStore, make_prospects  # noqa: E402
+
+
+class RecordingClient(StandInAsyncChatClient):
+    """
+    Records the prompt tokens of every executor request.
+    """
+    def __init__(self, prospect):
+        super().__init__(prospect, 0, 0)
+        self.prompt_tokens = []
+
+    async def _create(self, **kwargs):
+        response = await super()._create(**kwargs)
+        if kwargs.get("tools"):
+            self.prompt_tokens.append(response.usage.prompt_tokens)
+        return response
+
+
+def run(policy, history):
+    async def main():
+        store = StandInAsyncCRMStore(latency=0)
+        prospect = make_prospects(1)[0]
+        prospect["onboarding"] = [
+            {"id": f"{i:032x}", "timestamp": "2025-01-01T00:00:00", "step": "Prospect created",
+             "action": "Imported from the previous CRM with the full onboarding history."}
+            for i in range(history)
+        ]
+        store.seed([prospect])
+        crm_store_async.set_async_crm_store(store)
+        events = StandInAsyncEventStore(latency=0)
+        event_store.set_async_event_store(events)
+
+        client = RecordingClient(prospect)
+        async with async_unit_of_work(store, events=events):
+            plan = await acall_o1(client, prospect)
+            await acall_gpt4o(client, plan, history=policy)
+        return client.prompt_tokens
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        return asyncio.run(main())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--history", type=int, default=5)
+    parser.add_argument("--keep-turns", type=int, default=2)
+    parser.add_argument("--window", type=int, default=3)
+    parser.add_argument("--max-tool-chars", type=int, default=4000)
+    args = parser.parse_args()
+
+    policies = {
+        "full": FullHistory(),
+        "compact": CompactHistory(args.keep_turns, None, args.max_tool_chars),
+        f"compact+window{args.window}": CompactHistory(args.keep_turns, args.window, args.max_tool_chars),
+    }
+    results = {name: run(policy, args.history) for name, policy in policies.items()}
+
+    print(f"{'iteration':>9} " + " ".join(f"{name:>18}" for name in results))
+    for iteration in range(max(len(tokens) for tokens in results.values())):
+        row = [tokens[iteration] if iteration < len(tokens) else "" for tokens in results.values()]
+        print(f"{iteration + 1:>9} " + " ".join(f"{value:>18}" for value in row))
+    print(f"{'run total':>9} " + " ".join(f"{sum(tokens):>18}" for tokens in results.values()))
+
+
+if __name__ == "__main__":
+    main()
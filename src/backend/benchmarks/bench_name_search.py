@@ -0,0 +1,146 @@
+"""
+Prospect lookup by name at scale: the former substring scan (first profile whose fullName contains the
+query, case- and accent-sensitive) vs the trigram NameIndex (ranked fuzzy search), on a SQLite CRM store
+of --profiles seeded profiles with accented names.
+
+Queries, sampled from the stored names: exact name, case- and accent-folded name, name with a typo
+(two letters swapped) and last name only. hit@1: the first result is the profile the name was taken from
+(last name only: a profile with that last name).
+
+Usage (from src/backend):
+    python benchmarks/bench_name_search.py --profiles 100000 --queries 200
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import unicodedata
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from local_store import LocalDatabase, SQLiteCRMStore  # noqa: E402
+from name_index import normalize_name  # noqa: E402
+
+FIRST_NAMES = [
+    "José", "María", "François", "Zoë", "Jürgen", "Søren", "Łukasz", "Chloé", "Ana", "Giulia", "Matteo", "Björn",
+    "Inès", "Noël", "Renée", "Andrés", "Lucía", "Óscar", "Mikaël", "Hélène", "Jan", "Emma", "Liam", "Olivia",
+    "Ángel", "Ignacio", "Sofía", "Ahmed", "Fatima", "Yusuf", "Aiko", "Hiroshi", "Mei", "Chen", "Priya", "Arjun",
+]
+ONSETS = ["b", "br", "c", "ch", "d", "f", "g", "gr", "h", "j", "k", "l", "m", "n", "p", "r", "s", "sch", "st", "t", "v", "w", "z"]
+VOWELS = ["a", "e", "i", "o", "u", "é", "è", "á", "í", "ó", "ü", "ø", "ei", "ou"]
+CODAS = ["", "", "n", "r", "l", "s", "z", "rd", "tt", "nn", "ck"]
+
+
+def _last_name(rng):
+    syllables = rng.randint(2, 3)
+    return "".join(rng.choice(ONSETS) + rng.choice(VOWELS) + rng.choice(CODAS) for _ in range(syllables)).capitalize()
+
+
+def make_profiles(count, seed):
+    rng = random.Random(seed)
+    profiles = []
+    for i in range(count):
+        last_name = _last_name(rng)
+        if rng.random() < 0.1:
+            last_name = f"{last_name}-{_last_name(rng)}"
+        profiles.append({"clientID": f"PRO{i:07d}", "firstName": rng.choice(FIRST_NAMES), "lastName": last_name})
+    for profile in profiles:
+        profile["fullName"] = f"{profile['firstName']} {profile['lastName']}"
+    return profiles
+
+
+def _fold(name):
+    decomposed = unicodedata.normalize("NFKD", name)
+    return "".join(char for char in decomposed if not unicodedata.combining(char)).upper()
+
+
+def _typo(name, rng):
+    position = rng.randrange(len(name) - 1)
+    return name[:position] + name[position + 1] + name[position] + name[position + 2:]
+
+
+def make_queries(profiles, count, seed):
+    rng = random.Random(seed)
+    sample = rng.sample(profiles, count)
+    return {
+        "exact": [(p["fullName"], p) for p in sample],
+        "folded": [(_fold(p["fullName"]), p) for p in sample],
+        "typo": [(_typo(p["fullName"], rng), p) for p in sample],
+        "last name": [(p["lastName"], p) for p in sample],
+    }
+
+
+def _hit(kind, expected, found):
+    if found is None:
+        return False
+    if kind == "last name":
+        return normalize_name(expected["lastName"]) in normalize_name(found["fullName"])
+    # Profiles with the same name are indistinguishable to both lookups
+    return found["clientID"] == expected["clientID"] or normalize_name(found["fullName"]) == normalize_name(expected["fullName"])
+
+
+def measure(lookup, kind, queries):
+    latencies, hits = [], 0
+    for query, expected in queries:
+        started = time.perf_counter()
+        found = lookup(query)
+        latencies.append((time.perf_counter() - started) * 1000)
+        hits += _hit(kind, expected, found)
+    latencies.sort()
+    return {
+        "p50_ms": latencies[len(latencies) // 2],
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1],
+        "hit_at_1": hits / len(queries),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profiles", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    profiles = make_profiles(args.profiles, args.seed)
+    queries = make_queries(profiles, args.queries, args.seed)
+
+    with tempfile.TemporaryDirectory() as directory:
+        database = LocalDatabase(os.path.join(directory, "crm.sqlite3"))
+        store = SQLiteCRMStore(database, "crm")
+        started = time.perf_counter()
+        with database.transaction() as db:
+            db.executemany(
+                "INSERT INTO profiles (container, client_id, full_name, status, etag, body) VALUES (?, ?, ?, ?, ?, ?)",
+                [("crm", p["clientID"], p["fullName"], "new", "0", "{}") for p in profiles]
+            )
+        print(f"{args.profiles} profiles loaded in {time.perf_counter() - started:.1f}s")
+
+        started = time.perf_counter()
+        store.search_customer_profiles_by_name("warm up")
+        print(f"name index built in {time.perf_counter() - started:.1f}s")
+        print()
+
+        def substring_scan(query):
+            with database.lock:
+                row = database.db.execute(
+                    "SELECT client_id, full_name FROM profiles WHERE container = ? AND instr(full_name, ?) > 0 "
+                    "ORDER BY client_id LIMIT 1", ("crm", query)
+                ).fetchone()
+            return {"clientID": row[0], "fullName": row[1]} if row else None
+
+        def name_index(query):
+            matches = store.search_customer_profiles_by_name(query, limit=1)
+            return matches[0] if matches else None
+
+        print(f"{'query':<10} {'lookup':<15} {'p50 ms':>8} {'p95 ms':>8} {'hit@1':>7}")
+        for kind, kind_queries in queries.items():
+            for name, lookup in (("substring scan", substring_scan), ("name index", name_index)):
+                result = measure(lookup, kind, kind_queries)
+                print(f"{kind:<10} {name:<15} {result['p50_ms']:>8.2f} {result['p95_ms']:>8.2f} {result['hit_at_1']:>7.0%}")
+        database.close()
+
+
+if __name__ == "__main__":
+    main()
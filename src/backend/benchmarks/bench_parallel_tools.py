@@ -0,0 +1,105 @@
+"""
+Parallel tool calls: executor round trips and wall time of an agent run when the executor may call
+independent tools together vs one tool per turn. The stand-in model batches the workflow steps that
+do not conflict (TOOL_EFFECTS): the steps of business_logic.txt are gated on the status returned by
+the previous step, so it calls them one at a time and both modes should make the same round trips.
+
+Runs the async request path (o1 plan, 4o executor loop, one unit of work commit) against stand-in
+LLM and Cosmos backends with simulated latency, with the same tool seed in both modes, and fails
+(exit status 1) if the two modes leave different profiles or onboarding steps.
+
+Usage (from src/backend):
+    python benchmarks/bench_parallel_tools.py --runs 5 --planner-ms 500 --executor-ms 300 --cosmos-ms 10
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import crm_store_async  # noqa: E402
+import event_store  # noqa: E402
+import accountopening.planner_executor as planner_executor  # noqa: E402
+from event_store import EVENT_FIELDS  # noqa: E402
+from skills.tool_random import seeded_tool_random  # noqa: E402
+from unit_of_work import async_unit_of_work  # noqa: E402
+from stand_ins import StandInAsyncChatClient, StandInAsyncCRMStore, StandInAsyncEventStore, make_prospects  # noqa: E402
+
+
+class CountingClient(StandInAsyncChatClient):
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.executor_calls = 0
+
+    async def _create(self, **kwargs):
+        if kwargs.get("tools"):
+            self.executor_calls += 1
+        return await super()._create(**kwargs)
+
+
+def _outcome(profile):
+    # The profile fields and the onboarding steps (history entries carry their own ids and timestamps)
+    fields = {key: value for key, value in profile.items() if key != "_etag" and key not in EVENT_FIELDS.values()}
+    return fields, [entry["step"] for entry in profile.get("onboarding", [])]
+
+
+def run(parallel, args):
+    planner_executor.PARALLEL_TOOL_CALLS = parallel
+
+    async def main():
+        store = StandInAsyncCRMStore(latency=args.cosmos_ms / 1000)
+        events = StandInAsyncEventStore(latency=args.cosmos_ms / 1000)
+        store.seed(make_prospects(args.runs))
+        crm_store_async.set_async_crm_store(store)
+        event_store.set_async_event_store(events)
+
+        round_trips, durations, profiles = [], [], []
+        for client_id in sorted(store.items):
+            prospect = await store.get_customer_profile_by_client_id(client_id)
+            client = CountingClient(prospect, args.planner_ms / 1000, args.executor_ms / 1000)
+            started = time.perf_counter()
+            with seeded_tool_random(args.seed):
+                async with async_unit_of_work(store, events=events):
+                    plan = await planner_executor.acall_o1(client, prospect)
+                    await planner_executor.acall_gpt4o(client, plan)
+            durations.append(time.perf_counter() - started)
+            round_trips.append(client.executor_calls)
+            profiles.append(_outcome(store.items[client_id]))
+        return round_trips, durations, profiles
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        return asyncio.run(main())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--planner-ms", type=float, default=500.0)
+    parser.add_argument("--executor-ms", type=float, default=300.0)
+    parser.add_argument("--cosmos-ms", type=float, default=10.0)
+    parser.add_argument("--seed", default="bench", help="Tool seed of the runs, the same in both modes")
+    args = parser.parse_args()
+
+    results = {"serial": run(False, args), "parallel": run(True, args)}
+    print(f"{'mode':>8} {'runs':>5} {'executor round trips/run':>25} {'wall s/run':>11}")
+    for mode, (round_trips, durations, _) in results.items():
+        print(f"{mode:>8} {len(durations):>5} {sum(round_trips) / len(round_trips):>25.1f} "
+              f"{sum(durations) / len(durations):>11.3f}")
+    serial, parallel = results["serial"][2], results["parallel"][2]
+    statuses = sorted({fields.get("status") for fields, _ in serial})
+    print(f"final statuses: {statuses}")
+    different = [index for index, (a, b) in enumerate(zip(serial, parallel)) if a != b]
+    if different:
+        print(f"parallel tool calls changed the outcome of runs {different}")
+        for index in different:
+            print(f"  serial:   {serial[index]}\n  parallel: {parallel[index]}")
+        sys.exit(1)
+    print("both modes leave the same profiles and onboarding steps")
+
+
+if __name__ == "__main__":
+    main()
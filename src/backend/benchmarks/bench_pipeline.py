@@ -0,0 +1,268 @@
+"""
+Per-phase benchmark of the account opening pipeline: where the time of a run goes.
+
+Drives what /run_ao_agents runs (app._run_agents: o1 plan, 4o executor loop with the async tools,
+unit of work commit) at several concurrency levels, then each tool of FUNCTION_MAPPING on its own,
+against stand-in LLM and Cosmos backends with simulated latency. Reports, per concurrency level:
+- p50/p95/p99 of each phase: run_ao_agents (whole run), call_o1, call_gpt4o, commit and every tool
+  called by the executor (tool:<name>, staged in the run's unit of work);
+- Cosmos calls, model calls and tokens per run;
+- throughput (runs/min);
+and p50/p95/p99 and Cosmos calls of each FUNCTION_MAPPING tool called directly (outside a run).
+
+The results are written as JSON (--output) with the configuration and the git commit, to compare
+changes over time; --baseline prints the p50/p95 deltas against a previous results file.
+
+Usage (from src/backend):
+    python benchmarks/bench_pipeline.py --prospects 100 --concurrency 1 10 50 --planner-ms 500 --executor-ms 100 --cosmos-ms 10 --output bench_pipeline.json
+"""
+import argparse
+import asyncio
+import contextlib
+import contextvars
+import datetime
+import inspect
+import io
+import json
+import os
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+import crm_store  # noqa: E402
+import crm_store_async  # noqa: E402
+import event_store  # noqa: E402
+from jobs import run_batch  # noqa: E402
+from skills.account_opening_tools import FUNCTION_MAPPING  # noqa: E402
+from stand_ins import (StandInAsyncChatClient, StandInCRMStore, StandInAsyncCRMStore,  # noqa: E402
+                       StandInEventStore, StandInAsyncEventStore, make_prospects)
+
+# Phase durations (ms) of the run in progress; each run is its own task, with its own context
+_run_phases = contextvars.ContextVar("run_phases")
+# Stand-in chat client of the run in progress (app._run_agents gets its clients from the pool)
+_run_client = contextvars.ContextVar("run_client")
+
+
+def _timed(phase, function):
+    async def timed(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await function(*args, **kwargs)
+        finally:
+            _run_phases.get()[phase] = (time.perf_counter() - started) * 1000
+    return timed
+
+
+def _instrument():
+    """
+    Times the planner and executor inside app._run_agents and routes its model calls to the run's
+    stand-in client (app imports them from planner_executor, so they are looked up in the app module).
+    """
+    app.acall_o1 = _timed("call_o1", app.acall_o1)
+    app.acall_gpt4o = _timed("call_gpt4o", app.acall_gpt4o)
+    app.get_async_openai_client = lambda *args: _run_client.get()
+
+
+def percentiles(values):
+    """
+    Count, mean and nearest-rank p50/p95/p99 of a list of durations (ms).
+    """
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+
+    def rank(p):
+        return round(ordered[min(len(ordered) - 1, max(0, int(-(-p * len(ordered) // 100)) - 1))], 2)
+
+    return {
+        "count": len(ordered),
+        "mean": round(sum(ordered) / len(ordered), 2),
+        "p50": rank(50),
+        "p95": rank(95),
+        "p99": rank(99),
+    }
+
+
+def bench_runs(concurrency, args):
+    async def main():
+        store = StandInAsyncCRMStore(latency=args.cosmos_ms / 1000)
+        events = StandInAsyncEventStore(latency=args.cosmos_ms / 1000)
+        store.seed(make_prospects(args.prospects))
+        crm_store_async.set_async_crm_store(store)
+        event_store.set_async_event_store(events)
+        client_ids = sorted(store.items)
+        phases, usages = {}, []
+
+        async def run_item(client_id):
+            prospect = await store.get_customer_profile_by_client_id(client_id)
+            client = StandInAsyncChatClient(prospect, args.planner_ms / 1000, args.executor_ms / 1000)
+            _run_client.set(client)
+            run_phases = {}
+            _run_phases.set(run_phases)
+
+            def on_event(event):
+                if event["type"] == "tool_result":
+                    phases.setdefault(f"tool:{event['name']}", []).append(event["duration_ms"])
+
+            started = time.perf_counter()
+            upd_prospect, outcome = await app._run_agents(store, prospect, on_event=on_event)
+            run_phases["run_ao_agents"] = (time.perf_counter() - started) * 1000
+            # What is left of the run once planned and executed: the unit of work commit
+            run_phases["commit"] = run_phases["run_ao_agents"] - run_phases["call_o1"] - run_phases["call_gpt4o"]
+            for phase, duration in run_phases.items():
+                phases.setdefault(phase, []).append(duration)
+            usages.append(client.usage)
+            return {"final_status": (upd_prospect or {}).get("status"), **outcome}
+
+        calls = store.calls + events.calls
+        report = await run_batch(client_ids, run_item, concurrency)
+        cosmos_calls = store.calls + events.calls - calls
+        return report, phases, usages, cosmos_calls
+
+    report, phases, usages, cosmos_calls = asyncio.run(main())
+    runs = max(1, report["succeeded"])
+    return {
+        "concurrency": concurrency,
+        "runs": report["total"],
+        "failed": report["failed"],
+        "partial": report["partial"],
+        "duration_s": report["duration_s"],
+        "runs_per_minute": report["items_per_minute"],
+        "cosmos_calls_per_run": round(cosmos_calls / runs, 2),
+        "model_calls_per_run": round(sum(u["calls"] for u in usages) / runs, 2),
+        "tokens_per_run": {key: round(sum(u[key] for u in usages) / runs, 1)
+                           for key in ("prompt_tokens", "completion_tokens", "cached_tokens")},
+        "phases_ms": {phase: percentiles(durations) for phase, durations in sorted(phases.items())},
+    }
+
+
+def _tool_arguments(function, prospect):
+    # Arguments from the prospect, by parameter name (the tool schemas' parameters)
+    values = {
+        "prospect_data": prospect,
+        "full_name": prospect["fullName"],
+        "clientID": prospect["clientID"],
+        "client_id": prospect["clientID"],
+        "name_screening_result": "No match",
+    }
+    parameters = inspect.signature(function).parameters
+    return {name: json.loads(json.dumps(values[name])) for name in parameters if name in values}
+
+
+def bench_tools(args):
+    """
+    Calls every FUNCTION_MAPPING tool directly (sync, outside a unit of work: each write goes to the store).
+    """
+    store = StandInCRMStore(latency=args.cosmos_ms / 1000)
+    events = StandInEventStore(latency=args.cosmos_ms / 1000)
+    prospects = make_prospects(args.tool_calls, prefix="PROTOOLS")
+    store.seed(prospects)
+    crm_store.set_crm_store(store)
+    event_store.set_event_store(events)
+
+    results = {}
+    for name, function in FUNCTION_MAPPING.items():
+        durations, calls = [], store.calls + events.calls
+        for prospect in prospects:
+            arguments = _tool_arguments(function, prospect)
+            started = time.perf_counter()
+            function(**arguments)
+            durations.append((time.perf_counter() - started) * 1000)
+        results[name] = {
+            **percentiles(durations),
+            "cosmos_calls_per_call": round((store.calls + events.calls - calls) / len(prospects), 2),
+        }
+    return results
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_deltas(results, baseline):
+    """
+    p50/p95 of every phase and tool against a previous results file (ms, and change in %).
+    """
+    def change(new, old):
+        return f"{new:>9.2f} {((new - old) / old * 100 if old else 0.0):>+7.1f}%"
+
+    previous = {level["concurrency"]: level for level in baseline.get("levels", [])}
+    print(f"\nvs baseline {baseline.get('git_commit')} ({baseline.get('timestamp')})")
+    print(f"{'concurrency':>11} {'phase':<48} {'p50 ms':>9} {'':>8} {'p95 ms':>9} {'':>8}")
+    for level in results["levels"]:
+        old_level = previous.get(level["concurrency"])
+        if old_level is None:
+            continue
+        for phase, stats in level["phases_ms"].items():
+            old = old_level["phases_ms"].get(phase)
+            if old and stats["count"] and old["count"]:
+                print(f"{level['concurrency']:>11} {phase:<48} {change(stats['p50'], old['p50'])} "
+                      f"{change(stats['p95'], old['p95'])}")
+    for name, stats in results["tools"].items():
+        old = baseline.get("tools", {}).get(name)
+        if old:
+            print(f"{'direct':>11} {'tool:' + name:<48} {change(stats['p50'], old['p50'])} "
+                  f"{change(stats['p95'], old['p95'])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--prospects", type=int, default=100, help="runs per concurrency level")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--tool-calls", type=int, default=50, help="direct calls per tool")
+    parser.add_argument("--planner-ms", type=float, default=500.0)
+    parser.add_argument("--executor-ms", type=float, default=100.0)
+    parser.add_argument("--cosmos-ms", type=float, default=10.0)
+    parser.add_argument("--output", default="bench_pipeline.json", help="results file (JSON)")
+    parser.add_argument("--baseline", help="previous results file to compare with")
+    args = parser.parse_args()
+
+    _instrument()
+    results = {
+        "benchmark": "pipeline",
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "git_commit": _git_commit(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+        "levels": [],
+    }
+
+    print(f"{'concurrency':>11} {'runs':>5} {'failed':>7} {'runs/min':>9} {'cosmos/run':>11} "
+          f"{'tokens/run':>11} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for concurrency in args.concurrency:
+        with contextlib.redirect_stdout(io.StringIO()):
+            level = bench_runs(concurrency, args)
+        results["levels"].append(level)
+        run = level["phases_ms"]["run_ao_agents"]
+        tokens = level["tokens_per_run"]["prompt_tokens"] + level["tokens_per_run"]["completion_tokens"]
+        print(f"{concurrency:>11} {level['runs']:>5} {level['failed']:>7} {level['runs_per_minute']:>9.1f} "
+              f"{level['cosmos_calls_per_run']:>11.1f} {tokens:>11.0f} {run['p50']:>9.1f} {run['p95']:>9.1f} {run['p99']:>9.1f}")
+
+    print(f"\n{'concurrency':>11} {'phase':<48} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for level in results["levels"]:
+        for phase, stats in level["phases_ms"].items():
+            print(f"{level['concurrency']:>11} {phase:<48} {stats['p50']:>9.2f} {stats['p95']:>9.2f} {stats['p99']:>9.2f}")
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        results["tools"] = bench_tools(args)
+    print(f"\n{'tool (direct call)':<48} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'cosmos/call':>12}")
+    for name, stats in results["tools"].items():
+        print(f"{name:<48} {stats['p50']:>9.2f} {stats['p95']:>9.2f} {stats['p99']:>9.2f} {stats['cosmos_calls_per_call']:>12.2f}")
+
+    with open(args.output, "w") as file:
+        json.dump(results, file, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            print_deltas(results, json.load(file))
+
+
+if __name__ == "__main__":
+    main()
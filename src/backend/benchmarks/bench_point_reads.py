@@ -0,0 +1,83 @@
+"""
+RU charge and latency of a profile lookup by clientID: cross-partition SQL query vs point read.
+
+Runs against the Cosmos DB account configured in .env (COSMOSDB_*) and a container
+partitioned on /clientID (see migrate_crm_container.py). Each lookup is issued `--repeat`
+times per sampled clientID and the request charge is taken from the response headers.
+
+Usage (from src/backend):
+    python benchmarks/bench_point_reads.py --samples 20 --repeat 5
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from crm_store import get_crm_store  # noqa: E402
+
+
+def _charge(container):
+    return float(container.client_connection.last_response_headers.get("x-ms-request-charge", 0))
+
+
+def query_lookup(container, client_id):
+    items = list(container.query_items(
+        query="SELECT * FROM c WHERE c.clientID = @client_id",
+        parameters=[{"name": "@client_id", "value": client_id}],
+        enable_cross_partition_query=True
+    ))
+    return items[0] if items else None
+
+
+def point_read(container, client_id):
+    return container.read_item(item=client_id, partition_key=client_id)
+
+
+def measure(container, lookup, client_ids, repeat):
+    latencies, charges = [], []
+    for client_id in client_ids:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            lookup(container, client_id)
+            latencies.append((time.perf_counter() - start) * 1000)
+            charges.append(_charge(container))
+    latencies.sort()
+    return {
+        "ru_avg": statistics.mean(charges),
+        "p50_ms": latencies[len(latencies) // 2],
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--samples", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    load_dotenv()
+    store = get_crm_store()
+    if store.partition_key_path != "/clientID":
+        sys.exit(f"Container is partitioned on {store.partition_key_path}: migrate it first (migrate_crm_container.py)")
+
+    client_ids = [item["clientID"] for item in store.container.query_items(
+        query=f"SELECT TOP {args.samples} c.clientID FROM c",
+        enable_cross_partition_query=True
+    )]
+    if not client_ids:
+        sys.exit("The container is empty")
+
+    print(f"{len(client_ids)} clientIDs x {args.repeat} lookups\n")
+    print(f"{'lookup':<24} {'RU avg':>8} {'p50 ms':>8} {'p95 ms':>8}")
+    for name, lookup in (("cross-partition query", query_lookup), ("point read", point_read)):
+        result = measure(store.container, lookup, client_ids, args.repeat)
+        print(f"{name:<24} {result['ru_avg']:>8.2f} {result['p50_ms']:>8.1f} {result['p95_ms']:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
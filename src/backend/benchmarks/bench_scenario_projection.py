@@ -0,0 +1,50 @@
+"""
+Planner prompt size: tokens of the o1 prompt with the full prospect vs the projection on the fields
+the ruleset and the tools use, for prospects with a growing history and portfolio.
+
+Usage (from src/backend):
+    python benchmarks/bench_scenario_projection.py --history 0 5 50 --positions 0 40
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from accountopening.planner_executor import build_o1_prompt_with_stats  # noqa: E402
+from accountopening.scenario import tiktoken  # noqa: E402
+from stand_ins import make_prospects  # noqa: E402
+
+
+def prospect(history, positions):
+    prospect = make_prospects(1)[0]
+    prospect["onboarding"] = [
+        {"id": f"{i:032x}", "timestamp": "2025-01-01T00:00:00", "step": "KYC data collected successfully",
+         "action": "Client KYC data successfully verified and collected."}
+        for i in range(history)
+    ]
+    prospect["portfolio"] = [
+        {"isin": f"CH{i:010d}", "quantity": i + 1, "value": 1000.0 * (i + 1), "currency": "CHF"}
+        for i in range(positions)
+    ]
+    return prospect
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--history", type=int, nargs="+", default=[0, 5, 50])
+    parser.add_argument("--positions", type=int, nargs="+", default=[0, 40])
+    args = parser.parse_args()
+
+    print(f"token counts: {'tiktoken o200k_base' if tiktoken else 'estimated (4 chars/token)'}")
+    print(f"{'history':>8} {'positions':>10} {'scenario':>9} {'projected':>10} {'prompt full':>12} {'prompt proj':>12} {'saved':>7}")
+    for history in args.history:
+        for positions in args.positions:
+            _, stats = build_o1_prompt_with_stats(prospect(history, positions))
+            saved = 1 - stats["prompt_tokens"] / stats["prompt_tokens_unprojected"]
+            print(f"{history:>8} {positions:>10} {stats['scenario_tokens']:>9} {stats['projected_scenario_tokens']:>10} "
+                  f"{stats['prompt_tokens_unprojected']:>12} {stats['prompt_tokens']:>12} {saved:>7.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+"""
+Tool definitions footprint: tokens of each tool schema generated by the ToolRegistry (compact JSON),
+and of the whole tool list as embedded in the planner prompt, compact vs the former str(TOOLS).
+
+Usage (from src/backend):
+    python benchmarks/bench_tool_schemas.py
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from skills.account_opening_tools import TOOL_REGISTRY, TOOLS, TOOLS_JSON  # noqa: E402
+from accountopening.scenario import count_tokens, tiktoken  # noqa: E402
+
+
+def main():
+    print(f"token counts: {'tiktoken o200k_base' if tiktoken else 'estimated (4 chars/token)'}")
+    print(f"{'tool':>40} {'tokens':>7}")
+    for schema in TOOLS:
+        name = schema["function"]["name"]
+        print(f"{name:>40} {count_tokens(TOOL_REGISTRY.schema_json(name)):>7}")
+    print(f"{'all tools, str(TOOLS)':>40} {count_tokens(str(TOOLS)):>7}")
+    print(f"{'all tools, cached compact JSON':>40} {count_tokens(TOOLS_JSON):>7}")
+
+    runs = 1000
+    stringify = timeit.timeit(lambda: str(TOOLS), number=runs) / runs * 1e6
+    cached = timeit.timeit(TOOL_REGISTRY.schemas_json, number=runs) / runs * 1e6
+    print(f"serialization per prompt: str(TOOLS) {stringify:.1f} us, cached {cached:.2f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,442 @@
+"""
+Stand-in LLM and CRM backends with simulated latency, used by the benchmarks to exercise the
+account opening pipeline without Azure OpenAI or Cosmos DB.
+"""
+import asyncio
+import copy
+import json
+import threading
+import time
+import uuid
+
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+
+from accountopening.tool_calls import conflicts
+from crm_store import PROSPECT_LIST_FIELDS, PreconditionFailedError
+from name_index import name_trigrams, normalize_name, score_name
+from patching import apply_json_patch
+from skills.account_opening_tools import TOOL_EFFECTS
+
+# Tool calls issued by the stand-in executor, in the order of business_logic.txt
+WORKFLOW = [
+    "collect_kyc_info",
+    "collect_sow_info",
+    "perform_data_management_ai_extraction",
+    "perform_name_screening",
+    "create_client_profile",
+    "perform_compliance_risk_assessment",
+]
+
+
+
+def _estimate_tokens(value):
+    return max(1, len(json.dumps(value, default=str)) // 4)
+
+
+class _PromptCache:
+    """
+    Simulates the provider's prompt prefix cache: prompts of 1024+ tokens reuse the longest prefix
+    seen before, in 128 token increments (tokens estimated at 4 characters).
+    """
+    MIN_TOKENS, INCREMENT = 1024, 128
+
+    def __init__(self):
+        self._prefixes = set()
+        self._lock = threading.Lock()
+
+    def cached_tokens(self, messages):
+        text = json.dumps(messages, default=str)
+        step = self.INCREMENT * 4
+        boundaries = range(self.MIN_TOKENS * 4, len(text) + 1, step)
+        cached = 0
+        with self._lock:
+            for end in boundaries:
+                prefix = hash(text[:end])
+                if prefix in self._prefixes:
+                    cached = end // 4
+                else:
+                    self._prefixes.add(prefix)
+        return cached
+
+
+PROMPT_CACHE = _PromptCache()
+
+
+def _completion(model, messages, content=None, tool_call=None, completion_tokens=50):
+    message = {"role": "assistant", "content": content}
+    if tool_call is not None:
+        # one (name, arguments) call, or a list of them (parallel tool calls)
+        message["tool_calls"] = [{
+            "id": f"call_{uuid.uuid4().hex[:12]}",
+            "type": "function",
+            "function": {"name": name, "arguments": json.dumps(arguments)},
+        } for name, arguments in (tool_call if isinstance(tool_call, list) else [tool_call])]
+    prompt_tokens = _estimate_tokens(messages)
+    return ChatCompletion.model_validate({
+        "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model or "stand-in",
+        "choices": [{"index": 0, "finish_reason": "tool_calls" if tool_call else "stop", "message": message}],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": PROMPT_CACHE.cached_tokens(messages)},
+        },
+    })
+
+
+class _ScriptedChat:
+    """
+    Produces the planner plan (requests without tools) or the next executor tool call
+    (requests with tools) for one prospect.
+    """
+    def __init__(self, prospect):
+        self.prospect = prospect
+
+    def respond(self, kwargs):
+        messages = kwargs["messages"]
+        if not kwargs.get("tools"):
+            plan = "\n".join(f"{i + 1}. `call the {name} function`" for i, name in enumerate(WORKFLOW))
+            return _completion(kwargs.get("model"), messages, content=plan, completion_tokens=400)
+
+        done = [m for m in messages if isinstance(m, dict) and m.get("role") == "tool"]
+        # Steps folded into a recap by the executor history policy count as done
+        recapped = sum(m["content"].count("\n- ") for m in messages
+                       if isinstance(m, dict) and m.get("role") == "user")
+        if len(done) + recapped >= len(WORKFLOW):
+            return _completion(kwargs.get("model"), messages, tool_call=("instructions_complete", {}))
+
+        step = len(done) + recapped
+        names = [WORKFLOW[step]]
+        if kwargs.get("parallel_tool_calls"):
+            # Like the executor prompt asks: the next steps are called together only while independent
+            for name in WORKFLOW[step + 1:]:
+                if any(conflicts(TOOL_EFFECTS[name], TOOL_EFFECTS[other]) for other in names):
+                    break
+                names.append(name)
+        calls = [(name, self._arguments(name, done)) for name in names]
+        return _completion(kwargs.get("model"), messages, content=f"Calling {', '.join(names)}", tool_call=calls)
+
+    def _arguments(self, name, done):
+        prospect_data = {key: self.prospect.get(key) for key in
+                         ("clientID", "firstName", "lastName", "dateOfBirth", "nationality",
+                          "documents_provided", "risk_level", "risk_score", "name_screening_result")}
+        arguments = {"prospect_data": prospect_data}
+        if name == "create_client_profile":
+            screening = json.loads(done[-1]["content"]) if done else {}
+            arguments["name_screening_result"] = screening.get("name_screening_result", "No match")
+        if name == "perform_compliance_risk_assessment":
+            profile = json.loads(done[-1]["content"]) if done else {}
+            prospect_data["risk_level"] = profile.get("risk_level", "Low")
+            prospect_data["name_screening_result"] = "No match"
+        return arguments
+
+
+class _Namespace:
+    pass
+
+
+class StandInChatClient:
+    """
+    Mimics `AzureOpenAI` for `client.chat.completions.create(...)` with a fixed latency per call.
+    """
+    def __init__(self, prospect, planner_latency=1.0, executor_latency=0.3):
+        self._script = _ScriptedChat(prospect)
+        self._planner_latency = planner_latency
+        self._executor_latency = executor_latency
+        # Model calls and tokens billed to this client
+        self.usage = {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0}
+        self.chat = _Namespace()
+        self.chat.completions = _Namespace()
+        self.chat.completions.create = self._create
+
+    def _respond(self, kwargs):
+        completion = self._script.respond(kwargs)
+        self.usage["calls"] += 1
+        self.usage["prompt_tokens"] += completion.usage.prompt_tokens
+        self.usage["completion_tokens"] += completion.usage.completion_tokens
+        self.usage["cached_tokens"] += completion.usage.prompt_tokens_details.cached_tokens
+        return completion
+
+    def _create(self, **kwargs):
+        time.sleep(self._executor_latency if kwargs.get("tools") else self._planner_latency)
+        return self._respond(kwargs)
+
+
+def _chunks(completion, pieces=20, include_usage=False):
+    content = completion.choices[0].message.content or ""
+    step = max(1, len(content) // pieces)
+    for start in range(0, len(content), step):
+        yield ChatCompletionChunk.model_validate({
+            "id": completion.id,
+            "object": "chat.completion.chunk",
+            "created": completion.created,
+            "model": completion.model,
+            "choices": [{"index": 0, "delta": {"content": content[start:start + step]}, "finish_reason": None}],
+        })
+    if include_usage:
+        yield ChatCompletionChunk.model_validate({
+            "id": completion.id,
+            "object": "chat.completion.chunk",
+            "created": completion.created,
+            "model": completion.model,
+            "choices": [],
+            "usage": completion.usage.model_dump(),
+        })
+
+
+class StandInAsyncChatClient(StandInChatClient):
+    """
+    Mimics `AsyncAzureOpenAI`. With stream=True the planner latency is spread over the streamed chunks.
+    """
+    async def _create(self, **kwargs):
+        latency = self._executor_latency if kwargs.get("tools") else self._planner_latency
+        if kwargs.get("stream"):
+            include_usage = (kwargs.get("stream_options") or {}).get("include_usage", False)
+            return self._stream(self._respond(kwargs), latency, include_usage)
+        await asyncio.sleep(latency)
+        return self._respond(kwargs)
+
+    async def _stream(self, completion, latency, include_usage=False):
+        chunks = list(_chunks(completion, include_usage=include_usage))
+        for chunk in chunks:
+            await asyncio.sleep(latency / len(chunks))
+            yield chunk
+
+
+class StandInCRMStore:
+    """
+    Dict-backed CRMStore look-alike; every operation costs `latency` seconds.
+    """
+    def __init__(self, latency=0.01):
+        self.latency = latency
+        self.items = {}
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _io(self):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.latency)
+
+    def _write(self, profile):
+        stored = copy.deepcopy(profile)
+        stored["_etag"] = uuid.uuid4().hex
+        self.items[profile["clientID"]] = stored
+        return copy.deepcopy(stored)
+
+    def _replace(self, profile, etag):
+        current = self.items.get(profile["clientID"])
+        if etag is not None and (current is None or current.get("_etag") != etag):
+            raise PreconditionFailedError(f"Profile {profile['clientID']} was modified concurrently")
+        return self._write(profile)
+
+    def _patch(self, client_id, operations, etag):
+        current = self.items.get(client_id)
+        if current is None:
+            return None
+        return self._replace(apply_json_patch(current, operations), etag)
+
+    def seed(self, profiles):
+        for profile in profiles:
+            self._write(profile)
+
+    def create_customer_profile(self, customer_profile):
+        self._io()
+        return self._write(customer_profile)
+
+    def get_customer_profile_by_full_name(self, full_name):
+        self._io()
+        return next((copy.deepcopy(p) for p in self.items.values()
+                     if full_name.lower() in p.get("fullName", "").lower()), None)
+
+    def get_customer_profile_by_client_id(self, client_id):
+        self._io()
+        item = self.items.get(client_id)
+        return copy.deepcopy(item) if item else None
+
+    def update_customer_profile(self, client_id, updated_data):
+        existing_profile = self.get_customer_profile_by_client_id(client_id)
+        if not existing_profile:
+            return None
+        existing_profile.update(updated_data)
+        self._io()
+        return self._write(existing_profile)
+
+    def patch_customer_profile(self, client_id, operations, etag=None, current=None):
+        self._io()
+        return self._patch(client_id, operations, etag)
+
+    def replace_customer_profile(self, profile, etag=None):
+        self._io()
+        return self._replace(profile, etag)
+
+    def delete_customer_profile(self, client_id):
+        self._io()
+        return self.items.pop(client_id, None) is not None
+
+    def _page(self, prefix, status, page_size, continuation_token, fields):
+        client_ids = sorted(client_id for client_id, p in self.items.items()
+                            if client_id.startswith(prefix) and client_id > (continuation_token or "")
+                            and (status is None or p.get("status") == status))
+        items = [{field: self.items[client_id][field] for field in fields if field in self.items[client_id]}
+                 for client_id in client_ids[:page_size]]
+        return items, client_ids[page_size - 1] if len(client_ids) > page_size else None
+
+    def _search(self, full_name, limit):
+        # Linear scan with the NameIndex scoring: the stand-in holds a few profiles only
+        query_trigrams = name_trigrams(normalize_name(full_name))
+        matches = []
+        for client_id, p in self.items.items():
+            score, coverage = score_name(query_trigrams, name_trigrams(normalize_name(p.get("fullName"))))
+            if query_trigrams and coverage >= 0.5:
+                matches.append({"clientID": client_id, "fullName": p.get("fullName"), "score": score})
+        matches.sort(key=lambda match: (-match["score"], match["clientID"]))
+        return matches[:limit]
+
+    def search_customer_profiles_by_name(self, full_name, limit=10):
+        self._io()
+        return self._search(full_name, limit)
+
+    def list_prospects(self, prefix="PRO", status=None, page_size=50, continuation_token=None,
+                       fields=PROSPECT_LIST_FIELDS):
+        self._io()
+        return self._page(prefix, status, page_size, continuation_token, fields)
+
+    def load_all_prospects(self):
+        self._io()
+        return [copy.deepcopy(p) for p in self.items.values() if p["clientID"].startswith("PRO")]
+
+
+class StandInAsyncCRMStore(StandInCRMStore):
+    """
+    AsyncCRMStore look-alike sharing the same items.
+    """
+    async def _aio(self):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+
+    async def create_customer_profile(self, customer_profile):
+        await self._aio()
+        return self._write(customer_profile)
+
+    async def get_customer_profile_by_full_name(self, full_name):
+        await self._aio()
+        return next((copy.deepcopy(p) for p in self.items.values()
+                     if full_name.lower() in p.get("fullName", "").lower()), None)
+
+    async def get_customer_profile_by_client_id(self, client_id):
+        await self._aio()
+        item = self.items.get(client_id)
+        return copy.deepcopy(item) if item else None
+
+    async def update_customer_profile(self, client_id, updated_data):
+        existing_profile = await self.get_customer_profile_by_client_id(client_id)
+        if not existing_profile:
+            return None
+        existing_profile.update(updated_data)
+        await self._aio()
+        return self._write(existing_profile)
+
+    async def patch_customer_profile(self, client_id, operations, etag=None, current=None):
+        await self._aio()
+        return self._patch(client_id, operations, etag)
+
+    async def replace_customer_profile(self, profile, etag=None):
+        await self._aio()
+        return self._replace(profile, etag)
+
+    async def delete_customer_profile(self, client_id):
+        await self._aio()
+        return self.items.pop(client_id, None) is not None
+
+    async def find_client_ids(self, prefix="PRO", status=None):
+        await self._aio()
+        return [p["clientID"] for p in self.items.values()
+                if p["clientID"].startswith(prefix) and (status is None or p.get("status") == status)]
+
+    async def search_customer_profiles_by_name(self, full_name, limit=10):
+        await self._aio()
+        return self._search(full_name, limit)
+
+    async def list_prospects(self, prefix="PRO", status=None, page_size=50, continuation_token=None,
+                             fields=PROSPECT_LIST_FIELDS):
+        await self._aio()
+        return self._page(prefix, status, page_size, continuation_token, fields)
+
+    async def load_all_prospects(self):
+        await self._aio()
+        return [copy.deepcopy(p) for p in self.items.values() if p["clientID"].startswith("PRO")]
+
+
+class StandInEventStore:
+    """
+    Dict-backed EventStore look-alike; every call costs `latency` seconds.
+    """
+    def __init__(self, latency=0.01):
+        self.latency = latency
+        self.events = {}
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _append(self, client_id, events):
+        with self._lock:
+            self.calls += 1
+            stored = self.events.setdefault(client_id, {})
+            for event in events:
+                stored[event["id"]] = copy.deepcopy(event)
+
+    def _page(self, client_id, kind, page_size, continuation_token):
+        events = sorted((e for e in self.events.get(client_id, {}).values() if not kind or e["kind"] == kind),
+                        key=lambda e: e["timestamp"], reverse=True)
+        start = int(continuation_token or 0)
+        end = start + page_size
+        return events[start:end], (str(end) if end < len(events) else None)
+
+    def append_events(self, client_id, events):
+        time.sleep(self.latency)
+        self._append(client_id, events)
+
+    def list_events(self, client_id, kind=None, page_size=20, continuation_token=None):
+        time.sleep(self.latency)
+        return self._page(client_id, kind, page_size, continuation_token)
+
+
+class StandInAsyncEventStore(StandInEventStore):
+    """
+    AsyncEventStore look-alike.
+    """
+    async def append_events(self, client_id, events):
+        await asyncio.sleep(self.latency)
+        self._append(client_id, events)
+
+    async def list_events(self, client_id, kind=None, page_size=20, continuation_token=None):
+        await asyncio.sleep(self.latency)
+        return self._page(client_id, kind, page_size, continuation_token)
+
+
+def make_prospects(count, prefix="PROBENCH"):
+    """
+    Generates `count` prospects shaped like the CRM documents.
+    """
+    prospects = []
+    for i in range(count):
+        client_id = f"{prefix}{i:06d}"
+        prospects.append({
+            "id": client_id,
+            "clientID": client_id,
+            "firstName": f"First{i}",
+            "lastName": f"Last{i}",
+            "fullName": f"First{i} Last{i}",
+            "dateOfBirth": "1980-01-01",
+            "nationality": "CH",
+            "status": "new",
+            "onboarding": [],
+            "documents_provided": ["passport", "proof_of_address"],
+            "name_screening_result": "None",
+            "risk_level": "",
+            "risk_score": 0,
+        })
+    return prospects
@@ -1,18 +1,122 @@
 from azure.cosmos import CosmosClient, PartitionKey, exceptions
+from azure.core import MatchConditions
+from azure.identity import DefaultAzureCredential
 import os
 import json
 import datetime
 import random
+import threading
+import time
+import re
+import logging
 
+from patching import diff, apply_json_patch, to_cosmos_operations
+from telemetry import traced_store
+from request_charges import metered
+from name_index import CosmosNameIndex
+
+# Partition key of the CRM container: documents carry "clientID", so a profile is a 1 RU point read.
+PARTITION_KEY_PATH = os.getenv("COSMOSDB_PARTITION_KEY_PATH", "/clientID")
+
+
+# The name index of a CRM container is stored in the container "<container_name>-names"
+NAME_INDEX_CONTAINER_SUFFIX = "-names"
+# The names of every profile, to build the name index
+PROFILE_NAMES_QUERY = "SELECT c.clientID, c.fullName FROM c"
+
+# Fields of the prospect list view (list_prospects default projection)
+PROSPECT_LIST_FIELDS = ("clientID", "fullName", "dateOfBirth", "status")
+
+_FIELD_NAME = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+def check_field_names(fields):
+    """
+    Raises ValueError if a projected field is not a plain top-level property name (fields are part of the query text).
+    """
+    for field in fields:
+        if not isinstance(field, str) or not _FIELD_NAME.match(field):
+            raise ValueError(f"Invalid field name: {field}")
+
+
+# Query text and patch building shared by CRMStore and crm_store_async.AsyncCRMStore (only the I/O differs)
+
+CLIENT_ID_QUERY = "SELECT * FROM c WHERE c.clientID = @client_id"
+ALL_PROSPECTS_QUERY = "SELECT * FROM c WHERE STARTSWITH(c.clientID, 'PRO')"
+
+
+def client_id_parameters(client_id):
+    return [{"name": "@client_id", "value": client_id}]
+
+
+def prospect_list_query(fields=PROSPECT_LIST_FIELDS, status=None, prefix="PRO"):
+    """
+    The projected query of a prospects page: the given top-level fields of the documents whose clientID
+    starts with `prefix`, at `status` if a status is given.
+
+    Returns:
+    - (str, list): The query and its parameters.
+    """
+    check_field_names(fields)
+    query = f"SELECT {', '.join(f'c.{field}' for field in fields)} FROM c WHERE STARTSWITH(c.clientID, @prefix)"
+    parameters = [{"name": "@prefix", "value": prefix}]
+    if status is not None:
+        query += " AND c.status = @status"
+        parameters.append({"name": "@status", "value": status})
+    return query, parameters
+
+
+def update_operations(existing_profile, updated_data):
+    """
+    The JSON Patch writing the fields of `updated_data` over the existing profile: only what changed
+    (nothing at all for a no-op update).
+    """
+    updated_profile = dict(existing_profile)
+    for key, value in updated_data.items():
+        updated_profile[key] = value
+    return diff(existing_profile, updated_profile)
+
+
+def write_conditions(etag):
+    """
+    The keyword arguments of a write applied only if the document still has this _etag (none without one).
+    """
+    return {"etag": etag, "match_condition": MatchConditions.IfNotModified} if etag else {}
+
+
+def server_side_patch(operations, partition_key_path):
+    """
+    The Cosmos DB partial document update of a JSON Patch, or None when it has to be applied client side
+    (see CRMStore.patch_customer_profile).
+    """
+    if partition_key_path != "/clientID":
+        return None
+    return to_cosmos_operations(operations)
+
+
+class PreconditionFailedError(Exception):
+    """
+    Raised by a conditional write when the document changed since its ETag was read.
+    """
+
+
+@traced_store("cosmosdb")
 class CRMStore:
-    def __init__(self, url, key, database_name, container_name):
-        self.client = CosmosClient(url, credential=key)
+    def __init__(self, url, key, database_name, container_name, client=None, provision=True):
+        self.client = client or CosmosClient(url, credential=key)
         self.database_name = database_name
         self.container_name = container_name
         self.db = None
         self.container = None
-        self.initialize_database()
-        self.initialize_container()
+        self._partition_key_path = None
+        if provision:
+            self.initialize_database()
+            self.initialize_container()
+        else:
+            # Database and container are known to exist (provisioned at startup): just bind the proxies,
+            # which does not cost any round trip.
+            self.db = self.client.get_database_client(database=self.database_name)
+            self.container = self.db.get_container_client(container=self.container_name)
 
     def initialize_database(self):
         try:
@@ -24,12 +128,29 @@ class CRMStore:
         try:
             self.container = self.db.create_container_if_not_exists(
                 id=self.container_name,
-                partition_key=PartitionKey(path="/client_id"),
+                partition_key=PartitionKey(path=PARTITION_KEY_PATH),
                 offer_throughput=400
             )
         except exceptions.CosmosResourceExistsError:
             self.container = self.db.get_container_client(container=self.container_name)
-            
+
+    @property
+    def partition_key_path(self):
+        """
+        The partition key path of the existing container (read once): containers created before
+        the /clientID partitioning keep working until migrated with migrate_crm_container.py.
+        """
+        if self._partition_key_path is None:
+            self._partition_key_path = self.container.read()["partitionKey"]["paths"][0]
+            if self._partition_key_path != "/clientID":
+                logging.warning(
+                    f"Container '{self.container_name}' is partitioned on {self._partition_key_path}: "
+                    "lookups by clientID fall back to cross-partition queries"
+                )
+        return self._partition_key_path
+
+    def partition_key_value(self, profile):
+        return profile.get(self.partition_key_path.lstrip("/"))
         
     def create_customer_profile(self, customer_profile):
         """
@@ -41,16 +162,31 @@ class CRMStore:
         
         try:
             # Create a new document in the container
-            created_user = self.container.create_item(body=customer_profile)
-            return created_user
+            with metered(self.container_name, "create") as hook:
+                created_user = self.container.create_item(body=customer_profile, response_hook=hook)
         except Exception as e:
             print(f"An error occurred: {e}")
             return None
+        index_name(self.container_name, created_user)
+        return created_user
+
+    def search_customer_profiles_by_name(self, full_name, limit=10):
+        """
+        Ranked fuzzy search of the customer profiles by name (accents, case, typos and word order do not
+        matter), served by the name index container instead of a cross-partition scan.
+
+        Args:
+        - full_name (str): The partial or full name of the customer to search for.
+        - limit (int): Maximum number of matches.
 
+        Returns:
+        - list: The matches, best first: {"clientID", "fullName", "score"} (score 1.0: same name).
+        """
+        return get_name_index(self.container_name).search(full_name, limit)
 
     def get_customer_profile_by_full_name(self, full_name):
         """
-        Retrieves a customer profile from Cosmos DB based on a partial match of the customer's full name.
+        Retrieves the customer profile best matching the customer's full name (see search_customer_profiles_by_name).
         
         Args:
         - full_name (str): The partial or full name of the customer to search for.
@@ -58,16 +194,8 @@ class CRMStore:
         Returns:
         - dict: The customer profile, if found.
         """
-        query = "SELECT * FROM c WHERE c.fullName LIKE @full_name"
-        parameters = [
-            {"name": "@full_name", "value": f"%{full_name}%"}
-        ]
-        items = list(self.container.query_items(
-            query=query,
-            parameters=parameters,
-            enable_cross_partition_query=True
-        ))
-        return items[0] if items else None
+        matches = self.search_customer_profiles_by_name(full_name, limit=1)
+        return self.get_customer_profile_by_client_id(matches[0]["clientID"]) if matches else None
     
 
     def get_customer_profile_by_client_id(self, client_id):
@@ -80,15 +208,31 @@ class CRMStore:
         Returns:
         - dict: The customer profile, if found.
         """
-        query = "SELECT * FROM c WHERE c.clientID = @client_id"
-        parameters = [
-            {"name": "@client_id", "value": client_id}
-        ]
-        items = list(self.container.query_items(
-            query=query,
-            parameters=parameters,
-            enable_cross_partition_query=True
-        ))
+        query, parameters = CLIENT_ID_QUERY, client_id_parameters(client_id)
+        if self.partition_key_path == "/clientID":
+            # Point read: profiles are stored with id == clientID
+            try:
+                with metered(self.container_name, "read") as hook:
+                    return self.container.read_item(item=client_id, partition_key=client_id, response_hook=hook)
+            except exceptions.CosmosResourceNotFoundError:
+                pass
+            # Documents whose id differs from the clientID: single-partition query
+            with metered(self.container_name, "query", query) as hook:
+                items = list(self.container.query_items(
+                    query=query,
+                    parameters=parameters,
+                    partition_key=client_id,
+                    response_hook=hook
+                ))
+            return items[0] if items else None
+
+        with metered(self.container_name, "query", query, cross_partition=True) as hook:
+            items = list(self.container.query_items(
+                query=query,
+                parameters=parameters,
+                enable_cross_partition_query=True,
+                response_hook=hook
+            ))
         return items[0] if items else None
     
 
@@ -109,22 +253,86 @@ class CRMStore:
             print(f"No profile found for clientID: {client_id}")
             return None
 
-        # 2. Merge/overwrite fields from updated_data
-        for key, value in updated_data.items():
-            existing_profile[key] = value
-
-        # 3. Replace the item in Cosmos DB using replace_item (or upsert_item)
+        # 2. Merge/overwrite fields from updated_data, writing only what changed
+        operations = update_operations(existing_profile, updated_data)
+        if not operations:
+            return existing_profile
         try:
-            updated_profile = self.container.replace_item(
-                item=existing_profile,
-                body=existing_profile
-            )
-            return updated_profile
+            return self.patch_customer_profile(client_id, operations, current=existing_profile)
         except Exception as e:
             print(f"An error occurred while updating: {e}")
             return None
 
 
+    def patch_customer_profile(self, client_id: str, operations: list, etag: str = None, current: dict = None):
+        """
+        Applies a JSON Patch (RFC 6902) to a customer profile with a Cosmos DB partial document update,
+        e.g. [{"op": "add", "path": "/onboarding/-", "value": {...}}], so large fields are not rewritten.
+
+        Args:
+            client_id (str): The client ID of the profile to patch.
+            operations (list): The JSON Patch operations.
+            etag (str): Only apply the patch if the profile still has this _etag.
+            current (dict): The profile as already read, if any (used when the patch has to be
+                applied client side: more than 10 operations, "copy"/"test" operations or a
+                container not partitioned on /clientID).
+
+        Returns:
+            dict: The patched profile.
+
+        Raises:
+            PreconditionFailedError: If `etag` is given and the profile changed.
+        """
+        if not operations:
+            return current or self.get_customer_profile_by_client_id(client_id)
+
+        cosmos_operations = server_side_patch(operations, self.partition_key_path)
+        if cosmos_operations is not None:
+            try:
+                with metered(self.container_name, "patch") as hook:
+                    patched = self.container.patch_item(
+                        item=client_id,
+                        partition_key=client_id,
+                        patch_operations=cosmos_operations,
+                        response_hook=hook,
+                        **write_conditions(etag)
+                    )
+            except exceptions.CosmosAccessConditionFailedError as e:
+                raise PreconditionFailedError(f"Profile {client_id} was modified concurrently") from e
+            except exceptions.CosmosResourceNotFoundError:
+                pass  # id differs from the clientID: patch client side
+            else:
+                index_name(self.container_name, patched, operations)
+                return patched
+
+        current = current or self.get_customer_profile_by_client_id(client_id)
+        return self.replace_customer_profile(apply_json_patch(current, operations), etag=etag)
+
+
+    def replace_customer_profile(self, profile: dict, etag: str = None):
+        """
+        Replaces a whole customer profile, only if it is unchanged since `etag` was read.
+
+        Args:
+            profile (dict): The full profile to write.
+            etag (str): The _etag the profile was read with (None: unconditional replace).
+
+        Returns:
+            dict: The written profile, with its new _etag.
+
+        Raises:
+            PreconditionFailedError: If the stored profile no longer has this ETag.
+        """
+        try:
+            with metered(self.container_name, "replace") as hook:
+                replaced = self.container.replace_item(item=profile, body=profile, response_hook=hook,
+                                                       **write_conditions(etag))
+        except exceptions.CosmosAccessConditionFailedError as e:
+            raise PreconditionFailedError(f"Profile {profile.get('clientID')} was modified concurrently") from e
+        index_name(self.container_name, replaced)
+        return replaced
+
+
     def delete_customer_profile(self, client_id: str) -> bool:
         """
         Deletes a customer profile from Cosmos DB by clientID.
@@ -143,16 +351,52 @@ class CRMStore:
 
         try:
             # 2. Delete the found item from Cosmos
-            self.container.delete_item(
-                item=existing_profile["id"],
-                partition_key=existing_profile["clientID"]
-            )
-            return True
+            with metered(self.container_name, "delete") as hook:
+                self.container.delete_item(
+                    item=existing_profile["id"],
+                    partition_key=self.partition_key_value(existing_profile),
+                    response_hook=hook
+                )
         except Exception as e:
             print(f"An error occurred while deleting: {e}")
             return False
+        unindex_name(self.container_name, client_id)
+        return True
+
+
+    def list_prospects(self, prefix="PRO", status=None, page_size=50, continuation_token=None,
+                       fields=PROSPECT_LIST_FIELDS):
+        """
+        Returns one page of the customer profiles whose clientID starts with `prefix`, projected server side
+        on `fields`: memory and latency depend on the page size, not on the number of prospects.
+
+        Args:
+        - prefix (str): The clientID prefix.
+        - status (str): Only the profiles at this status, if given.
+        - page_size (int): Maximum number of profiles returned.
+        - continuation_token (str): Token returned with the previous page.
+        - fields (tuple): The top-level fields returned (missing fields are omitted).
+
+        Returns:
+        - (list, str): The profiles and the continuation token of the next page (None on the last page).
+        """
+        query, parameters = prospect_list_query(fields, status, prefix)
+        with metered(self.container_name, "query", query, cross_partition=True) as hook:
+            pager = self.container.query_items(
+                query=query,
+                parameters=parameters,
+                enable_cross_partition_query=True,
+                max_item_count=page_size,
+                response_hook=hook
+            ).by_page(continuation_token)
+            # A cross-partition page can come back empty while other partitions still have results
+            items = []
+            for page in pager:
+                items = list(page)
+                if items:
+                    break
+        return items, pager.continuation_token
 
-    
     def load_all_prospects(self):
         """
         Retrieves all customer profiles from Cosmos DB where clientID starts with 'PRO'.
@@ -160,15 +404,234 @@ class CRMStore:
         Returns:
         - list: A list of all matching customer profiles.
         """
-        query = "SELECT * FROM c WHERE STARTSWITH(c.clientID, 'PRO')"
+        query = ALL_PROSPECTS_QUERY
         try:
-            items = list(self.container.query_items(
-                query=query,
-                enable_cross_partition_query=True
-            ))
+            with metered(self.container_name, "query", query, cross_partition=True) as hook:
+                items = list(self.container.query_items(
+                    query=query,
+                    enable_cross_partition_query=True,
+                    response_hook=hook
+                ))
         except Exception as e:
             print(f"An error occurred while loading all prospects: {e}")
             return False  
         return items
 
 
+class CachedTokenCredential:
+    """
+    Wraps a TokenCredential and caches the access token per scope, refreshing it
+    `refresh_margin` seconds before it expires so that no request waits on token acquisition.
+    """
+    def __init__(self, credential=None, refresh_margin=300):
+        self._credential = credential or DefaultAzureCredential()
+        self._refresh_margin = refresh_margin
+        self._tokens = {}
+        self._lock = threading.Lock()
+
+    def get_token(self, *scopes, **kwargs):
+        # Claims challenges (CAE) must always go to the underlying credential.
+        if kwargs.get("claims"):
+            return self._credential.get_token(*scopes, **kwargs)
+
+        key = (scopes, kwargs.get("tenant_id"))
+        token = self._tokens.get(key)
+        if token is None or token.expires_on - self._refresh_margin <= time.time():
+            with self._lock:
+                token = self._tokens.get(key)
+                if token is None or token.expires_on - self._refresh_margin <= time.time():
+                    token = self._credential.get_token(*scopes, **kwargs)
+                    self._tokens[key] = token
+        return token
+
+    def close(self):
+        close = getattr(self._credential, "close", None)
+        if close:
+            close()
+
+
+def _use_local_backend():
+    # CRM_BACKEND: "cosmos" (Azure Cosmos DB, default) or "sqlite" (embedded database at CRM_SQLITE_PATH)
+    return os.getenv("CRM_BACKEND", "cosmos").lower() == "sqlite"
+
+
+# Process-wide registry: one credential, one CosmosClient per endpoint and one CRMStore per container.
+_registry_lock = threading.RLock()
+_credential = None
+_cosmos_clients = {}
+_crm_stores = {}
+_name_indexes = {}
+
+
+def get_credential():
+    """
+    Returns the shared, token-caching credential used for every Cosmos DB client of the process.
+    """
+    global _credential
+    if _credential is None:
+        with _registry_lock:
+            if _credential is None:
+                _credential = CachedTokenCredential(
+                    refresh_margin=int(os.getenv("AZURE_TOKEN_REFRESH_MARGIN_SECONDS", "300"))
+                )
+    return _credential
+
+
+def get_cosmos_client(url):
+    """
+    Returns the shared Cosmos client of the account: one connection pool for every container.
+    """
+    client = _cosmos_clients.get(url)
+    if client is not None:
+        return client
+    with _registry_lock:
+        client = _cosmos_clients.get(url)
+        if client is None:
+            client = CosmosClient(url, credential=get_credential())
+            _cosmos_clients[url] = client
+    return client
+
+
+def get_crm_store(container_name=None):
+    """
+    Returns the shared CRMStore for the given container (defaults to COSMOSDB_CONTAINER_CLIENT_NAME).
+    The first call for a container provisions the database and the container, later calls are free.
+    With CRM_BACKEND=sqlite the store is a local_store.SQLiteCRMStore on the embedded database instead.
+
+    Args:
+    - container_name (str): Optional container name override.
+
+    Returns:
+    - CRMStore: The pooled store.
+    """
+    container_name = container_name or os.getenv("COSMOSDB_CONTAINER_CLIENT_NAME") or ""
+    store = _crm_stores.get(container_name)
+    if store is not None:
+        return store
+
+    with _registry_lock:
+        store = _crm_stores.get(container_name)
+        if store is None and _use_local_backend():
+            from local_store import SQLiteCRMStore, get_local_database
+            store = SQLiteCRMStore(get_local_database(), container_name)
+            _crm_stores[container_name] = store
+        elif store is None:
+            cosmosdb_endpoint = os.getenv("COSMOSDB_ENDPOINT") or ""
+            crm_database_name = os.getenv("COSMOSDB_DATABASE_NAME") or ""
+            store = CRMStore(
+                url=cosmosdb_endpoint,
+                key=None,
+                database_name=crm_database_name,
+                container_name=container_name,
+                client=get_cosmos_client(cosmosdb_endpoint),
+            )
+            store.partition_key_path  # resolve the container partitioning during provisioning
+            get_name_index(container_name)  # and build its name index if it is new
+            _crm_stores[container_name] = store
+            logging.info(f"CRMStore provisioned for container '{container_name}'")
+    return store
+
+
+def get_name_index(container_name):
+    """
+    Returns the CosmosNameIndex of a CRM container, stored in the container "<container_name>-names"
+    (partitioned on /trigram, created and built from the CRM container on first use).
+    """
+    index = _name_indexes.get(container_name)
+    if index is not None:
+        return index
+    with _registry_lock:
+        index = _name_indexes.get(container_name)
+        if index is None:
+            database = get_cosmos_client(os.getenv("COSMOSDB_ENDPOINT") or "").get_database_client(
+                os.getenv("COSMOSDB_DATABASE_NAME") or ""
+            )
+            index_container_name = f"{container_name}{NAME_INDEX_CONTAINER_SUFFIX}"
+            container = database.create_container_if_not_exists(
+                id=index_container_name,
+                partition_key=PartitionKey(path="/trigram"),
+                offer_throughput=400
+            )
+            index = CosmosNameIndex(container, index_container_name)
+            if index.stale():
+                # Profiles written before the index existed are found by name from the first search
+                index.rebuild(profile_names(database.get_container_client(container_name)))
+            _name_indexes[container_name] = index
+    return index
+
+
+def profile_names(container, page_size=1000):
+    """
+    Streams (clientID, fullName) of every profile of a CRM container, page by page.
+    """
+    pages = container.query_items(
+        query=PROFILE_NAMES_QUERY,
+        enable_cross_partition_query=True,
+        max_item_count=page_size
+    ).by_page()
+    for page in pages:
+        for item in page:
+            yield item.get("clientID"), item.get("fullName")
+
+
+def indexes_name(profile, operations=None):
+    """
+    Whether a write of `profile` updates the name index: a patch (`operations`) that does not touch
+    the fullName leaves it as is, without reading the indexed name.
+    """
+    if operations is not None and not any(operation.get("path") in ("", "/fullName") for operation in operations):
+        return False
+    return bool(profile and profile.get("clientID"))
+
+
+def index_name(container_name, profile, operations=None):
+    """
+    Updates the name index after a write of `profile`. Best effort: the profile is written, an index
+    failure is logged (the name is indexed again by its next write or by rebuild_name_index.py).
+    """
+    if not indexes_name(profile, operations):
+        return
+    try:
+        get_name_index(container_name).update(profile["clientID"], profile.get("fullName"))
+    except Exception as e:
+        logging.error(f"Name index of '{container_name}' not updated for {profile['clientID']}: {str(e)}")
+
+
+def unindex_name(container_name, client_id):
+    """
+    Removes a deleted profile from the name index (best effort, like index_name).
+    """
+    try:
+        get_name_index(container_name).remove(client_id)
+    except Exception as e:
+        logging.error(f"Name index of '{container_name}' not updated for {client_id}: {str(e)}")
+
+
+def set_crm_store(store, container_name=None):
+    """
+    Injects a store into the registry (e.g. a pre-built store in benchmarks or notebooks).
+    """
+    container_name = container_name or os.getenv("COSMOSDB_CONTAINER_CLIENT_NAME") or ""
+    with _registry_lock:
+        _crm_stores[container_name] = store
+
+
+def close_crm_stores():
+    """
+    Releases the pooled Cosmos clients, the shared credential and the local databases (called at app shutdown).
+    """
+    global _credential
+    with _registry_lock:
+        if _use_local_backend():
+            from local_store import close_local_databases
+            close_local_databases()
+        _name_indexes.clear()
+        for client in _cosmos_clients.values():
+            close = getattr(client, "close", None)
+            if close:
+                close()
+        _cosmos_clients.clear()
+        _crm_stores.clear()
+        if _credential is not None:
+            _credential.close()
+            _credential = None
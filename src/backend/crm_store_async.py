@@ -0,0 +1,371 @@
+from azure.cosmos.aio import CosmosClient
+from azure.cosmos import PartitionKey, exceptions
+from azure.identity.aio import DefaultAzureCredential
+import os
+import asyncio
+import time
+import logging
+
+from crm_store import (ALL_PROSPECTS_QUERY, CLIENT_ID_QUERY, NAME_INDEX_CONTAINER_SUFFIX, PARTITION_KEY_PATH,
+                       PROFILE_NAMES_QUERY, PROSPECT_LIST_FIELDS, PreconditionFailedError, _use_local_backend,
+                       client_id_parameters, indexes_name, prospect_list_query, server_side_patch, update_operations,
+                       write_conditions)
+from name_index import AsyncCosmosNameIndex
+from patching import apply_json_patch
+from telemetry import traced_store
+from request_charges import metered
+
+
+@traced_store("cosmosdb")
+class AsyncCRMStore:
+    """
+    asyncio flavour of CRMStore backed by azure.cosmos.aio, used by the async request path.
+    Call `initialize()` once before use.
+    """
+    def __init__(self, url, key, database_name, container_name, client=None):
+        self.client = client or CosmosClient(url, credential=key)
+        self.database_name = database_name
+        self.container_name = container_name
+        self.db = None
+        self.container = None
+        self.name_index = None
+        self.partition_key_path = PARTITION_KEY_PATH
+
+    async def initialize(self, provision=True):
+        if provision:
+            self.db = await self.client.create_database_if_not_exists(id=self.database_name)
+            self.container = await self.db.create_container_if_not_exists(
+                id=self.container_name,
+                partition_key=PartitionKey(path=PARTITION_KEY_PATH),
+                offer_throughput=400
+            )
+        else:
+            self.db = self.client.get_database_client(self.database_name)
+            self.container = self.db.get_container_client(self.container_name)
+        # Existing containers keep their partitioning until migrated with migrate_crm_container.py
+        self.partition_key_path = (await self.container.read())["partitionKey"]["paths"][0]
+        self.name_index = await self._provision_name_index()
+        return self
+
+    async def _provision_name_index(self):
+        # The name index container "<container>-names" (see crm_store.get_name_index), built if new
+        index_container_name = f"{self.container_name}{NAME_INDEX_CONTAINER_SUFFIX}"
+        container = await self.db.create_container_if_not_exists(
+            id=index_container_name,
+            partition_key=PartitionKey(path="/trigram"),
+            offer_throughput=400
+        )
+        index = AsyncCosmosNameIndex(container, index_container_name)
+        if await index.stale():
+            await index.rebuild(self._profile_names())
+        return index
+
+    async def _profile_names(self):
+        async for item in self.container.query_items(query=PROFILE_NAMES_QUERY):
+            yield item.get("clientID"), item.get("fullName")
+
+    def partition_key_value(self, profile):
+        return profile.get(self.partition_key_path.lstrip("/"))
+
+    async def _query(self, query, parameters=None):
+        # Cross-partition query (the aio client fans out without enable_cross_partition_query)
+        with metered(self.container_name, "query", query, cross_partition=True) as hook:
+            return [item async for item in self.container.query_items(
+                query=query, parameters=parameters, response_hook=hook
+            )]
+
+    async def create_customer_profile(self, customer_profile):
+        """
+        Saves the customer profile to Cosmos DB.
+
+        Args:
+        - customer_profile (dict): The customer profile to save.
+        """
+        try:
+            with metered(self.container_name, "create") as hook:
+                created_user = await self.container.create_item(body=customer_profile, response_hook=hook)
+        except Exception as e:
+            logging.error(f"An error occurred: {e}")
+            return None
+        await self._index_name(created_user)
+        return created_user
+
+    async def _index_name(self, profile, operations=None):
+        # Best effort, like crm_store.index_name: the profile is written
+        if not indexes_name(profile, operations):
+            return
+        try:
+            await self.name_index.update(profile["clientID"], profile.get("fullName"))
+        except Exception as e:
+            logging.error(f"Name index of '{self.container_name}' not updated for {profile['clientID']}: {str(e)}")
+
+    async def _unindex_name(self, client_id):
+        try:
+            await self.name_index.remove(client_id)
+        except Exception as e:
+            logging.error(f"Name index of '{self.container_name}' not updated for {client_id}: {str(e)}")
+
+    async def search_customer_profiles_by_name(self, full_name, limit=10):
+        """
+        Ranked fuzzy search of the customer profiles by name (see CRMStore.search_customer_profiles_by_name).
+        """
+        return await self.name_index.search(full_name, limit)
+
+    async def get_customer_profile_by_full_name(self, full_name):
+        """
+        Retrieves the customer profile best matching the customer's full name.
+        """
+        matches = await self.search_customer_profiles_by_name(full_name, limit=1)
+        return await self.get_customer_profile_by_client_id(matches[0]["clientID"]) if matches else None
+
+    async def get_customer_profile_by_client_id(self, client_id):
+        """
+        Retrieves a customer profile based on a client_id.
+        """
+        query, parameters = CLIENT_ID_QUERY, client_id_parameters(client_id)
+        if self.partition_key_path == "/clientID":
+            try:
+                with metered(self.container_name, "read") as hook:
+                    return await self.container.read_item(item=client_id, partition_key=client_id, response_hook=hook)
+            except exceptions.CosmosResourceNotFoundError:
+                pass
+            with metered(self.container_name, "query", query) as hook:
+                items = [item async for item in self.container.query_items(
+                    query=query, parameters=parameters, partition_key=client_id, response_hook=hook
+                )]
+            return items[0] if items else None
+
+        items = await self._query(query, parameters)
+        return items[0] if items else None
+
+    async def update_customer_profile(self, client_id: str, updated_data: dict):
+        """
+        Updates a customer profile with new data.
+
+        Returns:
+            dict or None: The updated profile if successful, or None if the profile was not found.
+        """
+        existing_profile = await self.get_customer_profile_by_client_id(client_id)
+        if not existing_profile:
+            logging.info(f"No profile found for clientID: {client_id}")
+            return None
+
+        operations = update_operations(existing_profile, updated_data)
+        if not operations:
+            return existing_profile
+        try:
+            return await self.patch_customer_profile(client_id, operations, current=existing_profile)
+        except Exception as e:
+            logging.error(f"An error occurred while updating: {e}")
+            return None
+
+    async def patch_customer_profile(self, client_id: str, operations: list, etag: str = None, current: dict = None):
+        """
+        Applies a JSON Patch to a customer profile with a Cosmos DB partial document update
+        (see CRMStore.patch_customer_profile).
+        """
+        if not operations:
+            return current or await self.get_customer_profile_by_client_id(client_id)
+
+        cosmos_operations = server_side_patch(operations, self.partition_key_path)
+        if cosmos_operations is not None:
+            try:
+                with metered(self.container_name, "patch") as hook:
+                    patched = await self.container.patch_item(
+                        item=client_id, partition_key=client_id, patch_operations=cosmos_operations,
+                        response_hook=hook, **write_conditions(etag)
+                    )
+            except exceptions.CosmosAccessConditionFailedError as e:
+                raise PreconditionFailedError(f"Profile {client_id} was modified concurrently") from e
+            except exceptions.CosmosResourceNotFoundError:
+                pass
+            else:
+                await self._index_name(patched, operations)
+                return patched
+
+        current = current or await self.get_customer_profile_by_client_id(client_id)
+        return await self.replace_customer_profile(apply_json_patch(current, operations), etag=etag)
+
+    async def replace_customer_profile(self, profile: dict, etag: str = None):
+        """
+        Replaces a whole customer profile, only if it is unchanged since `etag` was read.
+
+        Raises:
+            PreconditionFailedError: If the stored profile no longer has this ETag.
+        """
+        try:
+            with metered(self.container_name, "replace") as hook:
+                replaced = await self.container.replace_item(item=profile, body=profile, response_hook=hook,
+                                                             **write_conditions(etag))
+        except exceptions.CosmosAccessConditionFailedError as e:
+            raise PreconditionFailedError(f"Profile {profile.get('clientID')} was modified concurrently") from e
+        await self._index_name(replaced)
+        return replaced
+
+    async def delete_customer_profile(self, client_id: str) -> bool:
+        """
+        Deletes a customer profile by clientID.
+        """
+        existing_profile = await self.get_customer_profile_by_client_id(client_id)
+        if not existing_profile:
+            logging.info(f"No profile found for clientID: {client_id}")
+            return False
+
+        try:
+            with metered(self.container_name, "delete") as hook:
+                await self.container.delete_item(
+                    item=existing_profile["id"], partition_key=self.partition_key_value(existing_profile), response_hook=hook
+                )
+        except Exception as e:
+            logging.error(f"An error occurred while deleting: {e}")
+            return False
+        await self._unindex_name(client_id)
+        return True
+
+    async def find_client_ids(self, prefix="PRO", status=None):
+        """
+        Returns the clientIDs starting with `prefix`, only those at the given status if any
+        (e.g. the prospects stuck at a step, to re-run them in batch).
+        """
+        query = "SELECT VALUE c.clientID FROM c WHERE STARTSWITH(c.clientID, @prefix)"
+        parameters = [{"name": "@prefix", "value": prefix}]
+        if status is not None:
+            query += " AND c.status = @status"
+            parameters.append({"name": "@status", "value": status})
+        return await self._query(query, parameters)
+
+    async def list_prospects(self, prefix="PRO", status=None, page_size=50, continuation_token=None,
+                             fields=PROSPECT_LIST_FIELDS):
+        """
+        Returns one page of the customer profiles whose clientID starts with `prefix`, projected on `fields`,
+        and the continuation token of the next page (see CRMStore.list_prospects).
+        """
+        query, parameters = prospect_list_query(fields, status, prefix)
+        with metered(self.container_name, "query", query, cross_partition=True) as hook:
+            pager = self.container.query_items(
+                query=query, parameters=parameters, max_item_count=page_size, response_hook=hook
+            ).by_page(continuation_token)
+            items = []
+            async for page in pager:
+                items = [item async for item in page]
+                if items:
+                    break
+        return items, pager.continuation_token
+
+    async def load_all_prospects(self):
+        """
+        Retrieves all customer profiles where clientID starts with 'PRO'.
+        """
+        try:
+            return await self._query(ALL_PROSPECTS_QUERY)
+        except Exception as e:
+            logging.error(f"An error occurred while loading all prospects: {e}")
+            return False
+
+
+class AsyncCachedTokenCredential:
+    """
+    Async counterpart of crm_store.CachedTokenCredential: caches the token per scope and
+    refreshes it `refresh_margin` seconds before expiry.
+    """
+    def __init__(self, credential=None, refresh_margin=300):
+        self._credential = credential or DefaultAzureCredential()
+        self._refresh_margin = refresh_margin
+        self._tokens = {}
+        self._lock = asyncio.Lock()
+
+    async def get_token(self, *scopes, **kwargs):
+        if kwargs.get("claims"):
+            return await self._credential.get_token(*scopes, **kwargs)
+
+        key = (scopes, kwargs.get("tenant_id"))
+        token = self._tokens.get(key)
+        if token is None or token.expires_on - self._refresh_margin <= time.time():
+            async with self._lock:
+                token = self._tokens.get(key)
+                if token is None or token.expires_on - self._refresh_margin <= time.time():
+                    token = await self._credential.get_token(*scopes, **kwargs)
+                    self._tokens[key] = token
+        return token
+
+    async def close(self):
+        await self._credential.close()
+
+
+# Event-loop wide registry, populated at app startup (aio clients must be created inside the running loop).
+_async_credential = None
+_async_cosmos_client = None
+_async_crm_stores = {}
+_async_registry_lock = None
+
+
+def _registry_lock():
+    global _async_registry_lock
+    if _async_registry_lock is None:
+        _async_registry_lock = asyncio.Lock()
+    return _async_registry_lock
+
+
+def get_async_cosmos_client():
+    """
+    Returns the shared aio Cosmos client of the event loop (created on first use, inside the running loop).
+    """
+    global _async_credential, _async_cosmos_client
+    if _async_cosmos_client is None:
+        _async_credential = AsyncCachedTokenCredential(
+            refresh_margin=int(os.getenv("AZURE_TOKEN_REFRESH_MARGIN_SECONDS", "300"))
+        )
+        _async_cosmos_client = CosmosClient(os.getenv("COSMOSDB_ENDPOINT") or "", credential=_async_credential)
+    return _async_cosmos_client
+
+
+async def get_async_crm_store(container_name=None):
+    """
+    Returns the shared AsyncCRMStore for the given container, provisioning it on first use
+    (a local_store.AsyncSQLiteCRMStore with CRM_BACKEND=sqlite).
+    """
+    container_name = container_name or os.getenv("COSMOSDB_CONTAINER_CLIENT_NAME") or ""
+    store = _async_crm_stores.get(container_name)
+    if store is not None:
+        return store
+
+    async with _registry_lock():
+        store = _async_crm_stores.get(container_name)
+        if store is None and _use_local_backend():
+            from local_store import AsyncSQLiteCRMStore, get_local_database
+            store = _async_crm_stores[container_name] = AsyncSQLiteCRMStore(get_local_database(), container_name)
+        elif store is None:
+            store = AsyncCRMStore(
+                url=None,
+                key=None,
+                database_name=os.getenv("COSMOSDB_DATABASE_NAME") or "",
+                container_name=container_name,
+                client=get_async_cosmos_client(),
+            )
+            await store.initialize()
+            _async_crm_stores[container_name] = store
+            logging.info(f"AsyncCRMStore provisioned for container '{container_name}'")
+    return store
+
+
+def set_async_crm_store(store, container_name=None):
+    """
+    Injects an async store into the registry (e.g. a stand-in store in benchmarks).
+    """
+    container_name = container_name or os.getenv("COSMOSDB_CONTAINER_CLIENT_NAME") or ""
+    _async_crm_stores[container_name] = store
+
+
+async def close_async_crm_stores():
+    """
+    Closes the pooled aio Cosmos client and credential (called at app shutdown).
+    """
+    global _async_credential, _async_cosmos_client, _async_registry_lock
+    if _async_cosmos_client is not None:
+        await _async_cosmos_client.close()
+    if _async_credential is not None:
+        await _async_credential.close()
+    _async_cosmos_client = None
+    _async_credential = None
+    _async_registry_lock = None
+    _async_crm_stores.clear()
@@ -0,0 +1,288 @@
+from azure.cosmos import CosmosClient, PartitionKey
+import os
+import uuid
+import logging
+from datetime import datetime
+
+from crm_store import get_cosmos_client, _registry_lock, _use_local_backend
+from crm_store_async import get_async_cosmos_client, _registry_lock as _async_registry_lock
+from request_charges import metered
+
+# Kind of history event -> profile field holding the bounded summary of the most recent ones
+EVENT_FIELDS = {"onboarding": "onboarding", "kyc_review": "kyc_reviews"}
+
+# Number of recent events embedded in the profile; the full history lives in the events container
+RECENT_EVENTS = int(os.getenv("PROSPECT_RECENT_EVENTS", "5"))
+
+# Cosmos DB transactional batches accept at most 100 operations
+MAX_BATCH_OPERATIONS = 100
+
+_EVENT_QUERY = "SELECT c.id, c.kind, c.timestamp, c.step, c.action FROM c WHERE c.clientID = @client_id"
+
+
+def new_event(client_id: str, kind: str, step: str, action: str, timestamp: str = None) -> dict:
+    """
+    Builds a history event (one item of the events container).
+
+    Args:
+    - client_id (str): The client the event belongs to (partition key of the events container).
+    - kind (str): "onboarding" or "kyc_review".
+    - step (str): The workflow step / status reached.
+    - action (str): What was done.
+    - timestamp (str): ISO timestamp, defaults to now.
+    """
+    return {
+        "id": uuid.uuid4().hex,
+        "clientID": client_id,
+        "kind": kind,
+        "timestamp": timestamp or datetime.now().isoformat(),
+        "step": step,
+        "action": action,
+    }
+
+
+def summarize(recent: list, events: list, limit: int = None) -> list:
+    """
+    Returns the bounded summary embedded in the profile: `recent` followed by the new `events`,
+    keeping only the last `limit` (default RECENT_EVENTS) entries.
+    """
+    limit = RECENT_EVENTS if limit is None else limit
+    seen = {entry.get("id") for entry in recent}
+    summary = [_summary_entry(entry) for entry in recent]
+    summary += [_summary_entry(event) for event in events if event["id"] not in seen]
+    return summary[-limit:] if limit > 0 else []
+
+
+def _summary_entry(event):
+    return {key: event.get(key) for key in ("id", "timestamp", "step", "action")}
+
+
+def adopt_legacy_entries(client_id: str, kind: str, entries: list):
+    """
+    Gives the history entries embedded in profiles written before the events container an id.
+
+    Returns:
+    - (list, list): The entries (with ids) and the events to append for the legacy ones. Ids are
+      derived from the entry content, so adopting the same entries twice upserts the same events.
+    """
+    adopted, events = [], []
+    for entry in entries:
+        if entry.get("id"):
+            adopted.append(entry)
+            continue
+        timestamp, step, action = entry.get("timestamp", ""), entry.get("step", ""), entry.get("action", "")
+        event_id = uuid.uuid5(uuid.NAMESPACE_URL, f"{client_id}|{kind}|{timestamp}|{step}|{action}").hex
+        event = new_event(client_id, kind, step, action, timestamp)
+        event["id"] = event_id
+        events.append(event)
+        adopted.append({"id": event_id, "timestamp": timestamp, "step": step, "action": action})
+    return adopted, events
+
+
+def _event_query(kind):
+    if kind:
+        return _EVENT_QUERY + " AND c.kind = @kind ORDER BY c.timestamp DESC"
+    return _EVENT_QUERY + " ORDER BY c.timestamp DESC"
+
+
+def _event_parameters(client_id, kind):
+    parameters = [{"name": "@client_id", "value": client_id}]
+    if kind:
+        parameters.append({"name": "@kind", "value": kind})
+    return parameters
+
+
+def _batches(events):
+    for start in range(0, len(events), MAX_BATCH_OPERATIONS):
+        yield [("upsert", (event,)) for event in events[start:start + MAX_BATCH_OPERATIONS]]
+
+
+class EventStore:
+    """
+    Append-only store of the prospects' onboarding and KYC review events, partitioned on /clientID.
+    Appending costs the same whatever the length of the client's history.
+    """
+    def __init__(self, url, key, database_name, container_name, client=None, provision=True):
+        self.client = client or CosmosClient(url, credential=key)
+        self.database_name = database_name
+        self.container_name = container_name
+        if provision:
+            self.db = self.client.create_database_if_not_exists(id=self.database_name)
+            self.container = self.db.create_container_if_not_exists(
+                id=self.container_name,
+                partition_key=PartitionKey(path="/clientID"),
+                offer_throughput=400
+            )
+        else:
+            self.db = self.client.get_database_client(database=self.database_name)
+            self.container = self.db.get_container_client(container=self.container_name)
+
+    def append_events(self, client_id: str, events: list):
+        """
+        Appends the events of a client in transactional batches (one round trip per 100 events).
+
+        Args:
+        - client_id (str): The client the events belong to.
+        - events (list): Events built with new_event().
+        """
+        for batch in _batches(events):
+            with metered(self.container_name, "batch") as hook:
+                self.container.execute_item_batch(batch_operations=batch, partition_key=client_id, response_hook=hook)
+
+    def list_events(self, client_id: str, kind: str = None, page_size: int = 20, continuation_token: str = None):
+        """
+        Returns one page of the history of a client, most recent first.
+
+        Args:
+        - client_id (str): The client to read the history of.
+        - kind (str): Only return events of this kind ("onboarding", "kyc_review"), all kinds if None.
+        - page_size (int): Maximum number of events returned.
+        - continuation_token (str): Token returned with the previous page.
+
+        Returns:
+        - (list, str): The events and the continuation token of the next page (None on the last page).
+        """
+        query = _event_query(kind)
+        with metered(self.container_name, "query", query) as hook:
+            pager = self.container.query_items(
+                query=query,
+                parameters=_event_parameters(client_id, kind),
+                partition_key=client_id,
+                max_item_count=page_size,
+                response_hook=hook
+            ).by_page(continuation_token)
+            try:
+                events = list(next(pager))
+            except StopIteration:
+                return [], None
+        return events, pager.continuation_token
+
+
+class AsyncEventStore:
+    """
+    asyncio flavour of EventStore backed by azure.cosmos.aio. Call `initialize()` once before use.
+    """
+    def __init__(self, database_name, container_name, client):
+        self.client = client
+        self.database_name = database_name
+        self.container_name = container_name
+        self.db = None
+        self.container = None
+
+    async def initialize(self, provision=True):
+        if provision:
+            self.db = await self.client.create_database_if_not_exists(id=self.database_name)
+            self.container = await self.db.create_container_if_not_exists(
+                id=self.container_name,
+                partition_key=PartitionKey(path="/clientID"),
+                offer_throughput=400
+            )
+        else:
+            self.db = self.client.get_database_client(self.database_name)
+            self.container = self.db.get_container_client(self.container_name)
+        return self
+
+    async def append_events(self, client_id: str, events: list):
+        for batch in _batches(events):
+            with metered(self.container_name, "batch") as hook:
+                await self.container.execute_item_batch(batch_operations=batch, partition_key=client_id, response_hook=hook)
+
+    async def list_events(self, client_id: str, kind: str = None, page_size: int = 20, continuation_token: str = None):
+        query = _event_query(kind)
+        with metered(self.container_name, "query", query) as hook:
+            pager = self.container.query_items(
+                query=query,
+                parameters=_event_parameters(client_id, kind),
+                partition_key=client_id,
+                max_item_count=page_size,
+                response_hook=hook
+            ).by_page(continuation_token)
+            try:
+                page = await pager.__anext__()
+            except StopAsyncIteration:
+                return [], None
+            events = [event async for event in page]
+        return events, pager.continuation_token
+
+
+_event_stores = {}
+_async_event_stores = {}
+
+
+def _events_container_name(container_name=None):
+    return container_name or os.getenv("COSMOSDB_CONTAINER_EVENTS_NAME") or "prospectevents"
+
+
+def get_event_store(container_name=None):
+    """
+    Returns the shared EventStore (container COSMOSDB_CONTAINER_EVENTS_NAME), provisioning it on first use.
+    """
+    container_name = _events_container_name(container_name)
+    store = _event_stores.get(container_name)
+    if store is not None:
+        return store
+
+    with _registry_lock:
+        store = _event_stores.get(container_name)
+        if store is None and _use_local_backend():
+            from local_store import SQLiteEventStore, get_local_database
+            store = _event_stores[container_name] = SQLiteEventStore(get_local_database(), container_name)
+        elif store is None:
+            store = EventStore(
+                url=None,
+                key=None,
+                database_name=os.getenv("COSMOSDB_DATABASE_NAME") or "",
+                container_name=container_name,
+                client=get_cosmos_client(os.getenv("COSMOSDB_ENDPOINT") or ""),
+            )
+            _event_stores[container_name] = store
+            logging.info(f"EventStore provisioned for container '{container_name}'")
+    return store
+
+
+def set_event_store(store, container_name=None):
+    """
+    Injects an event store into the registry (e.g. a stand-in store in benchmarks).
+    """
+    _event_stores[_events_container_name(container_name)] = store
+
+
+async def get_async_event_store(container_name=None):
+    """
+    Returns the shared AsyncEventStore, provisioning it on first use.
+    """
+    container_name = _events_container_name(container_name)
+    store = _async_event_stores.get(container_name)
+    if store is not None:
+        return store
+
+    async with _async_registry_lock():
+        store = _async_event_stores.get(container_name)
+        if store is None and _use_local_backend():
+            from local_store import AsyncSQLiteEventStore, get_local_database
+            store = _async_event_stores[container_name] = AsyncSQLiteEventStore(get_local_database(), container_name)
+        elif store is None:
+            store = AsyncEventStore(
+                database_name=os.getenv("COSMOSDB_DATABASE_NAME") or "",
+                container_name=container_name,
+                client=get_async_cosmos_client(),
+            )
+            await store.initialize()
+            _async_event_stores[container_name] = store
+            logging.info(f"AsyncEventStore provisioned for container '{container_name}'")
+    return store
+
+
+def set_async_event_store(store, container_name=None):
+    """
+    Injects an async event store into the registry (e.g. a stand-in store in benchmarks).
+    """
+    _async_event_stores[_events_container_name(container_name)] = store
+
+
+def clear_event_stores():
+    """
+    Forgets the pooled event stores (their Cosmos clients are closed with the CRM stores').
+    """
+    _event_stores.clear()
+    _async_event_stores.clear()
@@ -0,0 +1,339 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+import sqlite3
+import logging
+import threading
+
+# Job lifecycle: queued -> running -> succeeded | failed (a running job whose lease expired is queued again)
+QUEUED, RUNNING, SUCCEEDED, FAILED = "queued", "running", "succeeded", "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    lease_expires_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_by_status ON jobs (status, created_at);
+"""
+
+
+class JobQueue:
+    """
+    Durable job queue backed by SQLite: jobs survive dropped connections and worker restarts.
+    Good enough for one host (several workers share the file); swap for a managed queue to scale out.
+
+    Args:
+    - path (str): The SQLite database file (":memory:" for a process-local queue).
+    - lease_seconds (float): How long a worker owns a job without renewing its lease (see renew) before
+      the job is considered lost and queued again.
+    - max_attempts (int): Attempts before a job that keeps getting lost is marked failed.
+    """
+    def __init__(self, path, lease_seconds=900, max_attempts=2):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        if path != ":memory:":
+            self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+
+    def enqueue(self, kind: str, payload: dict) -> str:
+        """
+        Adds a job and returns its id.
+        """
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO jobs (id, kind, status, payload, created_at) VALUES (?, ?, ?, ?, ?)",
+                (job_id, kind, QUEUED, json.dumps(payload), time.time())
+            )
+        return job_id
+
+    def claim(self):
+        """
+        Leases the oldest runnable job (queued, or running with an expired lease) to the caller.
+
+        Returns:
+        - dict: The job (with its decoded payload), or None if there is nothing to run.
+        """
+        now = time.time()
+        with self._lock:
+            # Jobs lost too many times (e.g. crashing the worker) are not retried forever
+            self._db.execute(
+                "UPDATE jobs SET status = ?, error = ?, finished_at = ? "
+                "WHERE status = ? AND lease_expires_at < ? AND attempts >= ?",
+                (FAILED, "Job lease expired too many times", now, RUNNING, now, self.max_attempts)
+            )
+            row = self._db.execute(
+                "UPDATE jobs SET status = ?, attempts = attempts + 1, started_at = ?, lease_expires_at = ? "
+                "WHERE id = (SELECT id FROM jobs WHERE status = ? OR (status = ? AND lease_expires_at < ?) "
+                "            ORDER BY created_at LIMIT 1) "
+                "RETURNING *",
+                (RUNNING, now, now + self.lease_seconds, QUEUED, RUNNING, now)
+            ).fetchone()
+        return _job(row) if row else None
+
+    def renew(self, job_id: str, attempt: int) -> bool:
+        """
+        Extends the lease of a running job by lease_seconds.
+
+        Args:
+        - job_id (str): The job.
+        - attempt (int): The attempt of the caller (job["attempts"] when claimed): a job claimed
+          again since is not renewed.
+
+        Returns:
+        - bool: Whether the caller still owns the job.
+        """
+        with self._lock:
+            cursor = self._db.execute(
+                "UPDATE jobs SET lease_expires_at = ? WHERE id = ? AND status = ? AND attempts = ?",
+                (time.time() + self.lease_seconds, job_id, RUNNING, attempt)
+            )
+        return cursor.rowcount == 1
+
+    def complete(self, job_id: str, result):
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = ?, result = ?, finished_at = ?, lease_expires_at = NULL WHERE id = ?",
+                (SUCCEEDED, json.dumps(result), time.time(), job_id)
+            )
+
+    def set_progress(self, job_id: str, result):
+        """
+        Stores the partial result of a running job (e.g. the items of a batch done so far) and renews
+        its lease, so that long jobs reporting progress are not taken for lost.
+        """
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET result = ?, lease_expires_at = ? WHERE id = ? AND status = ?",
+                (json.dumps(result), time.time() + self.lease_seconds, job_id, RUNNING)
+            )
+
+    def fail(self, job_id: str, error: str):
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = ?, error = ?, finished_at = ?, lease_expires_at = NULL WHERE id = ?",
+                (FAILED, error, time.time(), job_id)
+            )
+
+    def release(self, job_id: str):
+        """
+        Puts a running job back in the queue (worker shutting down before the job finished).
+        """
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = ?, attempts = MAX(attempts - 1, 0), lease_expires_at = NULL "
+                "WHERE id = ? AND status = ?",
+                (QUEUED, job_id, RUNNING)
+            )
+
+    def get(self, job_id: str):
+        """
+        Returns the job with its status, payload and result, or None if unknown.
+        """
+        with self._lock:
+            row = self._db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return _job(row) if row else None
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def _job(row):
+    job = dict(row)
+    job["payload"] = json.loads(job["payload"])
+    job["result"] = json.loads(job["result"]) if job["result"] is not None else None
+    return job
+
+
+def job_status(job: dict) -> dict:
+    """
+    The public view of a job, as returned by GET /jobs/{id}.
+    """
+    return {
+        "job_id": job["id"],
+        "kind": job["kind"],
+        "status": job["status"],
+        "attempts": job["attempts"],
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"],
+        "result": job["result"],
+        "error": job["error"],
+    }
+
+
+class JobWorkerPool:
+    """
+    Runs queued jobs on the event loop with at most `concurrency` jobs in flight. The lease of a
+    running job is renewed every third of the lease duration, so a long run is not claimed again.
+
+    Args:
+    - queue (JobQueue): The queue to take jobs from.
+    - handlers (dict): Job kind -> async function(payload, progress) returning the (JSON serializable)
+      result; `await progress(partial_result)` publishes a partial result while the job runs.
+    - concurrency (int): Number of workers.
+    - poll_interval (float): Seconds between polls when idle (jobs enqueued by another process).
+    """
+    def __init__(self, queue, handlers, concurrency=4, poll_interval=1.0):
+        self.queue = queue
+        self.handlers = handlers
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self._wakeup = None
+        self._workers = []
+
+    def start(self):
+        self._wakeup = asyncio.Event()
+        self._workers = [asyncio.create_task(self._work(i)) for i in range(self.concurrency)]
+        logging.info(f"Job workers started: {self.concurrency}")
+
+    def notify(self):
+        """
+        Wakes an idle worker up (call after enqueuing).
+        """
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def stop(self):
+        """
+        Cancels the workers; the jobs they were running go back to the queue.
+        """
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def _work(self, worker_id):
+        while True:
+            job = await asyncio.to_thread(self.queue.claim)
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            logging.info(f"Worker {worker_id} running job {job['id']} ({job['kind']}, attempt {job['attempts']})")
+            async def progress(partial_result, job_id=job["id"]):
+                await asyncio.to_thread(self.queue.set_progress, job_id, partial_result)
+
+            lease = asyncio.create_task(self._renew_lease(job))
+            try:
+                result = await self.handlers[job["kind"]](job["payload"], progress)
+            except asyncio.CancelledError:
+                await asyncio.to_thread(self.queue.release, job["id"])
+                raise
+            except Exception as e:
+                logging.error(f"Job {job['id']} failed: {str(e)}")
+                await asyncio.to_thread(self.queue.fail, job["id"], f"{job['kind']} failed with error: {str(e)}")
+            else:
+                await asyncio.to_thread(self.queue.complete, job["id"], result)
+            finally:
+                lease.cancel()
+
+    async def _renew_lease(self, job):
+        while True:
+            await asyncio.sleep(self.queue.lease_seconds / 3)
+            if not await asyncio.to_thread(self.queue.renew, job["id"], job["attempts"]):
+                logging.warning(f"Job {job['id']} lease lost: it was claimed again by another worker")
+                return
+
+
+async def run_batch(items, run_item, concurrency, progress=None, progress_interval=1.0):
+    """
+    Runs `run_item(item)` over the items with at most `concurrency` runs in flight; a failing item
+    does not stop the others.
+
+    Args:
+    - items (list): The items (e.g. clientIDs).
+    - run_item: async function(item) returning the item result (a dict).
+    - concurrency (int): Maximum number of items processed at the same time.
+    - progress: async function(report) called with the report so far, at most every `progress_interval` seconds.
+
+    Returns:
+    - dict: The aggregate report, with the per-item results in "items" (in the order of `items`).
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    results = [None] * len(items)
+    started = time.perf_counter()
+    last_progress = started
+
+    def report():
+        done = [r for r in results if r is not None]
+        duration = time.perf_counter() - started
+        final_statuses = {}
+        for r in done:
+            if r["outcome"] == SUCCEEDED:
+                final_statuses[r.get("final_status")] = final_statuses.get(r.get("final_status"), 0) + 1
+        return {
+            "total": len(items),
+            "done": len(done),
+            "succeeded": sum(1 for r in done if r["outcome"] == SUCCEEDED),
+            "failed": sum(1 for r in done if r["outcome"] == FAILED),
+            # items whose run stopped early with a partial result (e.g. over its budget)
+            "partial": sum(1 for r in done if r.get("run_status") == "partial"),
+            "concurrency": concurrency,
+            "duration_s": round(duration, 3),
+            "items_per_minute": round(len(done) / duration * 60, 1) if duration > 0 else 0.0,
+            "final_statuses": final_statuses,
+            "items": [r for r in results if r is not None],
+        }
+
+    async def run(index, item):
+        nonlocal last_progress
+        async with semaphore:
+            item_started = time.perf_counter()
+            try:
+                result = {"item": item, "outcome": SUCCEEDED, **(await run_item(item) or {})}
+            except Exception as e:
+                logging.error(f"Batch item {item} failed: {str(e)}")
+                result = {"item": item, "outcome": FAILED, "error": str(e)}
+            result["duration_ms"] = round((time.perf_counter() - item_started) * 1000, 2)
+            results[index] = result
+        if progress is not None and time.perf_counter() - last_progress >= progress_interval:
+            last_progress = time.perf_counter()
+            await progress(report())
+
+    await asyncio.gather(*(run(i, item) for i, item in enumerate(items)))
+    return report()
+
+
+_job_queue = None
+
+
+def get_job_queue():
+    """
+    Returns the process-wide JobQueue (SQLite file AO_JOBS_DB).
+    """
+    global _job_queue
+    if _job_queue is None:
+        _job_queue = JobQueue(
+            os.getenv("AO_JOBS_DB", "jobs.sqlite3"),
+            lease_seconds=float(os.getenv("AO_JOB_LEASE_SECONDS", "900")),
+            max_attempts=int(os.getenv("AO_JOB_MAX_ATTEMPTS", "2")),
+        )
+    return _job_queue
+
+
+def close_job_queue():
+    global _job_queue
+    if _job_queue is not None:
+        _job_queue.close()
+        _job_queue = None
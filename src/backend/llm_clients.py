@@ -0,0 +1,104 @@
+from openai import AzureOpenAI, AsyncAzureOpenAI, DefaultHttpxClient, DefaultAsyncHttpxClient
+import httpx
+import os
+import threading
+import logging
+
+OPENAI_API_VERSION = "2025-01-01-preview"
+
+# App-lifetime registry: one AzureOpenAI client (and its keep-alive connection pool) per endpoint/deployment.
+_clients_lock = threading.Lock()
+_openai_clients = {}
+_async_openai_clients = {}
+
+
+def _http_client_settings():
+    """
+    Connection-pool limits, keep-alive and timeouts, tunable through environment variables.
+    """
+    limits = httpx.Limits(
+        max_connections=int(os.getenv("OPENAI_MAX_CONNECTIONS", "100")),
+        max_keepalive_connections=int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", "20")),
+        keepalive_expiry=float(os.getenv("OPENAI_KEEPALIVE_EXPIRY_SECONDS", "120")),
+    )
+    timeout = httpx.Timeout(
+        float(os.getenv("OPENAI_TIMEOUT_SECONDS", "300")),
+        connect=float(os.getenv("OPENAI_CONNECT_TIMEOUT_SECONDS", "10")),
+    )
+    return limits, timeout
+
+
+def get_pooled_openai_client(api_key, endpoint, deployment, api_version=OPENAI_API_VERSION):
+    """
+    Returns the shared AzureOpenAI client for an endpoint/deployment, creating it on first use.
+
+    Args:
+    - api_key (str): The API key of the Azure OpenAI resource.
+    - endpoint (str): The Azure OpenAI endpoint.
+    - deployment (str): The model deployment name.
+    - api_version (str): The API version.
+
+    Returns:
+    - AzureOpenAI: The pooled client, reusing warm TLS connections across requests.
+    """
+    cache_key = (endpoint, deployment, api_version)
+    client = _openai_clients.get(cache_key)
+    if client is not None:
+        return client
+
+    with _clients_lock:
+        client = _openai_clients.get(cache_key)
+        if client is None:
+            limits, timeout = _http_client_settings()
+            client = AzureOpenAI(
+                api_key=api_key,
+                api_version=api_version,
+                azure_endpoint=endpoint,
+                azure_deployment=deployment,
+                max_retries=int(os.getenv("OPENAI_MAX_RETRIES", "2")),
+                http_client=DefaultHttpxClient(limits=limits, timeout=timeout),
+            )
+            _openai_clients[cache_key] = client
+            logging.info(f"AzureOpenAI client created for deployment '{deployment}'")
+    return client
+
+
+def get_pooled_async_openai_client(api_key, endpoint, deployment, api_version=OPENAI_API_VERSION):
+    """
+    Async counterpart of get_pooled_openai_client, returning a shared AsyncAzureOpenAI client.
+    Must be called from within the running event loop the client will be used on.
+    """
+    cache_key = (endpoint, deployment, api_version)
+    client = _async_openai_clients.get(cache_key)
+    if client is None:
+        limits, timeout = _http_client_settings()
+        client = AsyncAzureOpenAI(
+            api_key=api_key,
+            api_version=api_version,
+            azure_endpoint=endpoint,
+            azure_deployment=deployment,
+            max_retries=int(os.getenv("OPENAI_MAX_RETRIES", "2")),
+            http_client=DefaultAsyncHttpxClient(limits=limits, timeout=timeout),
+        )
+        _async_openai_clients[cache_key] = client
+        logging.info(f"AsyncAzureOpenAI client created for deployment '{deployment}'")
+    return client
+
+
+async def close_async_openai_clients():
+    """
+    Closes the pooled async clients (called at app shutdown).
+    """
+    for client in _async_openai_clients.values():
+        await client.close()
+    _async_openai_clients.clear()
+
+
+def close_openai_clients():
+    """
+    Closes the pooled clients and their connection pools (called at app shutdown).
+    """
+    with _clients_lock:
+        for client in _openai_clients.values():
+            client.close()
+        _openai_clients.clear()
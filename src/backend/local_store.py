@@ -0,0 +1,397 @@
+import os
+import json
+import asyncio
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+
+from crm_store import PROSPECT_LIST_FIELDS, PreconditionFailedError, check_field_names, update_operations
+from patching import apply_json_patch
+from telemetry import traced_store
+from name_index import NameIndex
+
+# Profiles and history events of every container, keyed like the Cosmos DB containers (clientID)
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS profiles (
+    container TEXT NOT NULL,
+    client_id TEXT NOT NULL,
+    full_name TEXT,
+    status TEXT,
+    etag TEXT NOT NULL,
+    body TEXT NOT NULL,
+    PRIMARY KEY (container, client_id)
+);
+CREATE INDEX IF NOT EXISTS profiles_by_status ON profiles (container, status, client_id);
+CREATE TABLE IF NOT EXISTS events (
+    container TEXT NOT NULL,
+    id TEXT NOT NULL,
+    client_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    body TEXT NOT NULL,
+    PRIMARY KEY (container, id)
+);
+CREATE INDEX IF NOT EXISTS events_by_client ON events (container, client_id, timestamp, id);
+"""
+
+# Fields of the events returned by list_events (as the Cosmos DB event query projects them)
+_EVENT_FIELDS = ("id", "kind", "timestamp", "step", "action")
+
+# Upper bound of the clientIDs starting with a prefix (STARTSWITH as an index range scan)
+_MAX_CHAR = chr(0x10FFFF)
+
+
+class LocalDatabase:
+    """
+    Embedded SQLite database backing the local CRM and event stores: profiles are stored as JSON
+    with their clientID, fullName and status in indexed columns.
+
+    Args:
+    - path (str): The SQLite database file (":memory:" for a process-local database).
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.RLock()
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        if path != ":memory:":
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(_SCHEMA)
+
+    @contextmanager
+    def transaction(self):
+        """
+        Serializes a read-modify-write, across threads (lock) and processes sharing the file (BEGIN IMMEDIATE).
+        """
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.db
+            except BaseException:
+                self.db.execute("ROLLBACK")
+                raise
+            self.db.execute("COMMIT")
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+def _write(profile):
+    # System properties a Cosmos DB write sets
+    stored = dict(profile)
+    stored["_etag"] = uuid.uuid4().hex
+    stored["_ts"] = int(time.time())
+    return stored
+
+
+@traced_store("sqlite")
+class SQLiteCRMStore:
+    """
+    CRMStore backed by the embedded LocalDatabase, for tests, benchmarks and offline demos.
+    Same methods and semantics as CRMStore: point reads by clientID, STARTSWITH(clientID) scans,
+    ranked name search, ETag-conditional patches and replaces. The name index lives in the same database,
+    written in the same transactions as the profiles.
+    """
+    def __init__(self, database, container_name):
+        self.database = database
+        self.container_name = container_name
+        self.partition_key_path = "/clientID"
+        self.name_index = NameIndex(database, container_name)
+
+    def _select(self, where, parameters=(), limit=None):
+        query = f"SELECT body FROM profiles WHERE container = ? AND {where} ORDER BY client_id"
+        if limit is not None:
+            query += f" LIMIT {int(limit)}"
+        with self.database.lock:
+            rows = self.database.db.execute(query, (self.container_name, *parameters)).fetchall()
+        return [json.loads(body) for body, in rows]
+
+    def _store(self, profile, insert=False):
+        body = json.dumps(profile)
+        statement = "INSERT" if insert else "INSERT OR REPLACE"
+        self.database.db.execute(
+            f"{statement} INTO profiles (container, client_id, full_name, status, etag, body) VALUES (?, ?, ?, ?, ?, ?)",
+            (self.container_name, profile["clientID"], profile.get("fullName"), profile.get("status"), profile["_etag"], body)
+        )
+        self.name_index.write(self.database.db, profile["clientID"], profile.get("fullName"))
+        return profile
+
+    def _etag(self, client_id):
+        row = self.database.db.execute(
+            "SELECT etag FROM profiles WHERE container = ? AND client_id = ?", (self.container_name, client_id)
+        ).fetchone()
+        return row[0] if row else None
+
+    def create_customer_profile(self, customer_profile):
+        """
+        Saves a new customer profile (None if the clientID already exists).
+        """
+        try:
+            with self.database.transaction():
+                return self._store(_write(customer_profile), insert=True)
+        except sqlite3.IntegrityError as e:
+            logging.error(f"An error occurred: {e}")
+            return None
+
+    def _name_index(self):
+        # Profiles written before the name index existed are indexed once
+        # (read and rebuilt under the database lock: a profile written in between would be dropped)
+        if self.name_index.stale():
+            with self.database.lock:
+                if self.name_index.stale():
+                    names = self.database.db.execute(
+                        "SELECT client_id, full_name FROM profiles WHERE container = ?", (self.container_name,)
+                    ).fetchall()
+                    self.name_index.rebuild(names)
+        return self.name_index
+
+    def search_customer_profiles_by_name(self, full_name, limit=10):
+        """
+        Ranked fuzzy search of the customer profiles by name (see CRMStore.search_customer_profiles_by_name).
+        """
+        return self._name_index().search(full_name, limit)
+
+    def get_customer_profile_by_full_name(self, full_name):
+        """
+        Retrieves the customer profile best matching the customer's full name.
+        """
+        matches = self.search_customer_profiles_by_name(full_name, limit=1)
+        return self.get_customer_profile_by_client_id(matches[0]["clientID"]) if matches else None
+
+    def get_customer_profile_by_client_id(self, client_id):
+        items = self._select("client_id = ?", (client_id,))
+        return items[0] if items else None
+
+    def update_customer_profile(self, client_id: str, updated_data: dict):
+        existing_profile = self.get_customer_profile_by_client_id(client_id)
+        if not existing_profile:
+            logging.info(f"No profile found for clientID: {client_id}")
+            return None
+
+        operations = update_operations(existing_profile, updated_data)
+        if not operations:
+            return existing_profile
+        return self.patch_customer_profile(client_id, operations, current=existing_profile)
+
+    def patch_customer_profile(self, client_id: str, operations: list, etag: str = None, current: dict = None):
+        """
+        Applies a JSON Patch to a customer profile, only if it still has `etag` (if given).
+
+        Raises:
+            PreconditionFailedError: If `etag` is given and the profile changed.
+        """
+        with self.database.transaction():
+            current = self.get_customer_profile_by_client_id(client_id)
+            if current is None:
+                return None
+            if not operations:
+                return current
+            if etag is not None and current["_etag"] != etag:
+                raise PreconditionFailedError(f"Profile {client_id} was modified concurrently")
+            return self._store(_write(apply_json_patch(current, operations)))
+
+    def replace_customer_profile(self, profile: dict, etag: str = None):
+        """
+        Replaces a whole customer profile, only if it is unchanged since `etag` was read.
+
+        Raises:
+            PreconditionFailedError: If the stored profile no longer has this ETag.
+        """
+        with self.database.transaction():
+            if etag is not None and self._etag(profile["clientID"]) != etag:
+                raise PreconditionFailedError(f"Profile {profile.get('clientID')} was modified concurrently")
+            return self._store(_write(profile))
+
+    def delete_customer_profile(self, client_id: str) -> bool:
+        with self.database.transaction() as db:
+            deleted = db.execute(
+                "DELETE FROM profiles WHERE container = ? AND client_id = ?", (self.container_name, client_id)
+            ).rowcount
+            self.name_index.delete(db, client_id)
+        if not deleted:
+            logging.info(f"No profile found for clientID: {client_id}")
+        return bool(deleted)
+
+    def find_client_ids(self, prefix="PRO", status=None):
+        """
+        Returns the clientIDs starting with `prefix`, only those at the given status if any.
+        """
+        query = "SELECT client_id FROM profiles WHERE container = ? AND client_id >= ? AND client_id < ?"
+        parameters = [self.container_name, prefix, prefix + _MAX_CHAR]
+        if status is not None:
+            query += " AND status = ?"
+            parameters.append(status)
+        with self.database.lock:
+            return [client_id for client_id, in self.database.db.execute(query + " ORDER BY client_id", parameters)]
+
+    def list_prospects(self, prefix="PRO", status=None, page_size=50, continuation_token=None,
+                       fields=PROSPECT_LIST_FIELDS):
+        """
+        Returns one page of the customer profiles whose clientID starts with `prefix`, projected on `fields`,
+        and the continuation token of the next page: the last clientID of the page (keyset pagination).
+        """
+        check_field_names(fields)
+        where = "client_id >= ? AND client_id < ?"
+        parameters = [prefix, prefix + _MAX_CHAR]
+        if continuation_token:
+            where += " AND client_id > ?"
+            parameters.append(continuation_token)
+        if status is not None:
+            where += " AND status = ?"
+            parameters.append(status)
+        # One more row than the page tells whether there is a next page
+        profiles = self._select(where, parameters, limit=page_size + 1)
+        items = [{field: profile[field] for field in fields if field in profile} for profile in profiles[:page_size]]
+        return items, profiles[page_size - 1]["clientID"] if len(profiles) > page_size else None
+
+    def load_all_prospects(self):
+        """
+        Retrieves all customer profiles where clientID starts with 'PRO'.
+        """
+        return self._select("client_id >= ? AND client_id < ?", ("PRO", "PRO" + _MAX_CHAR))
+
+    def close(self):
+        pass
+
+
+class AsyncSQLiteCRMStore:
+    """
+    asyncio flavour of SQLiteCRMStore. Each call runs in a worker thread (asyncio.to_thread): the database
+    lock and the SQLite I/O never block the event loop.
+    """
+    def __init__(self, database, container_name):
+        self._store = SQLiteCRMStore(database, container_name)
+        self.container_name = container_name
+        self.partition_key_path = "/clientID"
+
+    async def initialize(self, provision=True):
+        return self
+
+    async def create_customer_profile(self, customer_profile):
+        return await asyncio.to_thread(self._store.create_customer_profile, customer_profile)
+
+    async def search_customer_profiles_by_name(self, full_name, limit=10):
+        return await asyncio.to_thread(self._store.search_customer_profiles_by_name, full_name, limit)
+
+    async def get_customer_profile_by_full_name(self, full_name):
+        return await asyncio.to_thread(self._store.get_customer_profile_by_full_name, full_name)
+
+    async def get_customer_profile_by_client_id(self, client_id):
+        return await asyncio.to_thread(self._store.get_customer_profile_by_client_id, client_id)
+
+    async def update_customer_profile(self, client_id: str, updated_data: dict):
+        return await asyncio.to_thread(self._store.update_customer_profile, client_id, updated_data)
+
+    async def patch_customer_profile(self, client_id: str, operations: list, etag: str = None, current: dict = None):
+        return await asyncio.to_thread(self._store.patch_customer_profile, client_id, operations, etag=etag, current=current)
+
+    async def replace_customer_profile(self, profile: dict, etag: str = None):
+        return await asyncio.to_thread(self._store.replace_customer_profile, profile, etag=etag)
+
+    async def delete_customer_profile(self, client_id: str) -> bool:
+        return await asyncio.to_thread(self._store.delete_customer_profile, client_id)
+
+    async def find_client_ids(self, prefix="PRO", status=None):
+        return await asyncio.to_thread(self._store.find_client_ids, prefix, status)
+
+    async def list_prospects(self, prefix="PRO", status=None, page_size=50, continuation_token=None,
+                             fields=PROSPECT_LIST_FIELDS):
+        return await asyncio.to_thread(self._store.list_prospects, prefix, status, page_size, continuation_token, fields)
+
+    async def load_all_prospects(self):
+        return await asyncio.to_thread(self._store.load_all_prospects)
+
+
+def _event_token(event):
+    return f"{event['timestamp']}|{event['id']}"
+
+
+class SQLiteEventStore:
+    """
+    EventStore backed by the embedded LocalDatabase. Continuation tokens are the (timestamp, id)
+    of the last event of the page.
+    """
+    def __init__(self, database, container_name):
+        self.database = database
+        self.container_name = container_name
+
+    def append_events(self, client_id: str, events: list):
+        with self.database.transaction():
+            self.database.db.executemany(
+                "INSERT OR REPLACE INTO events (container, id, client_id, kind, timestamp, body) VALUES (?, ?, ?, ?, ?, ?)",
+                [(self.container_name, event["id"], client_id, event["kind"], event["timestamp"], json.dumps(event))
+                 for event in events]
+            )
+
+    def list_events(self, client_id: str, kind: str = None, page_size: int = 20, continuation_token: str = None):
+        """
+        Returns one page of the history of a client, most recent first, and the continuation token
+        of the next page (None on the last page).
+        """
+        query = "SELECT body FROM events WHERE container = ? AND client_id = ?"
+        parameters = [self.container_name, client_id]
+        if kind:
+            query += " AND kind = ?"
+            parameters.append(kind)
+        if continuation_token:
+            timestamp, event_id = continuation_token.split("|", 1)
+            query += " AND (timestamp < ? OR (timestamp = ? AND id < ?))"
+            parameters += [timestamp, timestamp, event_id]
+        query += " ORDER BY timestamp DESC, id DESC LIMIT ?"
+        parameters.append(page_size + 1)
+        with self.database.lock:
+            rows = self.database.db.execute(query, parameters).fetchall()
+        events = []
+        for body, in rows:
+            event = json.loads(body)
+            events.append({field: event.get(field) for field in _EVENT_FIELDS})
+        if len(events) > page_size:
+            return events[:page_size], _event_token(events[page_size - 1])
+        return events, None
+
+
+class AsyncSQLiteEventStore:
+    """
+    asyncio flavour of SQLiteEventStore, running each call in a worker thread like AsyncSQLiteCRMStore.
+    """
+    def __init__(self, database, container_name):
+        self._store = SQLiteEventStore(database, container_name)
+
+    async def initialize(self, provision=True):
+        return self
+
+    async def append_events(self, client_id: str, events: list):
+        await asyncio.to_thread(self._store.append_events, client_id, events)
+
+    async def list_events(self, client_id: str, kind: str = None, page_size: int = 20, continuation_token: str = None):
+        return await asyncio.to_thread(self._store.list_events, client_id, kind, page_size, continuation_token)
+
+
+# One LocalDatabase (connection) per file, shared by the CRM and event stores of the process
+_databases = {}
+_databases_lock = threading.Lock()
+
+
+def get_local_database(path=None):
+    """
+    Returns the shared LocalDatabase of the file CRM_SQLITE_PATH (default "crm.sqlite3").
+    """
+    path = path or os.getenv("CRM_SQLITE_PATH", "crm.sqlite3")
+    with _databases_lock:
+        database = _databases.get(path)
+        if database is None:
+            database = LocalDatabase(path)
+            _databases[path] = database
+            logging.info(f"Local CRM database opened: {path}")
+    return database
+
+
+def close_local_databases():
+    with _databases_lock:
+        for database in _databases.values():
+            database.close()
+        _databases.clear()
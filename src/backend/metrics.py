@@ -0,0 +1,128 @@
+from contextlib import contextmanager
+
+from prometheus_client import (CollectorRegistry, Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest,
+                               disable_created_metrics)
+from prometheus_client.core import CounterMetricFamily
+
+from accountopening.budget import budget_exceeded_counts
+
+# Prometheus metrics of the backend, served by GET /metrics. Updating a series is a dict lookup and an
+# increment under a lock: cheap enough for the request, tool and Cosmos DB hot paths.
+REGISTRY = CollectorRegistry(auto_describe=True)
+# No *_created series: they double the scrape size for a timestamp Prometheus does not use
+disable_created_metrics()
+
+# Model calls take seconds (o1 planner: tens of seconds), endpoints and tools milliseconds
+_LLM_BUCKETS = (0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+_FAST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "ao_http_request_duration_seconds", "HTTP request latency (streamed responses: until the stream starts)",
+    ["method", "route", "status_code"], buckets=_FAST_BUCKETS, registry=REGISTRY
+)
+RUNS_IN_FLIGHT = Gauge(
+    "ao_runs_in_flight", "Agent runs in progress", registry=REGISTRY
+)
+RUNS = Counter(
+    "ao_runs", "Agent runs by prospect status at the end of the run and run status (completed, partial, failed)",
+    ["status", "run_status"], registry=REGISTRY
+)
+PLANNER_SECONDS = Histogram(
+    "ao_planner_duration_seconds", "o1 planner call latency", buckets=_LLM_BUCKETS, registry=REGISTRY
+)
+EXECUTOR_SECONDS = Histogram(
+    "ao_executor_duration_seconds", "gpt-4o executor loop latency (model turns and tool calls)",
+    buckets=_LLM_BUCKETS, registry=REGISTRY
+)
+MODEL_TOKENS = Counter(
+    "ao_model_tokens", "Tokens consumed by model deployment and kind (prompt, completion, cached_prompt)",
+    ["model", "kind"], registry=REGISTRY
+)
+TOOL_CALLS = Counter(
+    "ao_tool_calls", "Agent tool invocations by tool and outcome (ok, error)", ["tool", "outcome"], registry=REGISTRY
+)
+TOOL_SECONDS = Histogram(
+    "ao_tool_duration_seconds", "Agent tool latency", ["tool"], buckets=_FAST_BUCKETS, registry=REGISTRY
+)
+COSMOS_REQUEST_UNITS = Counter(
+    "ao_cosmos_request_units", "Cosmos DB request units consumed by container and operation",
+    ["container", "operation"], registry=REGISTRY
+)
+COSMOS_OPERATIONS = Counter(
+    "ao_cosmos_operations", "Cosmos DB store operations by container and operation",
+    ["container", "operation"], registry=REGISTRY
+)
+COSMOS_THROTTLED = Counter(
+    "ao_cosmos_throttled", "Cosmos DB requests throttled (429), including those retried by the SDK",
+    ["container", "operation"], registry=REGISTRY
+)
+
+
+class _BudgetCollector:
+    # Read at scrape time from the counts kept by the executor budget
+    def collect(self):
+        family = CounterMetricFamily("ao_budget_exceeded", "Executor runs stopped by each budget", labels=["budget"])
+        for budget, count in budget_exceeded_counts().items():
+            family.add_metric([budget], count)
+        yield family
+
+
+REGISTRY.register(_BudgetCollector())
+
+
+def observe_request(method, route, status_code, seconds):
+    HTTP_REQUEST_SECONDS.labels(method, route, str(status_code)).observe(seconds)
+
+
+@contextmanager
+def track_run(initial_status):
+    """
+    Counts the enclosed agent run in flight; a run that raises is counted as failed at its initial status.
+    """
+    RUNS_IN_FLIGHT.inc()
+    try:
+        yield
+    except Exception:
+        RUNS.labels(str(initial_status), "failed").inc()
+        raise
+    finally:
+        RUNS_IN_FLIGHT.dec()
+
+
+def observe_run(status, run_status):
+    RUNS.labels(str(status), run_status).inc()
+
+
+def observe_tokens(model, usage):
+    """
+    Adds the token usage of a chat completion (its `usage`) to the counters of the model deployment.
+    """
+    if usage is None:
+        return
+    model = model or "unknown"
+    MODEL_TOKENS.labels(model, "prompt").inc(usage.prompt_tokens or 0)
+    MODEL_TOKENS.labels(model, "completion").inc(usage.completion_tokens or 0)
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = getattr(details, "cached_tokens", None) if details is not None else None
+    if cached:
+        MODEL_TOKENS.labels(model, "cached_prompt").inc(cached)
+
+
+def observe_tool(tool, seconds, error=None):
+    TOOL_CALLS.labels(tool, "ok" if error is None else "error").inc()
+    TOOL_SECONDS.labels(tool).observe(seconds)
+
+
+def observe_cosmos(container, operation, request_units, throttled):
+    COSMOS_OPERATIONS.labels(container, operation).inc()
+    if request_units:
+        COSMOS_REQUEST_UNITS.labels(container, operation).inc(request_units)
+    if throttled:
+        COSMOS_THROTTLED.labels(container, operation).inc(throttled)
+
+
+def render():
+    """
+    Returns the metrics in the Prometheus text format, with its content type.
+    """
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
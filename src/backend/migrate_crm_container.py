@@ -0,0 +1,116 @@
+"""
+Copies an existing CRM container into a container partitioned on /clientID.
+
+The copy is streamed page by page (never more than one page in memory) and is resumable:
+after each page the continuation token is written to a checkpoint file, and a restarted
+migration continues from there. Items are upserted, so replaying a page is harmless.
+
+Usage (from src/backend, with the .env of the backend):
+    python migrate_crm_container.py --source clientdata --target clientdata-v2 --checkpoint migrate.json
+
+Then point COSMOSDB_CONTAINER_CLIENT_NAME to the target container.
+"""
+import argparse
+import json
+import os
+import time
+import logging
+
+from azure.cosmos import CosmosClient, PartitionKey
+from dotenv import load_dotenv
+
+from crm_store import get_credential, PARTITION_KEY_PATH
+from patching import SYSTEM_PROPERTIES  # server-generated properties, not copied
+
+
+def load_checkpoint(path):
+    if path and os.path.exists(path):
+        with open(path, 'r') as file:
+            return json.load(file)
+    return {"continuation_token": None, "copied": 0, "skipped": 0, "pages": 0, "done": False}
+
+
+def save_checkpoint(path, checkpoint):
+    if not path:
+        return
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w') as file:
+        json.dump(checkpoint, file)
+    os.replace(tmp_path, path)
+
+
+def migrate(source, target, checkpoint_path=None, page_size=100):
+    """
+    Streams every item of `source` into `target`, resuming from the checkpoint file if any.
+
+    Args:
+    - source (ContainerProxy): The container to copy from.
+    - target (ContainerProxy): The container partitioned on /clientID.
+    - checkpoint_path (str): Optional checkpoint file for resumability.
+    - page_size (int): Items read per page.
+
+    Returns:
+    - dict: The final checkpoint (copied / skipped counters).
+    """
+    checkpoint = load_checkpoint(checkpoint_path)
+    if checkpoint["done"]:
+        print(f"Migration already completed: {checkpoint}")
+        return checkpoint
+
+    pages = source.query_items(
+        query="SELECT * FROM c",
+        enable_cross_partition_query=True,
+        max_item_count=page_size
+    ).by_page(checkpoint["continuation_token"])
+
+    started = time.perf_counter()
+    for page in pages:
+        for item in page:
+            if not item.get("clientID"):
+                logging.warning(f"Skipping item {item.get('id')}: no clientID")
+                checkpoint["skipped"] += 1
+                continue
+            for prop in SYSTEM_PROPERTIES:
+                item.pop(prop, None)
+            target.upsert_item(body=item)
+            checkpoint["copied"] += 1
+
+        checkpoint["pages"] += 1
+        checkpoint["continuation_token"] = pages.continuation_token
+        save_checkpoint(checkpoint_path, checkpoint)
+        rate = checkpoint["copied"] / max(time.perf_counter() - started, 1e-6)
+        print(f"page {checkpoint['pages']}: {checkpoint['copied']} copied, {checkpoint['skipped']} skipped ({rate:.0f} items/s)")
+
+        if not pages.continuation_token:
+            break
+
+    checkpoint["done"] = True
+    save_checkpoint(checkpoint_path, checkpoint)
+    return checkpoint
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--source", default=os.getenv("COSMOSDB_CONTAINER_CLIENT_NAME"))
+    parser.add_argument("--target", required=True)
+    parser.add_argument("--checkpoint", default="migrate_crm_container.checkpoint.json")
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--throughput", type=int, default=400)
+    args = parser.parse_args()
+
+    client = CosmosClient(os.getenv("COSMOSDB_ENDPOINT") or "", credential=get_credential())
+    db = client.get_database_client(os.getenv("COSMOSDB_DATABASE_NAME") or "")
+    source = db.get_container_client(args.source)
+    target = db.create_container_if_not_exists(
+        id=args.target,
+        partition_key=PartitionKey(path=PARTITION_KEY_PATH),
+        offer_throughput=args.throughput
+    )
+
+    result = migrate(source, target, args.checkpoint, args.page_size)
+    print(f"Migration of '{args.source}' into '{args.target}' completed: {result['copied']} copied, {result['skipped']} skipped")
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    main()
@@ -0,0 +1,506 @@
+import os
+import re
+import math
+import heapq
+import time
+import logging
+import unicodedata
+from collections import Counter
+
+from azure.cosmos import exceptions
+
+from request_charges import metered
+
+# Name search index of a CRM container, in a LocalDatabase: the folded name of every profile (name_keys)
+# and its trigram postings, with the number of names having each trigram (to probe the rarest first).
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS name_keys (
+    container TEXT NOT NULL,
+    client_id TEXT NOT NULL,
+    name_key TEXT NOT NULL,
+    full_name TEXT,
+    PRIMARY KEY (container, client_id)
+);
+CREATE TABLE IF NOT EXISTS name_trigrams (
+    container TEXT NOT NULL,
+    trigram TEXT NOT NULL,
+    client_id TEXT NOT NULL,
+    PRIMARY KEY (container, trigram, client_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS name_trigram_counts (
+    container TEXT NOT NULL,
+    trigram TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (container, trigram)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS name_index_state (
+    container TEXT PRIMARY KEY,
+    built_at REAL NOT NULL
+);
+"""
+
+_WORD = re.compile(r"[^\W_]+")
+# Probed trigrams a candidate must have: more probes are read, but far fewer names are scored
+_PROBE_HITS = 3
+
+
+def normalize_name(name):
+    """
+    Accent- and case-folded name key: "José  GARCÍA-López" -> "jose garcia lopez".
+    """
+    decomposed = unicodedata.normalize("NFKD", name or "")
+    stripped = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return " ".join(_WORD.findall(stripped.casefold()))
+
+
+def name_trigrams(name_key):
+    """
+    Trigrams of the words of a name key, each word padded like "  word " (the word order does not matter).
+    """
+    trigrams = set()
+    for word in name_key.split():
+        padded = f"  {word} "
+        trigrams.update(padded[start:start + 3] for start in range(len(padded) - 2))
+    return trigrams
+
+
+def score_name(query_trigrams, trigrams):
+    """
+    Returns (score, coverage) of a name against a query: coverage is the share of the query trigrams found
+    in the name, the score averages it with the trigram similarity (shared / all trigrams of both), so an
+    exact name (1.0) ranks above a longer name containing the query.
+    """
+    shared = len(query_trigrams & trigrams)
+    if not shared:
+        return 0.0, 0.0
+    coverage = shared / len(query_trigrams)
+    similarity = shared / len(query_trigrams | trigrams)
+    return round((coverage + similarity) / 2, 4), coverage
+
+
+class NameIndex:
+    """
+    Ranked fuzzy name search over the profiles of a container: accent- and case-insensitive, tolerant to
+    typos and word order. A lookup reads the postings of the query's rarest trigrams only (any name
+    covering `threshold` of the query trigrams has several of them), then scores those candidates.
+
+    Args:
+    - database (LocalDatabase): The database holding the index, maintained with the profiles.
+    - container_name (str): The CRM container indexed.
+    """
+    def __init__(self, database, container_name):
+        self.database = database
+        self.container_name = container_name
+        with database.lock:
+            database.db.executescript(_SCHEMA)
+
+    def stale(self):
+        """
+        Whether the index was never built (profiles written before the index existed).
+        """
+        with self.database.lock:
+            row = self.database.db.execute(
+                "SELECT built_at FROM name_index_state WHERE container = ?", (self.container_name,)
+            ).fetchone()
+        return row is None
+
+    def rebuild(self, profiles):
+        """
+        Replaces the index content with the given profiles.
+
+        Args:
+        - profiles (iterable): (clientID, fullName) of every profile of the container.
+        """
+        started = time.perf_counter()
+        keys, postings, counts = [], [], Counter()
+        for client_id, full_name in profiles:
+            if not client_id:
+                continue
+            name_key = normalize_name(full_name)
+            keys.append((self.container_name, client_id, name_key, full_name))
+            for trigram in name_trigrams(name_key):
+                postings.append((self.container_name, trigram, client_id))
+                counts[trigram] += 1
+
+        with self.database.transaction() as db:
+            for table in ("name_keys", "name_trigrams", "name_trigram_counts"):
+                db.execute(f"DELETE FROM {table} WHERE container = ?", (self.container_name,))
+            db.executemany("INSERT OR REPLACE INTO name_keys VALUES (?, ?, ?, ?)", keys)
+            db.executemany("INSERT OR IGNORE INTO name_trigrams VALUES (?, ?, ?)", postings)
+            db.executemany("INSERT INTO name_trigram_counts VALUES (?, ?, ?)",
+                           [(self.container_name, trigram, count) for trigram, count in counts.items()])
+            db.execute("INSERT OR REPLACE INTO name_index_state VALUES (?, ?)", (self.container_name, time.time()))
+        logging.info(f"Name index of '{self.container_name}' built: {len(keys)} names, "
+                     f"{len(postings)} postings in {time.perf_counter() - started:.2f}s")
+
+    def write(self, db, client_id, full_name):
+        """
+        Indexes the name of a profile, in the caller's transaction on `db` (nothing to do if unchanged).
+        """
+        name_key = normalize_name(full_name)
+        row = db.execute("SELECT name_key FROM name_keys WHERE container = ? AND client_id = ?",
+                         (self.container_name, client_id)).fetchone()
+        if row is not None and row[0] == name_key:
+            return
+        self.delete(db, client_id)
+        db.execute("INSERT INTO name_keys VALUES (?, ?, ?, ?)", (self.container_name, client_id, name_key, full_name))
+        for trigram in name_trigrams(name_key):
+            db.execute("INSERT INTO name_trigrams VALUES (?, ?, ?)", (self.container_name, trigram, client_id))
+            db.execute(
+                "INSERT INTO name_trigram_counts VALUES (?, ?, 1) "
+                "ON CONFLICT (container, trigram) DO UPDATE SET count = count + 1",
+                (self.container_name, trigram)
+            )
+
+    def delete(self, db, client_id):
+        """
+        Removes a profile from the index, in the caller's transaction on `db`.
+        """
+        row = db.execute("SELECT name_key FROM name_keys WHERE container = ? AND client_id = ?",
+                         (self.container_name, client_id)).fetchone()
+        if row is None:
+            return
+        db.execute("DELETE FROM name_keys WHERE container = ? AND client_id = ?", (self.container_name, client_id))
+        for trigram in name_trigrams(row[0]):
+            db.execute("DELETE FROM name_trigrams WHERE container = ? AND trigram = ? AND client_id = ?",
+                       (self.container_name, trigram, client_id))
+            db.execute("UPDATE name_trigram_counts SET count = count - 1 WHERE container = ? AND trigram = ?",
+                       (self.container_name, trigram))
+
+    def update(self, client_id, full_name):
+        with self.database.transaction() as db:
+            self.write(db, client_id, full_name)
+
+    def remove(self, client_id):
+        with self.database.transaction() as db:
+            self.delete(db, client_id)
+
+    def search(self, full_name, limit=10, threshold=None, max_candidates=None):
+        """
+        Returns the best matches of a (partial, misspelled, unaccented...) name, best first.
+
+        Args:
+        - full_name (str): The name searched.
+        - limit (int): Maximum number of matches returned.
+        - threshold (float): Minimum share of the query trigrams a name must have (default AO_NAME_SEARCH_THRESHOLD, 0.5).
+        - max_candidates (int): Maximum number of names scored, those sharing the most trigrams with the query
+          (default AO_NAME_SEARCH_MAX_CANDIDATES, 10000).
+
+        Returns:
+        - list: {"clientID", "fullName", "score"} dicts, score 1.0 for the same name up to accents, case and word order.
+        """
+        query = _SearchPlan(full_name, threshold, max_candidates)
+        if not query.trigrams:
+            return []
+        with self.database.lock:
+            db = self.database.db
+            marks = ", ".join("?" * len(query.trigrams))
+            probes = query.probes(dict(db.execute(
+                f"SELECT trigram, count FROM name_trigram_counts WHERE container = ? AND trigram IN ({marks})",
+                (self.container_name, *query.trigrams)
+            )))
+            if not probes:
+                return []
+            marks = ", ".join("?" * len(probes))
+            rows = db.execute(
+                "SELECT keys.client_id, keys.name_key, keys.full_name, candidates.hits FROM "
+                f"(SELECT client_id, COUNT(*) AS hits FROM name_trigrams WHERE container = ? AND trigram IN ({marks}) "
+                "GROUP BY client_id HAVING hits >= ? ORDER BY hits DESC LIMIT ?) AS candidates "
+                "JOIN name_keys AS keys ON keys.container = ? AND keys.client_id = candidates.client_id "
+                "ORDER BY candidates.hits DESC",
+                (self.container_name, *probes, query.hits, query.max_candidates, self.container_name)
+            )
+            return query.rank(rows, limit)
+
+
+class _SearchPlan:
+    """
+    The storage independent part of a name search: which postings to read (the query's rarest trigrams:
+    any name covering `threshold` of the query trigrams has several of them) and the ranking of the
+    candidates found there.
+    """
+    def __init__(self, full_name, threshold=None, max_candidates=None):
+        self.threshold = threshold if threshold is not None else float(os.getenv("AO_NAME_SEARCH_THRESHOLD", "0.5"))
+        self.max_candidates = (max_candidates if max_candidates is not None
+                               else int(os.getenv("AO_NAME_SEARCH_MAX_CANDIDATES", "10000")))
+        self.trigrams = name_trigrams(normalize_name(full_name))
+        # A name sharing at least `required` query trigrams misses at most len - required of them, so it has
+        # `hits` of the len - required + hits rarest: candidates are counted on those postings only
+        required = math.ceil(self.threshold * len(self.trigrams))
+        self.hits = min(_PROBE_HITS, required)
+        self.probed = len(self.trigrams) - required + self.hits
+
+    def probes(self, counts):
+        """
+        The trigrams whose postings are read, given the number of names having each query trigram.
+        """
+        rarest = sorted(self.trigrams, key=lambda trigram: counts.get(trigram, 0))
+        return [trigram for trigram in rarest[:self.probed] if counts.get(trigram)]
+
+    def rank(self, candidates, limit):
+        """
+        Scores the candidates, (client_id, name_key, full_name, probe_hits) by decreasing probe hits,
+        and returns the `limit` best matches.
+        """
+        matches, best = [], []
+        for client_id, name_key, name, probe_hits in candidates:
+            # No later candidate (fewer probe hits) can score above (probe hits + unprobed trigrams) / len:
+            # stop once `limit` matches score more (ties are kept)
+            if len(best) == limit and (probe_hits + len(self.trigrams) - self.probed) / len(self.trigrams) < best[0]:
+                break
+            score, coverage = score_name(self.trigrams, name_trigrams(name_key))
+            if coverage >= self.threshold:
+                matches.append({"clientID": client_id, "fullName": name, "score": score})
+                heapq.heappush(best, score)
+                if len(best) > limit:
+                    heapq.heappop(best)
+        matches.sort(key=lambda match: (-match["score"], match["clientID"]))
+        return matches[:limit]
+
+
+# Documents of a Cosmos DB name index container (partitioned on /trigram):
+# - a posting per (trigram, profile): {"id": clientID, "trigram", "clientID", "nameKey", "fullName"};
+# - the number of postings of a trigram: {"id": "_count", "trigram", "postings"};
+# - the indexed name of a profile, to update its postings when it changes: {"id": clientID, "trigram": "client:<clientID>", ...};
+# - when the index was built from the CRM container: {"id": "built", "trigram": "state:", "builtAt"}.
+_COUNT_ID = "_count"
+_CLIENT_PARTITION = "client:"
+_STATE_ID, _STATE_PARTITION = "built", "state:"
+
+# Metered operation of each container call
+_OPERATIONS = {"read_item": "read", "create_item": "create", "upsert_item": "upsert", "delete_item": "delete",
+               "patch_item": "patch", "query_items": "query"}
+
+
+class _CosmosNameIndexCalls:
+    """
+    The logic of CosmosNameIndex and AsyncCosmosNameIndex: each operation is a generator yielding the
+    container calls (method, kwargs) it makes, sent back their result (or thrown their error) by the
+    sync or the async driver, and returning the operation result.
+    """
+    def __init__(self, container, container_name):
+        self.container = container
+        self.container_name = container_name
+
+    def _indexed_calls(self, client_id):
+        try:
+            return (yield "read_item", {"item": client_id, "partition_key": _CLIENT_PARTITION + client_id})
+        except exceptions.CosmosResourceNotFoundError:
+            return None
+
+    def _delete_calls(self, client_id, partition_key):
+        try:
+            yield "delete_item", {"item": client_id, "partition_key": partition_key}
+        except exceptions.CosmosResourceNotFoundError:
+            pass
+
+    def _count_calls(self, trigram, delta):
+        increment = {"item": _COUNT_ID, "partition_key": trigram,
+                     "patch_operations": [{"op": "incr", "path": "/postings", "value": delta}]}
+        try:
+            yield "patch_item", increment
+            return
+        except exceptions.CosmosResourceNotFoundError:
+            pass
+        try:
+            yield "create_item", {"body": {"id": _COUNT_ID, "trigram": trigram, "postings": max(delta, 0)}}
+        except exceptions.CosmosResourceExistsError:
+            # created concurrently: count on it
+            yield "patch_item", increment
+
+    def _stale_calls(self):
+        try:
+            yield "read_item", {"item": _STATE_ID, "partition_key": _STATE_PARTITION}
+            return False
+        except exceptions.CosmosResourceNotFoundError:
+            return True
+
+    def _update_calls(self, client_id, full_name):
+        name_key = normalize_name(full_name)
+        indexed = yield from self._indexed_calls(client_id)
+        if indexed is not None and indexed["nameKey"] == name_key and indexed["fullName"] == full_name:
+            return
+        previous = name_trigrams(indexed["nameKey"]) if indexed is not None else set()
+        trigrams = name_trigrams(name_key)
+        for trigram in previous - trigrams:
+            yield from self._delete_calls(client_id, trigram)
+        for trigram in trigrams:
+            yield "upsert_item", {"body": {"id": client_id, "trigram": trigram, "clientID": client_id,
+                                           "nameKey": name_key, "fullName": full_name}}
+        yield "upsert_item", {"body": {"id": client_id, "trigram": _CLIENT_PARTITION + client_id,
+                                       "clientID": client_id, "nameKey": name_key, "fullName": full_name}}
+        for trigram in previous - trigrams:
+            yield from self._count_calls(trigram, -1)
+        for trigram in trigrams - previous:
+            yield from self._count_calls(trigram, 1)
+
+    def _remove_calls(self, client_id):
+        indexed = yield from self._indexed_calls(client_id)
+        if indexed is None:
+            return
+        trigrams = name_trigrams(indexed["nameKey"])
+        for trigram in trigrams:
+            yield from self._delete_calls(client_id, trigram)
+        yield from self._delete_calls(client_id, _CLIENT_PARTITION + client_id)
+        for trigram in trigrams:
+            yield from self._count_calls(trigram, -1)
+
+    def _recount_calls(self, indexed, started):
+        # The end of a rebuild: the postings of every trigram are recounted and the index marked built
+        counts = Counter(item["trigram"] for item in (yield "query_items", {
+            "query": "SELECT c.trigram FROM c WHERE c.id != @count AND NOT STARTSWITH(c.trigram, @client) "
+                     "AND NOT STARTSWITH(c.trigram, @state)",
+            "parameters": [{"name": "@count", "value": _COUNT_ID}, {"name": "@client", "value": _CLIENT_PARTITION},
+                           {"name": "@state", "value": _STATE_PARTITION}]
+        }))
+        for trigram, count in counts.items():
+            yield "upsert_item", {"body": {"id": _COUNT_ID, "trigram": trigram, "postings": count}}
+        yield "upsert_item", {"body": {"id": _STATE_ID, "trigram": _STATE_PARTITION, "builtAt": time.time()}}
+        logging.info(f"Name index of '{self.container_name}' rebuilt: {indexed} names, "
+                     f"{sum(counts.values())} postings in {time.perf_counter() - started:.2f}s")
+
+    def _search_calls(self, full_name, limit=10, threshold=None, max_candidates=None):
+        query = _SearchPlan(full_name, threshold, max_candidates)
+        if not query.trigrams:
+            return []
+        trigrams = [{"name": f"@t{i}", "value": trigram} for i, trigram in enumerate(query.trigrams)]
+        probes = query.probes({item["trigram"]: item["postings"] for item in (yield "query_items", {
+            "query": "SELECT c.trigram, c.postings FROM c WHERE c.id = @count "
+                     f"AND c.trigram IN ({', '.join(t['name'] for t in trigrams)})",
+            "parameters": [{"name": "@count", "value": _COUNT_ID}, *trigrams]
+        })})
+        if not probes:
+            return []
+        probes = [{"name": f"@t{i}", "value": trigram} for i, trigram in enumerate(probes)]
+        hits, names = Counter(), {}
+        for item in (yield "query_items", {
+            "query": "SELECT c.clientID, c.nameKey, c.fullName FROM c WHERE c.id != @count "
+                     f"AND c.trigram IN ({', '.join(t['name'] for t in probes)})",
+            "parameters": [{"name": "@count", "value": _COUNT_ID}, *probes]
+        }):
+            hits[item["clientID"]] += 1
+            names[item["clientID"]] = (item["nameKey"], item["fullName"])
+        candidates = sorted((client_id for client_id, count in hits.items() if count >= query.hits),
+                            key=lambda client_id: (-hits[client_id], client_id))[:query.max_candidates]
+        return query.rank(((client_id, *names[client_id], hits[client_id]) for client_id in candidates), limit)
+
+
+class CosmosNameIndex(_CosmosNameIndexCalls):
+    """
+    The name index of a Cosmos DB CRM container, stored in its own container (partitioned on /trigram)
+    and updated by the store on every write of a name: a lookup reads the trigram counts and the
+    postings of the rarest query trigrams (two queries), never the CRM container.
+
+    Args:
+    - container (ContainerProxy): The name index container.
+    - container_name (str): Its name (request charges are accounted to it).
+    """
+    def _call(self, method, kwargs):
+        query = kwargs.get("query")
+        with metered(self.container_name, _OPERATIONS[method], query, cross_partition=query is not None) as hook:
+            if method == "query_items":
+                return list(self.container.query_items(enable_cross_partition_query=True, response_hook=hook, **kwargs))
+            return getattr(self.container, method)(response_hook=hook, **kwargs)
+
+    def _run(self, calls):
+        result, error = None, None
+        while True:
+            try:
+                method, kwargs = calls.throw(error) if error is not None else calls.send(result)
+            except StopIteration as done:
+                return done.value
+            try:
+                result, error = self._call(method, kwargs), None
+            except Exception as e:
+                result, error = None, e
+
+    def stale(self):
+        """
+        Whether the index was never built from its CRM container (e.g. a container written before the
+        index existed): the store builds it when it provisions the container.
+        """
+        return self._run(self._stale_calls())
+
+    def update(self, client_id, full_name):
+        """
+        Indexes the name of a profile (nothing to do if unchanged since it was indexed).
+        """
+        self._run(self._update_calls(client_id, full_name))
+
+    def remove(self, client_id):
+        """
+        Removes a profile from the index.
+        """
+        self._run(self._remove_calls(client_id))
+
+    def rebuild(self, profiles):
+        """
+        Indexes the given profiles (e.g. written to the container by another tool), then recounts the
+        postings of every trigram. Offline (rebuild_name_index.py) or when the store provisions a container
+        whose index was never built: it reads the whole index.
+
+        Args:
+        - profiles (iterable): (clientID, fullName) of the profiles to index.
+        """
+        started = time.perf_counter()
+        indexed = 0
+        for client_id, full_name in profiles:
+            if client_id:
+                self.update(client_id, full_name)
+                indexed += 1
+        self._run(self._recount_calls(indexed, started))
+
+    def search(self, full_name, limit=10, threshold=None, max_candidates=None):
+        """
+        Returns the best matches of a name, best first (see NameIndex.search).
+        """
+        return self._run(self._search_calls(full_name, limit, threshold, max_candidates))
+
+
+class AsyncCosmosNameIndex(_CosmosNameIndexCalls):
+    """
+    asyncio flavour of CosmosNameIndex, on an azure.cosmos.aio container (used by the AsyncCRMStore).
+    """
+    async def _call(self, method, kwargs):
+        query = kwargs.get("query")
+        with metered(self.container_name, _OPERATIONS[method], query, cross_partition=query is not None) as hook:
+            if method == "query_items":
+                # the aio client fans out without enable_cross_partition_query
+                return [item async for item in self.container.query_items(response_hook=hook, **kwargs)]
+            return await getattr(self.container, method)(response_hook=hook, **kwargs)
+
+    async def _run(self, calls):
+        result, error = None, None
+        while True:
+            try:
+                method, kwargs = calls.throw(error) if error is not None else calls.send(result)
+            except StopIteration as done:
+                return done.value
+            try:
+                result, error = await self._call(method, kwargs), None
+            except Exception as e:
+                result, error = None, e
+
+    async def stale(self):
+        return await self._run(self._stale_calls())
+
+    async def update(self, client_id, full_name):
+        await self._run(self._update_calls(client_id, full_name))
+
+    async def remove(self, client_id):
+        await self._run(self._remove_calls(client_id))
+
+    async def rebuild(self, profiles):
+        """
+        See CosmosNameIndex.rebuild; `profiles` is an async iterable of (clientID, fullName).
+        """
+        started = time.perf_counter()
+        indexed = 0
+        async for client_id, full_name in profiles:
+            if client_id:
+                await self.update(client_id, full_name)
+                indexed += 1
+        await self._run(self._recount_calls(indexed, started))
+
+    async def search(self, full_name, limit=10, threshold=None, max_candidates=None):
+        return await self._run(self._search_calls(full_name, limit, threshold, max_candidates))
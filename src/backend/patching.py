@@ -0,0 +1,243 @@
+import re
+import copy
+
+# Properties maintained by Cosmos DB: never diffed nor patched
+SYSTEM_PROPERTIES = {"_rid", "_self", "_etag", "_attachments", "_ts"}
+
+# Properties a client patch may not touch: the system properties and the identity of the document
+# (its id and clientID, the partition key)
+PROTECTED_PROPERTIES = {"id", "clientID", *SYSTEM_PROPERTIES}
+
+# Cosmos DB partial document update accepts at most 10 operations per request
+MAX_COSMOS_PATCH_OPERATIONS = 10
+
+# JSON Patch (RFC 6902) operation -> Cosmos DB patch operation ("set" also creates missing paths)
+_COSMOS_OPERATIONS = {"add": "add", "remove": "remove", "replace": "set", "move": "move"}
+
+# Members each JSON Patch operation requires besides "op" and "path"
+_REQUIRED_MEMBERS = {"add": ("value",), "remove": (), "replace": ("value",), "move": ("from",), "copy": ("from",),
+                     "test": ("value",)}
+
+# Array index of a JSON pointer: no sign, no leading zero
+_ARRAY_INDEX = re.compile(r'^(0|[1-9][0-9]*)$')
+
+
+class JsonPatchError(ValueError):
+    """
+    Raised when a JSON Patch cannot be applied (bad path, failed "test" operation...).
+    """
+
+
+class ProtectedPropertyError(JsonPatchError):
+    """
+    Raised when a client patch touches the identity or the system properties of a document.
+    """
+
+
+def _escape(key):
+    return str(key).replace("~", "~0").replace("/", "~1")
+
+
+def _unescape(token):
+    return token.replace("~1", "/").replace("~0", "~")
+
+
+def _split(path):
+    if path == "":
+        return []
+    if not path.startswith("/"):
+        raise JsonPatchError(f"Invalid JSON pointer: {path}")
+    return [_unescape(token) for token in path[1:].split("/")]
+
+
+def _index(array, token, path, insert=False):
+    # "-" (after the last item) and len(array) are only valid to insert
+    if insert and token == "-":
+        return len(array)
+    if not _ARRAY_INDEX.match(token):
+        raise JsonPatchError(f"Invalid array index '{token}' in {path}")
+    index = int(token)
+    if index > len(array) or (index == len(array) and not insert):
+        raise JsonPatchError(f"Path not found: {path}")
+    return index
+
+
+def _parent(doc, path):
+    tokens = _split(path)
+    if not tokens:
+        raise JsonPatchError("Operations on the document root are not supported")
+    target = doc
+    for token in tokens[:-1]:
+        if isinstance(target, list):
+            target = target[_index(target, token, path)]
+        elif isinstance(target, dict) and token in target:
+            target = target[token]
+        else:
+            raise JsonPatchError(f"Path not found: {path}")
+    if not isinstance(target, (dict, list)):
+        raise JsonPatchError(f"Path not found: {path}")
+    return target, tokens[-1]
+
+
+def _get(doc, path):
+    parent, key = _parent(doc, path)
+    if isinstance(parent, list):
+        return parent[_index(parent, key, path)]
+    if key not in parent:
+        raise JsonPatchError(f"Path not found: {path}")
+    return parent[key]
+
+
+def _add(doc, path, value):
+    parent, key = _parent(doc, path)
+    if isinstance(parent, list):
+        parent.insert(_index(parent, key, path, insert=True), value)
+    else:
+        parent[key] = value
+
+
+def _remove(doc, path):
+    parent, key = _parent(doc, path)
+    if isinstance(parent, list):
+        return parent.pop(_index(parent, key, path))
+    if key not in parent:
+        raise JsonPatchError(f"Path not found: {path}")
+    return parent.pop(key)
+
+
+def validate_json_patch(operations):
+    """
+    Checks the shape of a JSON Patch before it is applied: a list of operations, each with a supported
+    "op", a "path" (and "from") JSON pointer and the members its op requires. Raises JsonPatchError.
+    """
+    if not isinstance(operations, list):
+        raise JsonPatchError("A JSON Patch must be a list of operations")
+    for position, operation in enumerate(operations):
+        if not isinstance(operation, dict):
+            raise JsonPatchError(f"Operation {position} is not an object")
+        op = operation.get("op")
+        if op not in _REQUIRED_MEMBERS:
+            raise JsonPatchError(f"Unsupported operation: {op}")
+        members = ("path", *_REQUIRED_MEMBERS[op])
+        for member in members:
+            if member not in operation:
+                raise JsonPatchError(f"Operation {position} ({op}) has no \"{member}\"")
+        for member in {"path", "from"} & set(members):
+            if not isinstance(operation[member], str):
+                raise JsonPatchError(f"Operation {position} ({op}): \"{member}\" must be a JSON pointer")
+            _split(operation[member])
+
+
+def check_writable(patch: list = None, merge_patch: dict = None):
+    """
+    Checks that a client JSON Patch (or JSON merge patch) leaves the PROTECTED_PROPERTIES alone.
+    Raises JsonPatchError for a malformed patch, ProtectedPropertyError for a protected one.
+    """
+    if patch is not None:
+        validate_json_patch(patch)
+        paths = [operation[member] for operation in patch for member in ("path", "from") if member in operation]
+    else:
+        if not isinstance(merge_patch, dict):
+            raise JsonPatchError("A JSON merge patch must be an object")
+        paths = [f"/{_escape(key)}" for key in merge_patch]
+    for path in paths:
+        tokens = _split(path)
+        if not tokens or tokens[0] in PROTECTED_PROPERTIES:
+            raise ProtectedPropertyError(f"{path or 'The document root'} cannot be patched")
+
+
+def apply_json_patch(doc: dict, operations: list) -> dict:
+    """
+    Applies a JSON Patch (RFC 6902) and returns the patched copy of `doc`.
+    Raises JsonPatchError for a malformed patch or an operation that cannot be applied.
+    """
+    validate_json_patch(operations)
+    doc = copy.deepcopy(doc)
+    for operation in operations:
+        op, path = operation.get("op"), operation.get("path")
+        if op == "add":
+            _add(doc, path, copy.deepcopy(operation["value"]))
+        elif op == "remove":
+            _remove(doc, path)
+        elif op == "replace":
+            _remove(doc, path)
+            _add(doc, path, copy.deepcopy(operation["value"]))
+        elif op == "move":
+            _add(doc, path, _remove(doc, operation["from"]))
+        elif op == "copy":
+            _add(doc, path, copy.deepcopy(_get(doc, operation["from"])))
+        elif op == "test":
+            if _get(doc, path) != operation["value"]:
+                raise JsonPatchError(f"Test failed on {path}")
+        else:
+            raise JsonPatchError(f"Unsupported operation: {op}")
+    return doc
+
+
+def apply_merge_patch(doc: dict, patch: dict) -> dict:
+    """
+    Applies a JSON Merge Patch (RFC 7386) and returns the patched copy of `doc`.
+    """
+    if not isinstance(patch, dict):
+        return copy.deepcopy(patch)
+    result = copy.deepcopy(doc) if isinstance(doc, dict) else {}
+    for key, value in patch.items():
+        if value is None:
+            result.pop(key, None)
+        else:
+            result[key] = apply_merge_patch(result.get(key), value)
+    return result
+
+
+def diff(old: dict, new: dict, path: str = "") -> list:
+    """
+    Returns the JSON Patch turning `old` into `new`: nested objects are diffed field by field
+    and items appended to a list become "add .../-" operations, so appending to a large array
+    does not rewrite it. An empty list means there is nothing to write.
+    """
+    operations = []
+    for key in old:
+        if key not in new and key not in SYSTEM_PROPERTIES:
+            operations.append({"op": "remove", "path": f"{path}/{_escape(key)}"})
+
+    for key, value in new.items():
+        if key in SYSTEM_PROPERTIES:
+            continue
+        key_path = f"{path}/{_escape(key)}"
+        if key not in old:
+            operations.append({"op": "add", "path": key_path, "value": value})
+            continue
+        old_value = old[key]
+        if old_value == value:
+            continue
+        if isinstance(old_value, dict) and isinstance(value, dict):
+            operations.extend(diff(old_value, value, key_path))
+        elif isinstance(old_value, list) and isinstance(value, list) \
+                and len(value) > len(old_value) and value[:len(old_value)] == old_value:
+            operations.extend({"op": "add", "path": f"{key_path}/-", "value": item} for item in value[len(old_value):])
+        else:
+            operations.append({"op": "replace", "path": key_path, "value": value})
+    return operations
+
+
+def to_cosmos_operations(operations: list):
+    """
+    Translates a JSON Patch into Cosmos DB partial update operations.
+
+    Returns None when the patch cannot be sent as one Cosmos patch request
+    ("copy"/"test" operations or more than MAX_COSMOS_PATCH_OPERATIONS operations).
+    """
+    if len(operations) > MAX_COSMOS_PATCH_OPERATIONS:
+        return None
+    cosmos_operations = []
+    for operation in operations:
+        op = _COSMOS_OPERATIONS.get(operation.get("op"))
+        if op is None:
+            return None
+        cosmos_operation = {"op": op, "path": operation["path"]}
+        if op == "move":
+            cosmos_operation["from"] = operation["from"]
+        elif op != "remove":
+            cosmos_operation["value"] = operation["value"]
+        cosmos_operations.append(cosmos_operation)
+    return cosmos_operations
@@ -0,0 +1,35 @@
+"""
+Indexes the names of every profile of a CRM container into its name index container
+("<container>-names"). The backend builds the index when it provisions a container whose index is
+new and updates it on every write, so it never scans the container to search names: run this after
+profiles were loaded without going through the CRM store, or after a logged name index failure.
+
+Profiles already indexed with the same name are skipped; the trigram counts are recomputed at the end.
+
+Usage (from src/backend, with the .env of the backend):
+    python rebuild_name_index.py --container clientdata
+"""
+import argparse
+import os
+import time
+
+from dotenv import load_dotenv
+
+from crm_store import get_cosmos_client, get_name_index, profile_names
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--container", default=os.getenv("COSMOSDB_CONTAINER_CLIENT_NAME"))
+    parser.add_argument("--page-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    db = get_cosmos_client(os.getenv("COSMOSDB_ENDPOINT") or "").get_database_client(os.getenv("COSMOSDB_DATABASE_NAME") or "")
+    started = time.perf_counter()
+    get_name_index(args.container).rebuild(profile_names(db.get_container_client(args.container), args.page_size))
+    print(f"Name index of '{args.container}' rebuilt in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    main()
@@ -0,0 +1,178 @@
+import time
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+
+from metrics import observe_cosmos
+
+# Request unit (RU) accounting of the Cosmos DB operations of the CRM and event stores:
+# - per scope (an HTTP request, an agent run): every open scope of the caller gets the charges;
+# - per query shape (container, operation, statement): which queries cost the most, process wide.
+REQUEST_CHARGE_HEADER = "x-ms-request-charge"
+# 429 responses retried by the SDK before this response
+THROTTLE_RETRY_COUNT_HEADER = "x-ms-throttle-retry-count"
+
+# Accounting scopes open in the current context (HTTP request, then agent run), outermost first
+_scopes = contextvars.ContextVar("request_charge_scopes", default=())
+
+
+class RequestCharges:
+    """
+    Request units, round trips and time spent in Cosmos DB by the operations of a scope, per operation.
+    """
+    def __init__(self):
+        self.request_units = 0.0
+        self.round_trips = 0
+        self.operations = 0
+        self.duration_ms = 0.0
+        self.by_operation = {}
+        self._lock = threading.Lock()
+
+    def add(self, operation, request_units, round_trips, duration_ms):
+        with self._lock:
+            self.request_units += request_units
+            self.round_trips += round_trips
+            self.operations += 1
+            self.duration_ms += duration_ms
+            totals = self.by_operation.setdefault(operation, {"count": 0, "request_units": 0.0})
+            totals["count"] += 1
+            totals["request_units"] += request_units
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "request_units": round(self.request_units, 2),
+                "operations": self.operations,
+                "round_trips": self.round_trips,
+                "duration_ms": round(self.duration_ms, 1),
+                "by_operation": {
+                    operation: {"count": totals["count"], "request_units": round(totals["request_units"], 2)}
+                    for operation, totals in sorted(self.by_operation.items())
+                },
+            }
+
+    def headers(self):
+        """
+        The response headers reporting the charges of an HTTP request.
+        """
+        with self._lock:
+            return {
+                "x-ao-request-charge": f"{self.request_units:.2f}",
+                "x-ao-request-operations": str(self.operations),
+                "x-ao-request-duration-ms": f"{self.duration_ms:.1f}",
+            }
+
+
+@contextmanager
+def charge_scope():
+    """
+    Accounts the Cosmos DB operations of the enclosed code (and of the tasks and threads it starts)
+    in a new RequestCharges, also added to the scopes already open (a run within an HTTP request).
+    """
+    charges = RequestCharges()
+    token = _scopes.set(_scopes.get() + (charges,))
+    try:
+        yield charges
+    finally:
+        _scopes.reset(token)
+
+
+class QueryShapes:
+    """
+    Process-wide tally of the Cosmos DB operations by shape: container, operation ("read", "query",
+    "patch"...), statement (the parameterized query text, without its values) and cross-partition fan-out.
+    """
+    def __init__(self):
+        self._shapes = {}
+        self._lock = threading.Lock()
+
+    def add(self, shape, request_units, round_trips, duration_ms):
+        with self._lock:
+            stats = self._shapes.get(shape)
+            if stats is None:
+                stats = self._shapes[shape] = {
+                    "count": 0, "request_units": 0.0, "max_request_units": 0.0, "round_trips": 0, "duration_ms": 0.0
+                }
+            stats["count"] += 1
+            stats["request_units"] += request_units
+            stats["max_request_units"] = max(stats["max_request_units"], request_units)
+            stats["round_trips"] += round_trips
+            stats["duration_ms"] += duration_ms
+
+    def top(self, limit=20):
+        """
+        The shapes that cost the most request units overall, with their mean and maximum charge per call.
+        """
+        with self._lock:
+            shapes = [(shape, dict(stats)) for shape, stats in self._shapes.items()]
+        shapes.sort(key=lambda item: item[1]["request_units"], reverse=True)
+        return [{
+            "container": container,
+            "operation": operation,
+            "statement": statement,
+            "cross_partition": cross_partition,
+            "count": stats["count"],
+            "request_units": round(stats["request_units"], 2),
+            "mean_request_units": round(stats["request_units"] / stats["count"], 2),
+            "max_request_units": round(stats["max_request_units"], 2),
+            "round_trips": stats["round_trips"],
+            "mean_duration_ms": round(stats["duration_ms"] / stats["count"], 1),
+        } for (container, operation, statement, cross_partition), stats in shapes[:limit]]
+
+    def reset(self):
+        with self._lock:
+            self._shapes.clear()
+
+
+query_shapes = QueryShapes()
+
+
+class _Meter:
+    def __init__(self):
+        self.request_units = 0.0
+        self.round_trips = 0
+        self.throttled = 0
+
+    def hook(self, headers, result=None):
+        # response_hook of the Cosmos SDK: called once per round trip (per page for queries)
+        headers = headers or {}
+        self.round_trips += 1
+        try:
+            self.request_units += float(headers.get(REQUEST_CHARGE_HEADER) or 0)
+            self.throttled += int(headers.get(THROTTLE_RETRY_COUNT_HEADER) or 0)
+        except ValueError:
+            pass
+
+
+@contextmanager
+def metered(container, operation, statement=None, cross_partition=False):
+    """
+    Accounts one Cosmos DB operation: yields the response_hook to pass to the SDK call(s) made for it
+    (consume query pagers inside the block). Failed calls are charged too (e.g. a 404 point read).
+
+    Args:
+    - container (str): The container name.
+    - operation (str): "create", "read", "query", "patch", "replace", "delete", "batch".
+    - statement (str): The query text, with @parameters (never values).
+    - cross_partition (bool): Whether the query fans out to every partition.
+    """
+    meter = _Meter()
+    started = time.perf_counter()
+    try:
+        yield meter.hook
+    except Exception as e:
+        headers = getattr(e, "headers", None)
+        if headers:
+            meter.hook(headers)
+        if getattr(e, "status_code", None) == 429:
+            meter.throttled += 1
+        raise
+    finally:
+        duration_ms = (time.perf_counter() - started) * 1000
+        query_shapes.add((container, operation, statement, cross_partition), meter.request_units,
+                         meter.round_trips, duration_ms)
+        for charges in _scopes.get():
+            charges.add(operation, meter.request_units, meter.round_trips, duration_ms)
+        observe_cosmos(container, operation, meter.request_units, meter.throttled)
+        logging.debug(f"Cosmos {operation} on {container}: {meter.request_units:.2f} RU, {duration_ms:.1f} ms")
@@ -1,22 +1,57 @@
 import json
 import os
 import logging
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Annotated, TypedDict
 from datetime import datetime
-import random
 
 from azure.core.credentials import AzureKeyCredential
-from azure.identity import DefaultAzureCredential
 
-from crm_store import CRMStore
+from crm_store import CRMStore, get_crm_store
+from crm_store_async import get_async_crm_store
+from unit_of_work import current_unit_of_work, unit_of_work, async_unit_of_work
+from event_store import EVENT_FIELDS, new_event
+from skills.tool_registry import ToolRegistry
+from skills.tool_random import tool_random
 
+# Registry of the agent tools: FUNCTION_MAPPING, ASYNC_FUNCTION_MAPPING, TOOLS and TOOL_EFFECTS are built from it
+TOOL_REGISTRY = ToolRegistry()
+tool = TOOL_REGISTRY.tool
 
-def create_prospect(first_name: str, last_name: str, dob: str, nationality: str, referral_source: str) -> Dict[str, Any]:
-    """
-    Create a prospect in the CRM with initial mimimal information
-    
-    """
-    new_id = f"PROSP{10 + random.randint(1000, 9999)}"
+
+# Prospect fields the tools take (their JSON schemas are generated from these)
+
+class ProspectIdentity(TypedDict):
+    clientID: str
+    firstName: str
+    lastName: str
+    dateOfBirth: str
+    nationality: str
+
+
+class ProspectDocuments(TypedDict):
+    clientID: str
+    documents_provided: Annotated[List[str], "A list of documents name provided by the prospect."]
+
+
+class ProspectRiskProfile(TypedDict):
+    clientID: str
+    risk_level: str
+    risk_score: int
+    nationality: str
+
+
+class ProspectRiskAssessment(TypedDict):
+    clientID: str
+    name_screening_result: str
+    risk_level: str
+
+
+class ProspectReference(TypedDict):
+    clientID: str
+
+
+def _new_prospect(first_name: str, last_name: str, dob: str, nationality: str, referral_source: str) -> Dict[str, Any]:
+    new_id = f"PROSP{10 + tool_random('create_prospect', first_name, last_name, dob).randint(1000, 9999)}"
 
     new_prospect = {
         "clientID": new_id,
@@ -46,20 +81,18 @@ def create_prospect(first_name: str, last_name: str, dob: str, nationality: str,
         },
         "declared_source_of_wealth" : ""
     }
+    return new_prospect
+
+
+def create_prospect(first_name: str, last_name: str, dob: str, nationality: str, referral_source: str) -> Dict[str, Any]:
+    """
+    Create a prospect in the CRM with initial mimimal information
     
+    """
+    new_prospect = _new_prospect(first_name, last_name, dob, nationality, referral_source)
+
     try:
-        # Example of how to pull from environment variables:
-        cosmosdb_endpoint = os.getenv("COSMOSDB_ENDPOINT") or ""
-        crm_database_name = os.getenv("COSMOSDB_DATABASE_NAME") or ""
-        crm_container_name = os.getenv("COSMOSDB_CONTAINER_CLIENT_NAME") or ""
-        key=DefaultAzureCredential()
-        
-        crm_db = CRMStore(
-             url=cosmosdb_endpoint,
-             key=key,
-             database_name=crm_database_name,
-             container_name=crm_container_name
-        )
+        crm_db = get_crm_store()
 
         response = crm_db.create_customer_profile(new_prospect)
         return json.dumps(response) if response else None
@@ -70,26 +103,41 @@ def create_prospect(first_name: str, last_name: str, dob: str, nationality: str,
    
 
 
+def _best_name_match(matches, full_name):
+    """
+    The clientID of the best name match, or the error to return when several prospects match equally well
+    (the agent must not pick one of them at random).
+
+    Returns:
+    - (str, dict): The clientID (None if nothing matched) and the ambiguity error (None if unambiguous).
+    """
+    if not matches:
+        return None, None
+    tied = [match for match in matches if match["score"] == matches[0]["score"]]
+    if len(tied) > 1:
+        return None, {"error": f"Several prospects match the name '{full_name}'", "candidates": tied}
+    return matches[0]["clientID"], None
+
+
+@tool(reads={"*"})
 def fetch_prospect_details(full_name: str) -> str:
     """
     Load prospect data from the CRM using the given full name.
-    
+
+    Args:
+    - full_name (str): The full name of the prospect (e.g., 'John Doe').
     """
     try:
-        # Example of how to pull from environment variables:
-        cosmosdb_endpoint = os.getenv("COSMOSDB_ENDPOINT") or ""
-        crm_database_name = os.getenv("COSMOSDB_DATABASE_NAME") or ""
-        crm_container_name = os.getenv("COSMOSDB_CONTAINER_CLIENT_NAME") or ""
-        key=DefaultAzureCredential()
-        
-        crm_db = CRMStore(
-             url=cosmosdb_endpoint,
-             key=key,
-             database_name=crm_database_name,
-             container_name=crm_container_name
-        )
-
-        response = crm_db.get_customer_profile_by_full_name(full_name)
+        crm_db = get_crm_store()
+
+        client_id, ambiguous = _best_name_match(crm_db.search_customer_profiles_by_name(full_name, limit=5), full_name)
+        if ambiguous:
+            return json.dumps(ambiguous)
+        if client_id is None:
+            return None
+        uow = current_unit_of_work()
+        # read-your-writes within an agent run
+        response = uow.get(client_id) if uow is not None else crm_db.get_customer_profile_by_client_id(client_id)
         return json.dumps(response) if response else None
 
     except Exception as e:
@@ -103,20 +151,12 @@ def fetch_prospect_details_by_id(clientID: str) -> str:
     
     """
     try:
-        # Example of how to pull from environment variables:
-        cosmosdb_endpoint = os.getenv("COSMOSDB_ENDPOINT") or ""
-        crm_database_name = os.getenv("COSMOSDB_DATABASE_NAME") or ""
-        crm_container_name = os.getenv("COSMOSDB_CONTAINER_CLIENT_NAME") or ""
-        key=DefaultAzureCredential()
-        
-        crm_db = CRMStore(
-             url=cosmosdb_endpoint,
-             key=key,
-             database_name=crm_database_name,
-             container_name=crm_container_name
-        )
-
-        response = crm_db.get_customer_profile_by_client_id(clientID)
+        uow = current_unit_of_work()
+        if uow is not None:
+            response = uow.get(clientID)
+        else:
+            crm_db = get_crm_store()
+            response = crm_db.get_customer_profile_by_client_id(clientID)
         return json.dumps(response) if response else None
 
     except Exception as e:
@@ -125,38 +165,73 @@ def fetch_prospect_details_by_id(clientID: str) -> str:
   
   
 
-def update_prospect_details(client_id: str, prospect_data: Dict[str, Any]) -> Dict[str, Any]:
+def update_prospect_details(client_id: str, prospect_data: Dict[str, Any], events: List[Dict[str, Any]] = None,
+                            fields=None) -> Dict[str, Any]:
     """
     Update prospect data in the CRM.
-    
+    `events` are the history events logged by a workflow step: they are appended to the events
+    container and only the most recent ones are kept in the profile.
+    `fields`, if given, are the only fields of prospect_data written (the fields the tool writes).
     """
     try:
-        # Example of how to pull from environment variables:
-        cosmosdb_endpoint = os.getenv("COSMOSDB_ENDPOINT") or ""
-        crm_database_name = os.getenv("COSMOSDB_DATABASE_NAME") or ""
-        crm_container_name = os.getenv("COSMOSDB_CONTAINER_CLIENT_NAME") or ""
-        key=DefaultAzureCredential()
-        
-        crm_db = CRMStore(
-             url=cosmosdb_endpoint,
-             key=key,
-             database_name=crm_database_name,
-             container_name=crm_container_name
-        )
-
-        updated_prospect = crm_db.update_customer_profile(client_id, prospect_data)
+        uow = current_unit_of_work()
+        if uow is not None:
+            # Staged in the run's working copy, written once when the run commits
+            updated_prospect = uow.stage(client_id, prospect_data, events, fields)
+        elif events is not None:
+            with unit_of_work(get_crm_store(), commit_every=0) as uow:
+                uow.stage(client_id, prospect_data, events, fields)
+            updated_prospect = uow.get(client_id)
+        else:
+            crm_db = get_crm_store()
+            updated_prospect = crm_db.update_customer_profile(client_id, _written(prospect_data, fields))
         return updated_prospect if updated_prospect else None
 
     except Exception as e:
         logging.error(f"Error in update_prospect_details: {str(e)}")
-        return json.dumps({"error": f"update_prospect_details failed with error: {str(e)}"})
+        return {"error": f"update_prospect_details failed with error: {str(e)}"}
     
 
-def collect_kyc_info(prospect_data: Dict[str, Any]) -> Dict[str, Any]:
+def _written(prospect_data, fields):
+    return prospect_data if fields is None else {key: value for key, value in prospect_data.items() if key in fields}
+
+
+def _tool_writes(step):
+    # The fields the tool of a workflow step declares it writes (@tool(writes=...))
+    return TOOL_REGISTRY[step.__name__.lstrip('_')].writes
+
+
+# Workflow steps: business logic only, mutating prospect_data in place (persistence is done by the tools below).
+
+def _log_onboarding(prospect_data: Dict[str, Any], step: str, action: str) -> Dict[str, Any]:
+    event = new_event(prospect_data.get("clientID"), "onboarding", step, action)
+    prospect_data.setdefault("onboarding", []).append(event)
+    return event
+
+
+def _run_step(step, prospect_data: Dict[str, Any], *args, **kwargs):
+    """
+    Runs a workflow step and returns its result and the history events it logged.
+    """
+    logged = {id(entry) for field in EVENT_FIELDS.values() for entry in prospect_data.get(field, [])}
+    result = step(prospect_data, *args, **kwargs)
+    events = [entry for field in EVENT_FIELDS.values() for entry in prospect_data.get(field, [])
+              if id(entry) not in logged]
+    return result, events
+
+
+def _step_update(step, prospect_data: Dict[str, Any], *args, **kwargs):
     """
-    KYC Information Collection
-    - Checks if mandatory fields are present.
+    Runs a workflow step for its tool (sync or async).
+
+    Returns:
+    - (Any, tuple): The step result and the update_prospect_details(_async) arguments persisting it.
     """
+    result, events = _run_step(step, prospect_data, *args, **kwargs)
+    return result, (prospect_data['clientID'], prospect_data, events, _tool_writes(step))
+
+
+def _collect_kyc_info(prospect_data: Dict[str, Any]) -> Dict[str, Any]:
     mandatory_fields = ["firstName", "lastName", "dateOfBirth", "nationality"]
     missing_fields = [field for field in mandatory_fields if field not in prospect_data]
     
@@ -172,22 +247,10 @@ def collect_kyc_info(prospect_data: Dict[str, Any]) -> Dict[str, Any]:
       prospect_data['status'] = kyc_status
 
       # Add onboarding log entry
-      
-      onboarding_entry = {
-          "timestamp": datetime.now().isoformat(),
-          "step": kyc_status,
-          "action": action_description
-      }
-      
-      if "onboarding" not in prospect_data:
-        prospect_data["onboarding"] = []
-      prospect_data["onboarding"].append(onboarding_entry)
-
-      # Persist updated prospect data
-      update_prospect_details(prospect_data['clientID'], prospect_data)
+      _log_onboarding(prospect_data, kyc_status, action_description)
 
     except Exception as e:
-      logging.error('error', f"Error in collect_kyc_info: {e}")
+      logging.error(f"Error in collect_kyc_info: {e}")
 
     return {
         "status": kyc_status,
@@ -195,11 +258,7 @@ def collect_kyc_info(prospect_data: Dict[str, Any]) -> Dict[str, Any]:
     }
 
 
-def collect_sow_info(prospect_data: Dict[str, Any]) -> Dict[str, Any]:
-    """
-    Source of Wealth (SOW) Information Collection
-    - Accepts a declared source of wealth.
-    """
+def _collect_sow_info(prospect_data: Dict[str, Any]) -> Dict[str, Any]:
     #mocked fixed response
     sow = prospect_data.get("declared_source_of_wealth", "Employment")
 
@@ -208,31 +267,17 @@ def collect_sow_info(prospect_data: Dict[str, Any]) -> Dict[str, Any]:
       prospect_data['status'] = "SOW information captured"
 
       # Add onboarding log entry
-      onboarding_entry = {
-          "timestamp": datetime.now().isoformat(),
-          "step": prospect_data['status'],
-          "action": f"SOW information captured: {prospect_data.get("declared_source_of_wealth", "")}"
-      }
-      
-      if "onboarding" not in prospect_data:
-        prospect_data["onboarding"] = []
-      prospect_data["onboarding"].append(onboarding_entry)
-
-      update_prospect_details(prospect_data['clientID'], prospect_data)
+      _log_onboarding(prospect_data, prospect_data['status'], f"SOW information captured: {prospect_data.get('declared_source_of_wealth', '')}")
 
     except Exception as e:
-      logging.error('error', f"Error in collect_sow_info: {e}")
+      logging.error(f"Error in collect_sow_info: {e}")
 
     return {
         "onboarding": prospect_data["onboarding"],
         "status": "SOW information captured"
     }
 
-def perform_data_management_ai_extraction(prospect_data: Dict[str, Any]) -> Dict[str, Any]:
-    """
-    Data Management & AI Extraction
-    - Mock logic that pretends to parse attached documents (PDFs, images, etc.) to enrich the KYC.
-    """
+def _perform_data_management_ai_extraction(prospect_data: Dict[str, Any]) -> Dict[str, Any]:
     # Simulate a minimal list of required documents.
     required_docs = ["passport", "proof_of_address"]
     provided_docs = prospect_data.get("documents_provided", [])
@@ -244,7 +289,7 @@ def perform_data_management_ai_extraction(prospect_data: Dict[str, Any]) -> Dict
     extracted_data_points = {}
     for doc in provided_docs:
         if doc == "passport":
-            extracted_data_points["passport_number"] = f"P-{random.randint(100000, 999999)}"
+            extracted_data_points["passport_number"] = f"P-{tool_random('passport_number', prospect_data.get('clientID')).randint(100000, 999999)}"
             extracted_data_points["passport_issue_date"] = "2020-01-01"
             extracted_data_points["passport_expiry_date"] = "2030-01-01"
         elif doc == "proof_of_address":
@@ -257,29 +302,16 @@ def perform_data_management_ai_extraction(prospect_data: Dict[str, Any]) -> Dict
     prospect_data['status'] = "Documents AI extraction completed"
 
     # Add onboarding log entry
-    onboarding_entry = {
-        "timestamp": datetime.now().isoformat(),
-        "step": prospect_data['status'],
-        "action": "Documents AI extraction completed"
-    }
-    
-    if "onboarding" not in prospect_data:
-        prospect_data["onboarding"] = []
-    prospect_data["onboarding"].append(onboarding_entry)
-    update_prospect_details(prospect_data['clientID'], prospect_data)
+    _log_onboarding(prospect_data, prospect_data['status'], "Documents AI extraction completed")
 
     return {
         "extracted_fields": extracted_data_points,
         "status": "Documents AI extraction completed"
     }
 
-def perform_name_screening(prospect_data: Dict[str, Any]) -> Dict[str, Any]:
-    """
-    Name Screening & Exception Handling
-    - Simulates if the prospect name appears on a watchlist or sanctions list.
-    """
+def _perform_name_screening(prospect_data: Dict[str, Any]) -> Dict[str, Any]:
     possible_outcomes = ["No match", "Potential match", "Sanctions list match"]
-    screening_outcome = random.choices(
+    screening_outcome = tool_random("name_screening", prospect_data.get("clientID")).choices(
         possible_outcomes,
         weights=[0.8, 0.15, 0.05],  # Weighted to produce 'No match' more often
         k=1
@@ -297,27 +329,14 @@ def perform_name_screening(prospect_data: Dict[str, Any]) -> Dict[str, Any]:
     prospect_data['name_screening_result'] = screening_outcome
 
     # Add onboarding log entry
-    onboarding_entry = {
-        "timestamp": datetime.now().isoformat(),
-        "step": prospect_data['status'],
-        "action": prospect_data['status']+f": Screening outcome: {screening_outcome}"
-    }
-    
-    if "onboarding" not in prospect_data:
-        prospect_data["onboarding"] = []
-    prospect_data["onboarding"].append(onboarding_entry)
-    update_prospect_details(prospect_data['clientID'], prospect_data)
+    _log_onboarding(prospect_data, prospect_data['status'], prospect_data['status']+f": Screening outcome: {screening_outcome}")
     
     return {
         "name_screening_result": screening_outcome,
         "status": screening_status
     }
 
-def create_client_profile(prospect_data: Dict[str, Any], name_screening_result: str) -> Dict[str, Any]:
-    """
-    Client Profile Risk Evaluation
-    - Calculate a simple risk score/level based on name screening and nationality.
-    """
+def _create_client_profile(prospect_data: Dict[str, Any], name_screening_result: str) -> Dict[str, Any]:
     screening_outcome = name_screening_result
     risk_score = 0
     
@@ -333,7 +352,7 @@ def create_client_profile(prospect_data: Dict[str, Any], name_screening_result:
         risk_score += 5
     
     # Random minor variation
-    risk_score += random.randint(0, 3)
+    risk_score += tool_random("risk_score", prospect_data.get("clientID")).randint(0, 3)
     
     if risk_score <= 3:
         risk_level = "Low"
@@ -348,15 +367,7 @@ def create_client_profile(prospect_data: Dict[str, Any], name_screening_result:
     prospect_data['status'] = "Client risk profile assessed"
 
     # Add onboarding log entry
-    onboarding_entry = {
-        "timestamp": datetime.now().isoformat(),
-        "step": prospect_data['status'],
-        "action": prospect_data['status']+f": Risk level is {risk_level}"
-    }
-    
-    if "onboarding" not in prospect_data:
-        prospect_data["onboarding"] = []
-    update_prospect_details(prospect_data['clientID'], prospect_data)
+    _log_onboarding(prospect_data, prospect_data['status'], prospect_data['status']+f": Risk level is {risk_level}")
 
     return {
         "risk_score": risk_score,
@@ -364,11 +375,7 @@ def create_client_profile(prospect_data: Dict[str, Any], name_screening_result:
         "status": "Client risk profile assessed"
     }
 
-def perform_compliance_risk_assessment(prospect_data: Dict[str, Any] ) -> Dict[str, Any]:
-    """
-    Compliance & Risk Assessment
-    - If risk is 'High' or there's a sanctions list match, flag EDD.
-    """
+def _perform_compliance_risk_assessment(prospect_data: Dict[str, Any] ) -> Dict[str, Any]:
 
     flagged_issues = []
     
@@ -388,58 +395,249 @@ def perform_compliance_risk_assessment(prospect_data: Dict[str, Any] ) -> Dict[s
       prospect_data['compliance_flags'] = flagged_issues
 
       # Add onboarding log entry
-      onboarding_entry = {
-          "timestamp": datetime.now().isoformat(),
-          "step": prospect_data['status'],
-          "action": prospect_data['status']+f": Compliance status is {compliance_status}"
-      }
-      
-      if "onboarding" not in prospect_data:
-        prospect_data["onboarding"] = []
-      prospect_data["onboarding"].append(onboarding_entry)
-      update_prospect_details(prospect_data['clientID'], prospect_data)
+      _log_onboarding(prospect_data, prospect_data['status'], prospect_data['status']+f": Compliance status is {compliance_status}")
 
     except Exception as e:
-      logging.error('error', f"Error in perform_compliance_risk_assessment: {e}")
+      logging.error(f"Error in perform_compliance_risk_assessment: {e}")
 
     return {
         "overall_status": compliance_status,
         "flagged_issues": flagged_issues
     }
 
+_ASSIGNED_TO_FIRST_LINE_OF_DEFENCE = {"status": "Assigned to human review (first line of defence)"}
+
+def _assign_first_line_of_defence(prospect: Dict[str, Any]) -> Dict[str, Any]:
+    #update client data status
+    prospect['status'] = _ASSIGNED_TO_FIRST_LINE_OF_DEFENCE["status"]
+    
+    # Add onboarding log entry
+    _log_onboarding(prospect, prospect['status'], prospect['status']+f": Waiting for first compliance approval")
+
+    return dict(_ASSIGNED_TO_FIRST_LINE_OF_DEFENCE)
+
+
+# Workflow tools: run the step logic above on prospect_data and persist the result in the CRM.
+# The ruleset runs a step only on the status returned by the previous one: those steps read "status",
+# so they never run in the same wave of tool calls as the step before them.
+
+@tool(reads={"firstName", "lastName", "dateOfBirth", "nationality"}, writes={"status", "onboarding"})
+def collect_kyc_info(prospect_data: ProspectIdentity) -> Dict[str, Any]:
+    """
+    KYC Information Collection: checks if mandatory fields are present.
+
+    Args:
+    - prospect_data (dict): A dictionary of prospect data from the CRM.
+    """
+    result, update = _step_update(_collect_kyc_info, prospect_data)
+    update_prospect_details(*update)
+    return result
+
+@tool(reads={"status", "declared_source_of_wealth"}, writes={"status", "onboarding"})
+def collect_sow_info(prospect_data: ProspectIdentity) -> Dict[str, Any]:
+    """
+    Collect declared source of wealth (SOW) from prospect data.
+
+    Args:
+    - prospect_data (dict): A dictionary of prospect data from the CRM.
+    """
+    result, update = _step_update(_collect_sow_info, prospect_data)
+    update_prospect_details(*update)
+    return result
+
+@tool(reads={"status", "documents_provided", "corporation_name", "incorporation_year"}, writes={"status", "onboarding"})
+def perform_data_management_ai_extraction(prospect_data: ProspectDocuments) -> Dict[str, Any]:
+    """
+    Parse attached docs (PDFs, images, etc.) with AI to extract relevant data.
+
+    Mock logic that pretends to parse attached documents to enrich the KYC.
+
+    Args:
+    - prospect_data (dict): A dictionary of prospect data that may include 'documents_provided'.
+    """
+    result, update = _step_update(_perform_data_management_ai_extraction, prospect_data)
+    update_prospect_details(*update)
+    return result
+
+@tool(reads={"status", "firstName", "lastName"}, writes={"status", "name_screening_result", "onboarding"})
+def perform_name_screening(prospect_data: ProspectIdentity) -> Dict[str, Any]:
+    """
+    Randomly decides if the name appears on watchlists or sanctions lists.
+
+    Args:
+    - prospect_data (dict): A dictionary of prospect data containing name fields.
+    """
+    result, update = _step_update(_perform_name_screening, prospect_data)
+    update_prospect_details(*update)
+    return result
+
+@tool(reads={"status", "nationality", "name_screening_result"}, writes={"status", "risk_level", "risk_score", "onboarding"})
+def create_client_profile(prospect_data: ProspectRiskProfile, name_screening_result: str) -> Dict[str, Any]:
+    """
+    Create a risk profile for the client based on name screening and nationality.
+
+    Args:
+    - prospect_data (dict): Prospect data containing nationality, etc.
+    - name_screening_result (str): The result of perform_name_screening function.
+    """
+    result, update = _step_update(_create_client_profile, prospect_data, name_screening_result)
+    update_prospect_details(*update)
+    return result
+
+@tool(reads={"status", "risk_level", "name_screening_result"}, writes={"status", "compliance_flags", "onboarding"})
+def perform_compliance_risk_assessment(prospect_data: ProspectRiskAssessment) -> Dict[str, Any]:
+    """
+    Compliance check to determine if Enhanced Due Diligence is needed.
+
+    If risk is 'High' or there's a sanctions list match, flag EDD.
+
+    Args:
+    - prospect_data (dict): Prospect data containing risk_level, status, etc.
+    """
+    result, update = _step_update(_perform_compliance_risk_assessment, prospect_data)
+    update_prospect_details(*update)
+    return result
+
 #3.1 Human interface case assigned for go/no-go (first line of defence)
-def assign_first_line_of_defence(prospect_data: Dict[str, Any]) -> Dict[str, Any]:
+@tool(reads={"*"}, writes={"status", "onboarding"})
+def assign_first_line_of_defence(prospect_data: ProspectReference) -> Dict[str, Any]:
     """
-    Assign the case with data and status so far to a Human interface for go/no-go (first line of defence).
+    Assign the case to a human interface for go/no-go (first line of defence).
+
+    The case is assigned with the data and status so far.
 
+    Args:
+    - prospect_data (dict): A dictionary containing up-to-date prospect info and status.
     """
     #TODO external process logic (human case review etc.)
     
     try:
       prospect_loaded = fetch_prospect_details_by_id(prospect_data["clientID"])  
-      prospect = json.loads(prospect_loaded)
-
-      #update client data status
-      prospect['status'] = "Assigned to human review (first line of defence)"
-      
-      # Add onboarding log entry
-      onboarding_entry = {
-          "timestamp": datetime.now().isoformat(),
-          "step": prospect['status'],
-          "action": prospect['status']+f": Waiting for first compliance approval"
-      }
-      
-      if "onboarding" not in prospect:
-        prospect["onboarding"] = []
-      prospect["onboarding"].append(onboarding_entry)
-      update_prospect_details(prospect['clientID'], prospect)
+      _, update = _step_update(_assign_first_line_of_defence, json.loads(prospect_loaded))
+      update_prospect_details(*update)
     
     except Exception as e:
-        logging.error('error', f"Error in assign_first_line_of_defence: {e}")
+        logging.error(f"Error in assign_first_line_of_defence: {e}")
 
-    return {
-        "status": "Assigned to human review (first line of defence)"
-    }
+    return dict(_ASSIGNED_TO_FIRST_LINE_OF_DEFENCE)
+
+
+# Async tools (asyncio request path): same workflow steps, persisted through the AsyncCRMStore.
+
+async def create_prospect_async(first_name: str, last_name: str, dob: str, nationality: str, referral_source: str) -> Dict[str, Any]:
+    """
+    Async variant of create_prospect.
+    """
+    new_prospect = _new_prospect(first_name, last_name, dob, nationality, referral_source)
+    try:
+        crm_db = await get_async_crm_store()
+        response = await crm_db.create_customer_profile(new_prospect)
+        return json.dumps(response) if response else None
+
+    except Exception as e:
+        logging.error(f"Error in create_prospect_async: {str(e)}")
+        return json.dumps({"error": f"create_prospect failed with error: {str(e)}"})
+
+
+@TOOL_REGISTRY.async_variant("fetch_prospect_details")
+async def fetch_prospect_details_async(full_name: str) -> str:
+    """
+    Async variant of fetch_prospect_details.
+    """
+    try:
+        crm_db = await get_async_crm_store()
+        matches = await crm_db.search_customer_profiles_by_name(full_name, limit=5)
+        client_id, ambiguous = _best_name_match(matches, full_name)
+        if ambiguous:
+            return json.dumps(ambiguous)
+        if client_id is None:
+            return None
+        uow = current_unit_of_work()
+        response = await uow.aget(client_id) if uow is not None else await crm_db.get_customer_profile_by_client_id(client_id)
+        return json.dumps(response) if response else None
+
+    except Exception as e:
+        logging.error(f"Error in fetch_prospect_details_async: {str(e)}")
+        return json.dumps({"error": f"load_from_crm_by_client_fullname failed with error: {str(e)}"})
+
+
+async def fetch_prospect_details_by_id_async(clientID: str) -> str:
+    """
+    Async variant of fetch_prospect_details_by_id.
+    """
+    try:
+        uow = current_unit_of_work()
+        if uow is not None:
+            response = await uow.aget(clientID)
+        else:
+            crm_db = await get_async_crm_store()
+            response = await crm_db.get_customer_profile_by_client_id(clientID)
+        return json.dumps(response) if response else None
+
+    except Exception as e:
+        logging.error(f"Error in fetch_prospect_details_by_id_async: {str(e)}")
+        return json.dumps({"error": f"load_from_crm_by_client_fullname failed with error: {str(e)}"})
+
+
+async def update_prospect_details_async(client_id: str, prospect_data: Dict[str, Any], events: List[Dict[str, Any]] = None,
+                                        fields=None) -> Dict[str, Any]:
+    """
+    Async variant of update_prospect_details.
+    """
+    try:
+        uow = current_unit_of_work()
+        if uow is not None:
+            updated_prospect = await uow.astage(client_id, prospect_data, events, fields)
+        elif events is not None:
+            async with async_unit_of_work(await get_async_crm_store(), commit_every=0) as uow:
+                await uow.astage(client_id, prospect_data, events, fields)
+            updated_prospect = await uow.aget(client_id)
+        else:
+            crm_db = await get_async_crm_store()
+            updated_prospect = await crm_db.update_customer_profile(client_id, _written(prospect_data, fields))
+        return updated_prospect if updated_prospect else None
+
+    except Exception as e:
+        logging.error(f"Error in update_prospect_details_async: {str(e)}")
+        return {"error": f"update_prospect_details failed with error: {str(e)}"}
+
+
+def _async_workflow_tool(step):
+    """
+    Builds the async tool for a workflow step: runs the step logic and persists prospect_data asynchronously.
+    """
+    async def async_tool(prospect_data: Dict[str, Any], **kwargs) -> Dict[str, Any]:
+        result, update = _step_update(step, prospect_data, **kwargs)
+        await update_prospect_details_async(*update)
+        return result
+
+    name = step.__name__.lstrip('_')
+    async_tool.__name__ = name + '_async'
+    return TOOL_REGISTRY.async_variant(name)(async_tool)
+
+
+collect_kyc_info_async = _async_workflow_tool(_collect_kyc_info)
+collect_sow_info_async = _async_workflow_tool(_collect_sow_info)
+perform_data_management_ai_extraction_async = _async_workflow_tool(_perform_data_management_ai_extraction)
+perform_name_screening_async = _async_workflow_tool(_perform_name_screening)
+create_client_profile_async = _async_workflow_tool(_create_client_profile)
+perform_compliance_risk_assessment_async = _async_workflow_tool(_perform_compliance_risk_assessment)
+
+
+@TOOL_REGISTRY.async_variant("assign_first_line_of_defence")
+async def assign_first_line_of_defence_async(prospect_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Async variant of assign_first_line_of_defence.
+    """
+    try:
+      prospect_loaded = await fetch_prospect_details_by_id_async(prospect_data["clientID"])
+      _, update = _step_update(_assign_first_line_of_defence, json.loads(prospect_loaded))
+      await update_prospect_details_async(*update)
+
+    except Exception as e:
+        logging.error(f"Error in assign_first_line_of_defence_async: {e}")
+
+    return dict(_ASSIGNED_TO_FIRST_LINE_OF_DEFENCE)
 
 
 #TODO: 5. Onboarding forms: filling, dispatching to client
@@ -448,301 +646,30 @@ def assign_first_line_of_defence(prospect_data: Dict[str, Any]) -> Dict[str, Any
 #TODO: 8. EDD Integration (high risk case escalations only?)
 #TODO: 9. Account opening at Core banking system + welcome letter with accounts instructions
 
+@tool()
 def instructions_complete():
+    """
+    signal that the execution should end.
+    """
     return
 
 
-FUNCTION_MAPPING = {
-    'fetch_prospect_details': fetch_prospect_details,
-    'collect_kyc_info': collect_kyc_info,
-    'collect_sow_info': collect_sow_info,
-    'perform_data_management_ai_extraction': perform_data_management_ai_extraction,
-    'perform_name_screening': perform_name_screening,
-    'create_client_profile': create_client_profile,
-    'perform_compliance_risk_assessment': perform_compliance_risk_assessment,
-    'assign_first_line_of_defence' : assign_first_line_of_defence,
-    'instructions_complete': instructions_complete
-    
-}
-
-TOOLS = [
-    {
-      "type": "function",
-      "function": {
-        "name": "fetch_prospect_details",
-        "description": "Load prospect data from the CRM using the given full name.",
-        "parameters": {
-          "type": "object",
-          "properties": {
-            "full_name": {
-              "type": "string",
-              "description": "The full name of the prospect (e.g., 'John Doe')."
-            }
-          },
-          "required": ["full_name"]
-        }
-      }
-    },
-    {
-      "type": "function",
-      "function": {
-        "name": "collect_kyc_info",
-        "description": "KYC Information Collection: checks if mandatory fields are present.",
-        "parameters": {
-          "type": "object",
-          "properties": {
-            "prospect_data": {
-              "type": "object",
-              "properties": {
-                "clientID": {
-                  "type": "string"
-                },
-                "firstName": {
-                  "type": "string"
-                },
-                "lastName": {
-                  "type": "string"
-                },
-                "dateOfBirth": {
-                  "type": "string"
-                },
-                "nationality": {
-                  "type": "string"
-                }
-              },
-              "required": [
-                "clientID",
-                "firstName",
-                "lastName",
-                "dateOfBirth",
-                "nationality"
-              ],
-              "description": "A dictionary of prospect data from the CRM.",
-            }
-          },
-          "required": ["prospect_data"]
-        }
-      }
-    },
-    {
-      "type": "function",
-      "function": {
-        "name": "collect_sow_info",
-        "description": "Collect declared source of wealth (SOW) from prospect data.",
-        "parameters": {
-          "type": "object",
-          "properties": {
-            "prospect_data": {
-              "type": "object",
-              "properties": {
-                "clientID": {
-                  "type": "string"
-                },
-                "firstName": {
-                  "type": "string"
-                },
-                "lastName": {
-                  "type": "string"
-                },
-                "dateOfBirth": {
-                  "type": "string"
-                },
-                "nationality": {
-                  "type": "string"
-                }
-              },
-              "required": [
-                "clientID",
-                "firstName",
-                "lastName",
-                "dateOfBirth",
-                "nationality"
-              ],
-              "description": "A dictionary of prospect data from the CRM."
-            }
-          },
-          "required": ["prospect_data"]
-        }
-      }
-    },
-    {
-      "type": "function",
-      "function": {
-        "name": "perform_data_management_ai_extraction",
-        "description": "Parse attached docs (PDFs, images, etc.) with AI to extract relevant data.",
-        "parameters": {
-          "type": "object",
-          "properties": {
-            "prospect_data": {
-              "type": "object",
-              "properties": {
-                "clientID": {
-                  "type": "string"
-                },
-                "documents_provided": {
-                  "type": "array",
-                  "description": "A list of documents name provided by the prospect.",
-                  "items": {
-                    "type": "string"
-                  }
-                }
-              },
-              "required": [
-                "clientID",
-                "documents_provided"
-              ],
-              "description": "A dictionary of prospect data that may include 'documents_provided'."
-            }
-          },
-          "required": ["prospect_data"]
-        }
-      }
-    },
-    {
-      "type": "function",
-      "function": {
-        "name": "perform_name_screening",
-        "description": "Randomly decides if the name appears on watchlists or sanctions lists.",
-        "parameters": {
-          "type": "object",
-          "properties": {
-            "prospect_data": {
-              "type": "object",
-              "properties": {
-                "clientID": {
-                  "type": "string"
-                },
-                "firstName": {
-                  "type": "string"
-                },
-                "lastName": {
-                  "type": "string"
-                },
-                "dateOfBirth": {
-                  "type": "string"
-                },
-                "nationality": {
-                  "type": "string"
-                }
-              },
-              "required": [
-                "clientID",
-                "firstName",
-                "lastName",
-                "dateOfBirth",
-                "nationality"
-              ],
-              "description": "A dictionary of prospect data containing name fields."
-            }
-          },
-          "required": ["prospect_data"]
-        }
-      }
-    },
-    {
-      "type": "function",
-      "function": {
-        "name": "create_client_profile",
-        "description": "Create a risk profile for the client based on name screening and nationality.",
-        "parameters": {
-          "type": "object",
-          "properties": {
-            "prospect_data": {
-             "type": "object",
-              "properties": {
-                "clientID": {
-                  "type": "string"
-                },
-                "risk_level": {
-                  "type": "string"
-                },
-                "risk_score": {
-                  "type": "integer"
-                },
-                "nationality": {
-                  "type": "string"
-                }
-              },
-              "required": [
-                "clientID",
-                "risk_level",
-                "risk_score",
-                "nationality"
-              ],
-              "description": "Prospect data containing nationality, etc."
-            },
-            "name_screening_result": {
-              "type": "string",
-              "description": "The result of perform_name_screening function."
-            }
-          },
-          "required": ["prospect_data", "name_screening_result"]
-        }
-      }
-    },
-    {
-      "type": "function",
-      "function": {
-        "name": "perform_compliance_risk_assessment",
-        "description": "Compliance check to determine if Enhanced Due Diligence is needed.",
-        "parameters": {
-          "type": "object",
-          "properties": {
-            "prospect_data": {
-             "type": "object",
-              "properties": {
-                "clientID": {
-                  "type": "string"
-                },
-                "name_screening_result": {
-                  "type": "string"
-                },
-                "risk_level": {
-                  "type": "string"
-                }
-              },
-              "required": [
-                "clientID",
-                "name_screening_result",
-                "risk_level"
-              ],
-              "description": "Prospect data containing risk_level, status, etc."
-            }
-          },
-          "required": ["prospect_data"]
-        }
-      }
-    },
-    {
-      "type": "function",
-      "function": {
-        "name": "assign_first_line_of_defence",
-        "description": "Assign the case to a human interface for go/no-go (first line of defence).",
-        "parameters": {
-          "type": "object",
-          "properties": {
-              "prospect_data": {
-                "type": "object",
-                "properties": {
-                    "clientID": {
-                      "type": "string"
-                    }
-                  },
-                  "required": [
-                    "clientID"
-                  ],
-                  "description": "A dictionary containing up-to-date prospect info and status."
-              }
-            },
-            "required": ["prospect_data"]
-        }
-      }
-    },
-    {
-      "type": "function",
-      "function": {
-        "name": "instructions_complete",
-        "description": "signal that the execution should end.",
-      }
-    }
-]
+@TOOL_REGISTRY.async_variant("instructions_complete")
+async def instructions_complete_async():
+    return
+
+
+FUNCTION_MAPPING = TOOL_REGISTRY.function_mapping()
+ASYNC_FUNCTION_MAPPING = TOOL_REGISTRY.async_function_mapping()
+
+# Tool definitions of the chat completions API, and their compact JSON for prompts
+TOOLS = TOOL_REGISTRY.schemas()
+TOOLS_JSON = TOOL_REGISTRY.schemas_json()
+
+# Prospect fields each tool reads and writes (declared with @tool), used by the executor to run the
+# independent tool calls of a turn concurrently. "*" reads the whole profile. The status and the history
+# logs are written by every step: concurrent writes to them are applied in the order of the calls, but a
+# tool reading the status (a status-gated step) waits for the tools writing it.
+TOOL_EFFECTS = TOOL_REGISTRY.effects()
+
+ORDERED_FIELDS = {"status", *EVENT_FIELDS.values()}
@@ -0,0 +1,43 @@
+import os
+import random
+import hashlib
+import contextvars
+from contextlib import contextmanager
+
+# Seed of the agent run in progress (None: the tools draw from the global, unseeded generator)
+_run_seed = contextvars.ContextVar("tool_random_seed", default=None)
+
+
+def tool_random(*labels):
+    """
+    Random generator of a tool step (name screening outcome, risk score jitter, generated IDs).
+
+    In a seeded run, the generator is seeded from the run seed and `labels` (e.g. the step name and the
+    clientID): a step draws the same values whatever the order or the concurrency of the tool calls.
+    Outside a seeded run, the `random` module itself is returned.
+    """
+    seed = _run_seed.get()
+    if seed is None:
+        return random
+    return random.Random(hashlib.sha256("|".join(map(str, (seed, *labels))).encode()).hexdigest())
+
+
+@contextmanager
+def seeded_tool_random(seed):
+    """
+    Seeds the tool randomness of the enclosed run (and of the tasks and forks it starts); None leaves it unseeded.
+    """
+    token = _run_seed.set(None if seed is None else str(seed))
+    try:
+        yield
+    finally:
+        _run_seed.reset(token)
+
+
+def get_run_seed(seed=None):
+    """
+    The seed of a run: the one given with the request, AO_TOOL_SEED otherwise (None if unset).
+    """
+    if seed is not None:
+        return seed
+    return os.getenv("AO_TOOL_SEED") or None
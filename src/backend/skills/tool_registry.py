@@ -0,0 +1,184 @@
+import re
+import json
+import inspect
+from typing import Any, Dict, List, Union, Annotated, get_args, get_origin, get_type_hints, is_typeddict
+
+from telemetry import traced_tool
+
+_JSON_TYPES = {str: "string", int: "integer", float: "number", bool: "boolean"}
+
+# "- name (type): description" lines of the Args section of a docstring
+_ARG_LINE = re.compile(r'^\s*-\s*(\w+)\s*(?:\([^)]*\))?\s*:\s*(.+)$')
+
+
+def json_schema(annotation) -> Dict[str, Any]:
+    """
+    JSON schema of a type hint: str/int/float/bool, List[...], Dict[...], TypedDict (an object with
+    its keys as properties) and Annotated[type, "description"].
+    """
+    if get_origin(annotation) is Annotated:
+        base, *metadata = get_args(annotation)
+        schema = json_schema(base)
+        descriptions = [item for item in metadata if isinstance(item, str)]
+        if descriptions:
+            schema["description"] = descriptions[0]
+        return schema
+    if annotation in _JSON_TYPES:
+        return {"type": _JSON_TYPES[annotation]}
+    if is_typeddict(annotation):
+        hints = get_type_hints(annotation, include_extras=True)
+        return {
+            "type": "object",
+            "properties": {name: json_schema(hint) for name, hint in hints.items()},
+            "required": [name for name in hints if name in annotation.__required_keys__],
+        }
+    origin = get_origin(annotation)
+    if origin in (list, List):
+        args = get_args(annotation)
+        return {"type": "array", "items": json_schema(args[0])} if args else {"type": "array"}
+    if origin in (dict, Dict) or annotation in (dict, Dict):
+        return {"type": "object"}
+    if origin is Union:
+        # Optional[X]: the schema of X (the argument is then not required)
+        args = [arg for arg in get_args(annotation) if arg is not type(None)]
+        if len(args) == 1:
+            return json_schema(args[0])
+    return {}
+
+
+def _parse_docstring(doc):
+    """
+    Returns the description (first paragraph) and the Args descriptions of a docstring.
+    """
+    doc = inspect.cleandoc(doc or "")
+    paragraphs = doc.split("\n\n")
+    description = " ".join(line.strip() for line in paragraphs[0].splitlines()) if doc else ""
+    arguments, in_args = {}, False
+    for line in doc.splitlines():
+        if line.strip() in ("Args:", "Arguments:"):
+            in_args = True
+        elif in_args and line.strip().endswith(":") and not line.lstrip().startswith("-"):
+            in_args = False
+        elif in_args and _ARG_LINE.match(line):
+            name, text = _ARG_LINE.match(line).groups()
+            arguments[name] = text.strip()
+    return description, arguments
+
+
+class RegisteredTool:
+    """
+    A tool of the registry: its sync and async implementations, the schema sent to the model and
+    the prospect fields it reads and writes.
+    """
+    def __init__(self, name, function, schema, reads=None, writes=None):
+        self.name = name
+        self.function = function
+        self.async_function = None
+        self.schema = schema
+        self.reads = set(reads or ())
+        self.writes = set(writes or ())
+
+
+class ToolRegistry:
+    """
+    Single registry of the agent tools. The JSON schemas are built once from the type hints and
+    docstrings of the registered functions; the schema list and its compact JSON are cached.
+    """
+    def __init__(self):
+        self._tools = {}
+        self._schemas = None
+        self._schemas_json = None
+
+    def tool(self, name=None, reads=None, writes=None):
+        """
+        Decorator registering a (sync) tool function.
+
+        The tool description is the first paragraph of the docstring and the description of each
+        parameter the "- name (type): description" line of its Args section. Parameters without a
+        default value are required.
+
+        Args:
+        - name (str): The tool name, defaults to the function name.
+        - reads (set): Prospect fields the tool reads ("*" for the whole profile).
+        - writes (set): Prospect fields the tool writes.
+        """
+        def register(function):
+            tool_name = name or function.__name__
+            self._tools[tool_name] = RegisteredTool(tool_name, function, _schema(tool_name, function), reads, writes)
+            self._schemas = self._schemas_json = None
+            return function
+        return register
+
+    def async_variant(self, name):
+        """
+        Decorator registering the asyncio implementation of the tool `name`.
+        """
+        def register(function):
+            self._tools[name].async_function = function
+            return function
+        return register
+
+    def __getitem__(self, name):
+        return self._tools[name]
+
+    def __contains__(self, name):
+        return name in self._tools
+
+    def function_mapping(self):
+        """
+        Tool name -> function, each call traced in an "ao.tool <name>" span.
+        """
+        return {name: traced_tool(name, tool.function) for name, tool in self._tools.items()}
+
+    def async_function_mapping(self):
+        return {name: traced_tool(name, tool.async_function)
+                for name, tool in self._tools.items() if tool.async_function is not None}
+
+    def effects(self):
+        """
+        Tool name -> {"reads": fields, "writes": fields}, for the tools that declared their effects.
+        """
+        return {name: {"reads": tool.reads, "writes": tool.writes}
+                for name, tool in self._tools.items() if tool.reads or tool.writes}
+
+    def schemas(self):
+        """
+        The tool definitions of the chat completions API (cached).
+        """
+        if self._schemas is None:
+            self._schemas = [tool.schema for tool in self._tools.values()]
+        return self._schemas
+
+    def schemas_json(self):
+        """
+        Compact JSON of the tool definitions, as embedded in prompts (cached).
+        """
+        if self._schemas_json is None:
+            self._schemas_json = json.dumps(self.schemas(), separators=(",", ":"), ensure_ascii=False)
+        return self._schemas_json
+
+    def schema_json(self, name):
+        """
+        Compact JSON of one tool definition (its footprint in a prompt).
+        """
+        return json.dumps(self._tools[name].schema, separators=(",", ":"), ensure_ascii=False)
+
+
+def _schema(name, function):
+    description, argument_docs = _parse_docstring(function.__doc__)
+    hints = get_type_hints(function, include_extras=True)
+    properties, required = {}, []
+    for parameter in inspect.signature(function).parameters.values():
+        if parameter.kind in (parameter.VAR_POSITIONAL, parameter.VAR_KEYWORD):
+            continue
+        schema = json_schema(hints.get(parameter.name, Any))
+        if parameter.name in argument_docs:
+            schema["description"] = argument_docs[parameter.name]
+        properties[parameter.name] = schema
+        if parameter.default is parameter.empty:
+            required.append(parameter.name)
+
+    definition = {"name": name, "description": description}
+    if properties:
+        definition["parameters"] = {"type": "object", "properties": properties, "required": required}
+    return {"type": "function", "function": definition}
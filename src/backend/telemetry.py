@@ -0,0 +1,226 @@
+import os
+import time
+import hashlib
+import inspect
+import logging
+import functools
+
+from opentelemetry import trace
+from opentelemetry.trace import Status, StatusCode
+
+from metrics import observe_tool
+
+# Spans of the backend: endpoints, planner, executor turns, tools and CRM store operations.
+# Without a configured TracerProvider (AO_TRACING=off) every span is a no-op.
+tracer = trace.get_tracer("moneta.agents")
+
+_provider = None
+
+
+def configure_tracing():
+    """
+    Installs the OpenTelemetry SDK TracerProvider selected by AO_TRACING:
+    - otlp: OTLP/HTTP exporter (OTEL_EXPORTER_OTLP_ENDPOINT, OTEL_EXPORTER_OTLP_HEADERS...);
+    - file: one JSON span per line appended to AO_TRACING_FILE (default traces.jsonl);
+    - off (default): nothing is exported.
+    The Azure SDK clients (Cosmos DB HTTP calls) are traced too when azure-core-tracing-opentelemetry is installed.
+    """
+    global _provider
+    exporter_name = os.getenv("AO_TRACING", "off").lower()
+    if exporter_name == "off" or _provider is not None:
+        return None
+
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+
+    if exporter_name == "otlp":
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        exporter = OTLPSpanExporter()
+    elif exporter_name == "file":
+        path = os.getenv("AO_TRACING_FILE", "traces.jsonl")
+        exporter = ConsoleSpanExporter(
+            out=open(path, "a", encoding="utf-8"),
+            formatter=lambda span: span.to_json(indent=None) + "\n"
+        )
+    else:
+        raise ValueError(f"Unknown AO_TRACING exporter: {exporter_name}")
+
+    resource = Resource.create({"service.name": os.getenv("OTEL_SERVICE_NAME", "moneta-agents-o1")})
+    _provider = TracerProvider(resource=resource)
+    _provider.add_span_processor(BatchSpanProcessor(exporter))
+    trace.set_tracer_provider(_provider)
+
+    try:
+        from azure.core.settings import settings
+        from azure.core.tracing.ext.opentelemetry_span import OpenTelemetrySpan
+        settings.tracing_implementation = OpenTelemetrySpan
+    except ImportError:
+        pass
+    logging.info(f"Tracing enabled: {exporter_name} exporter")
+    return _provider
+
+
+def shutdown_tracing():
+    """
+    Flushes the pending spans (called at app shutdown).
+    """
+    global _provider
+    if _provider is not None:
+        _provider.shutdown()
+        _provider = None
+
+
+def hash_client_id(client_id):
+    """
+    Pseudonymous clientID recorded on spans (prospect identifiers are not exported as is).
+    """
+    if not client_id:
+        return None
+    return hashlib.sha256(str(client_id).encode()).hexdigest()[:16]
+
+
+def client_id_of(arguments):
+    """
+    The clientID a call is about, from its arguments: client_id/clientID, or the clientID of a
+    prospect_data / profile / customer_profile dict.
+    """
+    for name in ("client_id", "clientID"):
+        if isinstance(arguments.get(name), str):
+            return arguments[name]
+    for name in ("prospect_data", "profile", "customer_profile", "scenario"):
+        value = arguments.get(name)
+        if isinstance(value, dict) and value.get("clientID"):
+            return value["clientID"]
+    return None
+
+
+def set_attributes(span, attributes):
+    span.set_attributes({key: value for key, value in attributes.items() if value is not None})
+
+
+def record_usage(span, usage):
+    """
+    Token counts of a chat completion (its `usage`) on a span, with the GenAI semantic convention names.
+    """
+    if usage is None:
+        return
+    details = getattr(usage, "prompt_tokens_details", None)
+    set_attributes(span, {
+        "gen_ai.usage.input_tokens": usage.prompt_tokens,
+        "gen_ai.usage.output_tokens": usage.completion_tokens,
+        "gen_ai.usage.cached_input_tokens": getattr(details, "cached_tokens", None) if details is not None else None,
+    })
+
+
+def record_error(span, error):
+    span.record_exception(error)
+    span.set_status(Status(StatusCode.ERROR, str(error)))
+
+
+def record_status_transition(client_id, old_status, new_status):
+    """
+    Adds a prospect status change to the current span (the tool or the commit that made it).
+    """
+    trace.get_current_span().add_event("status_transition", {
+        "ao.client_id_hash": hash_client_id(client_id) or "",
+        "ao.status.from": str(old_status),
+        "ao.status.to": str(new_status),
+    })
+
+
+def _traced(span_name, attributes_of, function, observe=None):
+    # observe, if given, gets the duration (s) and the exception (None if it succeeded) of every call
+    signature = inspect.signature(function)
+    observe = observe or (lambda seconds, error: None)
+
+    def start(args, kwargs):
+        try:
+            arguments = signature.bind_partial(*args, **kwargs).arguments
+        except TypeError:
+            arguments = kwargs
+        span = tracer.start_span(span_name)
+        set_attributes(span, attributes_of(arguments))
+        return span
+
+    if inspect.iscoroutinefunction(function):
+        @functools.wraps(function)
+        async def traced(*args, **kwargs):
+            span = start(args, kwargs)
+            started = time.perf_counter()
+            with trace.use_span(span, end_on_exit=True, record_exception=False):
+                try:
+                    result = await function(*args, **kwargs)
+                except Exception as e:
+                    record_error(span, e)
+                    observe(time.perf_counter() - started, e)
+                    raise
+                observe(time.perf_counter() - started, None)
+                return result
+    else:
+        @functools.wraps(function)
+        def traced(*args, **kwargs):
+            span = start(args, kwargs)
+            started = time.perf_counter()
+            with trace.use_span(span, end_on_exit=True, record_exception=False):
+                try:
+                    result = function(*args, **kwargs)
+                except Exception as e:
+                    record_error(span, e)
+                    observe(time.perf_counter() - started, e)
+                    raise
+                observe(time.perf_counter() - started, None)
+                return result
+    return traced
+
+
+def traced_tool(name, function):
+    """
+    Wraps an agent tool (sync or async) in an "ao.tool <name>" span, counted and timed in the tool metrics.
+    """
+    return _traced(f"ao.tool {name}", lambda arguments: {
+        "ao.tool.name": name,
+        "ao.client_id_hash": hash_client_id(client_id_of(arguments)),
+    }, function, observe=lambda seconds, error: observe_tool(name, seconds, error))
+
+
+# CRM store operations traced by traced_store
+STORE_OPERATIONS = (
+    "create_customer_profile",
+    "get_customer_profile_by_full_name",
+    "search_customer_profiles_by_name",
+    "get_customer_profile_by_client_id",
+    "update_customer_profile",
+    "patch_customer_profile",
+    "replace_customer_profile",
+    "delete_customer_profile",
+    "find_client_ids",
+    "list_prospects",
+    "load_all_prospects",
+)
+
+
+def traced_store(db_system):
+    """
+    Class decorator tracing the CRM store operations of a CRMStore implementation ("crm.<operation>" spans).
+
+    Args:
+    - db_system (str): The database ("cosmosdb", "sqlite"), recorded as db.system.
+    """
+    def decorate(cls):
+        for operation in STORE_OPERATIONS:
+            function = cls.__dict__.get(operation)
+            if function is None:
+                continue
+
+            def attributes_of(arguments, operation=operation):
+                store = arguments.get("self")
+                return {
+                    "db.system": db_system,
+                    "db.operation.name": operation,
+                    "db.collection.name": getattr(store, "container_name", None),
+                    "ao.client_id_hash": hash_client_id(client_id_of(arguments)),
+                }
+            setattr(cls, operation, _traced(f"crm.{operation}", attributes_of, function))
+        return cls
+    return decorate
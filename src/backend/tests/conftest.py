@@ -0,0 +1,21 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    """
+    TestClient of the backend on the embedded SQLite CRM (no Azure resource).
+    """
+    monkeypatch.setenv("CRM_BACKEND", "sqlite")
+    monkeypatch.setenv("CRM_SQLITE_PATH", str(tmp_path / "crm.sqlite3"))
+    monkeypatch.setenv("AO_JOBS_DB", str(tmp_path / "jobs.sqlite3"))
+    from fastapi.testclient import TestClient
+    from app import app
+
+    with TestClient(app) as test_client:
+        yield test_client
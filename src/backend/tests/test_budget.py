@@ -0,0 +1,41 @@
+import asyncio
+import types
+
+import httpx
+import pytest
+from openai import APITimeoutError
+
+from accountopening.budget import BudgetExceeded, RunBudget, budget_exceeded_counts
+from accountopening.planner_executor import acall_gpt4o, acall_o1, call_o1
+
+
+class SlowPlanner:
+    """
+    Async OpenAI client stand-in whose planner call takes `seconds`.
+    """
+    def __init__(self, seconds):
+        async def create(**request):
+            await asyncio.sleep(seconds)
+        self.chat = types.SimpleNamespace(completions=types.SimpleNamespace(create=create))
+
+
+def test_planner_counts_towards_the_deadline():
+    before = budget_exceeded_counts().get("deadline", 0)
+    with pytest.raises(BudgetExceeded) as exceeded:
+        asyncio.run(acall_o1(SlowPlanner(5), {"clientID": "PRO001"}, budget=RunBudget(deadline_seconds=0.1)))
+    assert exceeded.value.reason["budget"] == "deadline"
+    assert budget_exceeded_counts()["deadline"] == before + 1
+
+
+def test_executor_turn_counts_towards_the_deadline():
+    with pytest.raises(BudgetExceeded) as exceeded:
+        asyncio.run(acall_gpt4o(SlowPlanner(5), "plan", budget=RunBudget(deadline_seconds=0.1)))
+    assert exceeded.value.reason["budget"] == "deadline"
+
+
+def test_planner_timeout_without_a_budget_is_raised():
+    def create(**request):
+        raise APITimeoutError(request=httpx.Request("POST", "https://example.invalid"))
+    client = types.SimpleNamespace(chat=types.SimpleNamespace(completions=types.SimpleNamespace(create=create)))
+    with pytest.raises(APITimeoutError):
+        call_o1(client, {"clientID": "PRO001"})
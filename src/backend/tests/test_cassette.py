@@ -0,0 +1,119 @@
+import asyncio
+import json
+import time
+import uuid
+
+import pytest
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+
+import app
+import event_store
+from accountopening.cassette import AsyncRecordingClient, AsyncReplayClient, Cassette
+from event_store import EVENT_FIELDS
+from local_store import AsyncSQLiteCRMStore, AsyncSQLiteEventStore, LocalDatabase
+
+PROSPECT = {
+    "clientID": "PRO001", "firstName": "Ana", "lastName": "Silva", "fullName": "Ana Silva",
+    "dateOfBirth": "1980-01-01", "nationality": "PT", "status": "Prospect", "onboarding": [],
+    "documents_provided": ["passport", "proof_of_address"], "name_screening_result": "None",
+    "risk_level": "", "risk_score": 0,
+}
+STEPS = ["collect_kyc_info", "collect_sow_info", "perform_data_management_ai_extraction", "perform_name_screening",
+         "create_client_profile", "perform_compliance_risk_assessment"]
+
+
+class ScriptedModel:
+    """
+    Async model client answering the planner with the workflow and the executor with one step per turn.
+    """
+    def __init__(self):
+        self.chat = type("Chat", (), {})()
+        self.chat.completions = type("Completions", (), {"create": self._create})()
+
+    async def _create(self, **kwargs):
+        if not kwargs.get("tools"):
+            plan = "\n".join(f"{i + 1}. call {step}" for i, step in enumerate(STEPS))
+            return self._stream(plan) if kwargs.get("stream") else self._completion({"content": plan})
+        done = [message for message in kwargs["messages"] if isinstance(message, dict) and message.get("role") == "tool"]
+        name = STEPS[len(done)] if len(done) < len(STEPS) else "instructions_complete"
+        arguments = {} if name == "instructions_complete" else {"prospect_data": dict(PROSPECT)}
+        if name == "create_client_profile":
+            arguments["name_screening_result"] = json.loads(done[-1]["content"]).get("name_screening_result", "No match")
+        return self._completion({"content": None, "tool_calls": [{
+            "id": f"call_{uuid.uuid4().hex[:12]}", "type": "function",
+            "function": {"name": name, "arguments": json.dumps(arguments)},
+        }]})
+
+    @staticmethod
+    async def _stream(content):
+        for line in content.splitlines(keepends=True):
+            yield ChatCompletionChunk.model_validate({
+                "id": "chatcmpl-plan", "object": "chat.completion.chunk", "created": int(time.time()), "model": "scripted",
+                "choices": [{"index": 0, "delta": {"content": line}, "finish_reason": None}],
+            })
+
+    @staticmethod
+    def _completion(message):
+        return ChatCompletion.model_validate({
+            "id": f"chatcmpl-{uuid.uuid4().hex[:12]}", "object": "chat.completion", "created": int(time.time()),
+            "model": "scripted", "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", **message}}],
+        })
+
+
+def _without_events(value):
+    # Tool results and profiles without the history entries' own ids and timestamps
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            return value
+    if not isinstance(value, dict):
+        return value
+    return {key: [entry.get("step") for entry in item] if key in EVENT_FIELDS.values() else item
+            for key, item in value.items() if key not in ("_etag", "_ts")}
+
+
+def _run(client, seed):
+    database = LocalDatabase(":memory:")
+    store = AsyncSQLiteCRMStore(database, "clientdata")
+    event_store.set_async_event_store(AsyncSQLiteEventStore(database, "prospectevents"))
+    app.get_async_openai_client = lambda *args: client
+    results = []
+
+    def on_event(event):
+        if event["type"] == "tool_result":
+            results.append((event["name"], _without_events(event["result"])))
+
+    async def run():
+        await store.create_customer_profile(dict(PROSPECT))
+        return await app._run_agents(store, PROSPECT, on_event=on_event, seed=seed)
+
+    profile, outcome = asyncio.run(run())
+    assert outcome["run_status"] == "completed"
+    return results, _without_events(profile)
+
+
+@pytest.fixture
+def cassette_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(app, "get_async_openai_client", app.get_async_openai_client)
+    monkeypatch.setenv("AO_ENGINE", "llm")
+    # the scripted model counts the steps done from the tool outputs of the conversation
+    monkeypatch.setenv("AO_EXECUTOR_HISTORY", "full")
+    yield str(tmp_path / "cassette.jsonl.gz")
+    event_store.clear_event_stores()
+
+
+def test_replayed_run_matches_the_recorded_run(cassette_path):
+    recorder = Cassette(cassette_path)
+    recorded = _run(AsyncRecordingClient(recorder, ScriptedModel()), seed="cassette")
+    recorder.close()
+    replayed = _run(AsyncReplayClient(Cassette(cassette_path, speed=0)), seed="cassette")
+
+    results, profile = recorded
+    assert [name for name, _ in results] == STEPS
+    assert profile["onboarding"] and profile["status"] != PROSPECT["status"]
+    # the tool outcomes drawn from the seeded randomness (name screening, risk score) are replayed too
+    assert replayed == recorded
+    assert replayed[1]["name_screening_result"] == profile["name_screening_result"] != "None"
+    assert replayed[1]["risk_score"] == profile["risk_score"]
+
@@ -0,0 +1,51 @@
+import asyncio
+import json
+import types
+
+from accountopening.budget import RunBudget
+from accountopening.planner_executor import acall_gpt4o, call_gpt4o
+
+
+def _response(*tool_calls):
+    calls = [
+        types.SimpleNamespace(id=f"call_{i}", type="function",
+                              function=types.SimpleNamespace(name=name, arguments=json.dumps(arguments)))
+        for i, (name, arguments) in enumerate(tool_calls)
+    ]
+    message = types.SimpleNamespace(tool_calls=calls or None, model_dump=lambda: {"role": "assistant", "tool_calls": len(calls)})
+    return types.SimpleNamespace(choices=[types.SimpleNamespace(message=message)], usage=None)
+
+
+class ScriptedExecutor:
+    """
+    OpenAI client stand-in answering the executor turns with `responses`, in order.
+    """
+    def __init__(self, responses, asynchronous=False):
+        self.requests = []
+        responses = iter(responses)
+
+        def create(**request):
+            self.requests.append(request)
+            return next(responses)
+
+        async def acreate(**request):
+            return create(**request)
+        self.chat = types.SimpleNamespace(completions=types.SimpleNamespace(create=acreate if asynchronous else create))
+
+
+RESPONSES = [_response(), _response(("instructions_complete", {}))]
+
+
+def test_executor_runs_until_instructions_complete():
+    client = ScriptedExecutor(RESPONSES)
+    messages = call_gpt4o(client, "plan", budget=RunBudget())
+    assert len(client.requests) == 2
+    # the turn without a tool call is answered with a request for the next step
+    assert messages[-2]["role"] == "user"
+
+
+def test_async_executor_runs_the_same_turns():
+    client = ScriptedExecutor(RESPONSES, asynchronous=True)
+    messages = asyncio.run(acall_gpt4o(client, "plan", budget=RunBudget()))
+    assert len(client.requests) == 2
+    assert messages == call_gpt4o(ScriptedExecutor(RESPONSES), "plan", budget=RunBudget())
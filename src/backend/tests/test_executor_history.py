@@ -0,0 +1,79 @@
+import json
+
+import pytest
+
+from accountopening.history import CompactHistory
+from accountopening.planner_executor import CONTINUE_PROMPT
+
+TOOLS = ["collect_kyc_info", "collect_sow_info", "perform_name_screening", "perform_data_management_ai_extraction",
+         "create_client_profile", "perform_compliance_risk_assessment"]
+
+
+def _conversation():
+    """
+    Executor conversation alternating parallel tool calls, single tool calls and turns answered
+    without a tool call (followed by the continue prompt).
+    """
+    messages = [{"role": "system", "content": "plan"}]
+    calls = 0
+    for index, name in enumerate(TOOLS):
+        if index % 3 == 2:
+            messages.append({"role": "assistant", "content": "Next step.", "tool_calls": None})
+            messages.append({"role": "user", "content": CONTINUE_PROMPT})
+        names = [name, "get_customer_profile_by_client_id"] if index % 2 else [name]
+        tool_calls = []
+        for tool in names:
+            calls += 1
+            tool_calls.append({"id": f"call_{calls}", "type": "function", "function": {"name": tool, "arguments": "{}"}})
+        messages.append({"role": "assistant", "content": None, "tool_calls": tool_calls})
+        for tool_call in tool_calls:
+            messages.append({"role": "tool", "tool_call_id": tool_call["id"],
+                             "content": json.dumps({"status": "done", "onboarding": ["step"] * index})})
+    return messages
+
+
+def _assert_well_formed(request):
+    # Every tool output answers a call of the assistant message before it, and every call is answered
+    pending = set()
+    for message in request:
+        if message["role"] == "tool":
+            assert message["tool_call_id"] in pending
+            pending.remove(message["tool_call_id"])
+            continue
+        assert not pending
+        if message["role"] == "assistant":
+            pending = {tool_call["id"] for tool_call in message.get("tool_calls") or []}
+    assert not pending
+
+
+@pytest.mark.parametrize("keep_turns", [0, 1, 2, 5])
+@pytest.mark.parametrize("window_turns", [None, 1, 2, 3, 4])
+def test_compact_history_never_separates_tool_calls_from_their_outputs(keep_turns, window_turns):
+    messages = _conversation()
+    policy = CompactHistory(keep_turns=keep_turns, window_turns=window_turns, max_tool_chars=50)
+    for end in range(1, len(messages) + 1):
+        # each prefix ending on a complete turn is a request the executor may send
+        if end < len(messages) and messages[end]["role"] == "tool":
+            continue
+        request = policy.prepare(messages[:end])
+        assert request[0] == messages[0]
+        _assert_well_formed(request)
+
+
+def test_continue_prompt_stays_with_the_turn_it_answers():
+    messages = _conversation()
+    request = CompactHistory(keep_turns=1, window_turns=2).prepare(messages)
+    for index, message in enumerate(request):
+        if message.get("content") == CONTINUE_PROMPT:
+            assert request[index - 1]["role"] == "assistant"
+            assert not request[index - 1].get("tool_calls")
+
+
+def test_recap_summarizes_the_turns_outside_the_window():
+    messages = _conversation()
+    request = CompactHistory(keep_turns=1, window_turns=2).prepare(messages)
+    recap = request[1]
+    assert recap["role"] == "user"
+    for name in TOOLS[:3]:
+        assert f"- {name}:" in recap["content"]
+    assert sum(message["role"] == "assistant" for message in request) == 2
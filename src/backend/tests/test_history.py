@@ -0,0 +1,10 @@
+import json
+
+import pytest
+
+
+@pytest.mark.parametrize("page_size", [0, -5])
+def test_prospect_history_page_size_has_a_lower_bound(client, page_size):
+    response = client.post("/prospect_history", json={"user_id": "default_user", "client_id": "PRO001", "page_size": page_size})
+    assert response.status_code == 200
+    assert "error" not in json.loads(response.json())
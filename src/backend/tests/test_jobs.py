@@ -0,0 +1,62 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+from jobs import JobQueue, JobWorkerPool, get_job_queue
+
+
+def test_renew_extends_the_lease_of_the_owner_only():
+    queue = JobQueue(":memory:", lease_seconds=60)
+    job_id = queue.enqueue("kind", {})
+    job = queue.claim()
+    assert queue.renew(job_id, job["attempts"])
+    assert queue.get(job_id)["lease_expires_at"] > time.time() + 59
+    # Claimed again by another worker (attempt 2): the first one no longer owns it
+    queue._db.execute("UPDATE jobs SET attempts = attempts + 1 WHERE id = ?", (job_id,))
+    assert not queue.renew(job_id, job["attempts"])
+    queue.complete(job_id, {})
+    assert not queue.renew(job_id, job["attempts"] + 1)
+
+
+def test_running_job_is_not_claimed_again():
+    queue = JobQueue(":memory:", lease_seconds=0.3)
+    claimed_again = []
+
+    async def handler(payload, progress):
+        # Runs for several lease durations without reporting progress
+        for _ in range(6):
+            await asyncio.sleep(0.1)
+            claimed_again.append(queue.claim())
+        return {"done": True}
+
+    async def run():
+        pool = JobWorkerPool(queue, {"kind": handler}, concurrency=1, poll_interval=0.05)
+        job_id = queue.enqueue("kind", {})
+        pool.start()
+        while queue.get(job_id)["status"] != "succeeded":
+            await asyncio.sleep(0.05)
+        await pool.stop()
+        return queue.get(job_id)
+
+    job = asyncio.run(run())
+    assert job["attempts"] == 1
+    assert claimed_again == [None] * 6
+
+
+def test_run_ao_agents_queues_the_client_id_only(client):
+    response = client.post("/run_ao_agents", json={"user_id": "default_user", "prospect_data": {"clientID": "PRO001", "email": "stale@example.com"}})
+    job = get_job_queue().get(json.loads(response.json())["job_id"])
+    assert job["payload"] == {"user_id": "default_user", "client_id": "PRO001", "seed": None}
+
+    response = client.post("/run_ao_agents", json={"user_id": "default_user", "prospect_data": {}})
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize("body", [{"user_id": "default_user"}, {"user_id": "default_user", "prospect_data": "not json"},
+                                  {"user_id": "default_user", "prospect_data": {"email": "a@example.com"}}])
+def test_run_ao_agents_stream_validates_before_streaming(client, body):
+    response = client.post("/run_ao_agents/stream", json=body)
+    assert response.status_code == 400
+    assert response.headers["content-type"].startswith("application/json")
@@ -0,0 +1,109 @@
+import asyncio
+import threading
+
+import pytest
+
+from crm_store import PreconditionFailedError
+from local_store import AsyncSQLiteCRMStore, AsyncSQLiteEventStore, LocalDatabase, SQLiteCRMStore
+
+NAMES = ["Ana Silva", "Bruno Costa", "Carla Mendes", "Diogo Santos", "Eva Lopes"]
+
+
+@pytest.fixture
+def store():
+    store = SQLiteCRMStore(LocalDatabase(":memory:"), "clientdata")
+    for number, name in enumerate(NAMES, start=1):
+        store.create_customer_profile({"clientID": f"PRO{number:03}", "fullName": name,
+                                       "status": "Prospect" if number % 2 else "Onboarded"})
+    store.create_customer_profile({"clientID": "CLI001", "fullName": "Ana Silva", "status": "Prospect"})
+    return store
+
+
+def _all_pages(store, **kwargs):
+    pages, token = [], None
+    while True:
+        items, token = store.list_prospects(continuation_token=token, **kwargs)
+        pages.append([item["clientID"] for item in items])
+        if token is None:
+            return pages
+
+
+def test_list_prospects_pages_through_the_prefix(store):
+    assert _all_pages(store, page_size=2) == [["PRO001", "PRO002"], ["PRO003", "PRO004"], ["PRO005"]]
+    # a last page exactly full has no continuation token
+    assert _all_pages(store, page_size=5) == [["PRO001", "PRO002", "PRO003", "PRO004", "PRO005"]]
+    assert _all_pages(store, page_size=2, status="Prospect") == [["PRO001", "PRO003"], ["PRO005"]]
+
+
+def test_list_prospects_projects_the_fields(store):
+    items, _ = store.list_prospects(page_size=1, fields=("clientID", "status"))
+    assert items == [{"clientID": "PRO001", "status": "Prospect"}]
+
+
+def test_patch_with_a_stale_etag_is_rejected(store):
+    etag = store.get_customer_profile_by_client_id("PRO001")["_etag"]
+    store.update_customer_profile("PRO001", {"email": "ana@example.com"})
+    with pytest.raises(PreconditionFailedError):
+        store.patch_customer_profile("PRO001", [{"op": "replace", "path": "/status", "value": "Onboarded"}], etag=etag)
+    with pytest.raises(PreconditionFailedError):
+        store.replace_customer_profile({"clientID": "PRO001", "fullName": "Ana Silva"}, etag=etag)
+    profile = store.get_customer_profile_by_client_id("PRO001")
+    assert profile["status"] == "Prospect" and profile["email"] == "ana@example.com"
+
+    patched = store.patch_customer_profile("PRO001", [{"op": "replace", "path": "/status", "value": "Onboarded"}],
+                                           etag=profile["_etag"])
+    assert patched["status"] == "Onboarded" and patched["_etag"] != profile["_etag"]
+
+
+def test_concurrent_conditional_patches_let_one_writer_win(store):
+    etag = store.get_customer_profile_by_client_id("PRO002")["_etag"]
+    outcomes = []
+
+    def patch(status):
+        try:
+            store.patch_customer_profile("PRO002", [{"op": "replace", "path": "/status", "value": status}], etag=etag)
+            outcomes.append(status)
+        except PreconditionFailedError:
+            outcomes.append(None)
+
+    threads = [threading.Thread(target=patch, args=(f"Step {index}",)) for index in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    winners = [status for status in outcomes if status]
+    assert len(winners) == 1
+    assert store.get_customer_profile_by_client_id("PRO002")["status"] == winners[0]
+
+
+def test_search_ranks_the_names_and_follows_renames_and_deletes(store):
+    matches = store.search_customer_profiles_by_name("silva ana")
+    assert {match["clientID"] for match in matches[:2]} == {"PRO001", "CLI001"}
+    assert store.search_customer_profiles_by_name("Carla Mendez")[0]["clientID"] == "PRO003"
+
+    store.update_customer_profile("PRO003", {"fullName": "Carla Ferreira"})
+    assert store.search_customer_profiles_by_name("Mendes") == []
+    assert store.search_customer_profiles_by_name("Carla Ferreira")[0]["clientID"] == "PRO003"
+
+    store.delete_customer_profile("PRO004")
+    assert all(match["clientID"] != "PRO004" for match in store.search_customer_profiles_by_name("Diogo Santos"))
+
+
+def test_async_stores_run_off_the_event_loop():
+    database = LocalDatabase(":memory:")
+    store = AsyncSQLiteCRMStore(database, "clientdata")
+    events = AsyncSQLiteEventStore(database, "prospectevents")
+
+    async def run():
+        with database.lock:
+            # the store waits for the lock in a worker thread: the loop keeps running meanwhile
+            write = asyncio.ensure_future(store.create_customer_profile({"clientID": "PRO001", "fullName": "Ana Silva"}))
+            await asyncio.sleep(0.05)
+            assert not write.done()
+        await write
+        await events.append_events("PRO001", [{"id": "e1", "kind": "onboarding", "timestamp": "2024-01-01T00:00:00"}])
+        return await store.list_prospects(), await events.list_events("PRO001")
+
+    (items, token), (history, _) = asyncio.run(run())
+    assert [item["clientID"] for item in items] == ["PRO001"] and token is None
+    assert [event["id"] for event in history] == ["e1"]
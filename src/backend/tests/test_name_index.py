@@ -0,0 +1,189 @@
+import asyncio
+import copy
+
+import pytest
+from azure.cosmos import exceptions
+
+from local_store import LocalDatabase
+from name_index import AsyncCosmosNameIndex, CosmosNameIndex, NameIndex
+
+NAMES = [("PRO001", "José García-López"), ("PRO002", "Jose Garcia"), ("PRO003", "Zoë Müller"), ("PRO004", "Ana Silva")]
+
+
+class IndexContainer:
+    """
+    In-memory stand-in of the name index container (partition key /trigram): the point operations
+    and the three queries CosmosNameIndex runs.
+    """
+    def __init__(self):
+        self.items = {}
+
+    def _get(self, item, partition_key):
+        if (partition_key, item) not in self.items:
+            raise exceptions.CosmosResourceNotFoundError(message=f"{item} not found")
+        return self.items[(partition_key, item)]
+
+    def read_item(self, item, partition_key, response_hook=None):
+        return copy.deepcopy(self._get(item, partition_key))
+
+    def create_item(self, body, response_hook=None):
+        if (body["trigram"], body["id"]) in self.items:
+            raise exceptions.CosmosResourceExistsError(message=f"{body['id']} exists")
+        self.items[(body["trigram"], body["id"])] = copy.deepcopy(body)
+
+    def upsert_item(self, body, response_hook=None):
+        self.items[(body["trigram"], body["id"])] = copy.deepcopy(body)
+
+    def delete_item(self, item, partition_key, response_hook=None):
+        self._get(item, partition_key)
+        del self.items[(partition_key, item)]
+
+    def patch_item(self, item, partition_key, patch_operations, response_hook=None):
+        document = self._get(item, partition_key)
+        for operation in patch_operations:
+            assert operation["op"] == "incr"
+            document[operation["path"].lstrip("/")] += operation["value"]
+
+    def query_items(self, query, parameters, enable_cross_partition_query=False, response_hook=None):
+        values = {parameter["name"]: parameter["value"] for parameter in parameters}
+        trigrams = {value for name, value in values.items() if name.startswith("@t")}
+        for (trigram, item_id), item in self.items.items():
+            if trigram.startswith(("client:", "state:")):
+                continue
+            if "c.id = @count" in query and item_id == "_count" and trigram in trigrams:
+                yield dict(item)
+            elif "c.id != @count" in query and item_id != "_count" and (not trigrams or trigram in trigrams):
+                yield dict(item)
+
+
+class AsyncIndexContainer:
+    """
+    azure.cosmos.aio look-alike of an IndexContainer: coroutine point operations, async query pager.
+    """
+    def __init__(self, container):
+        self.container = container
+
+    def __getattr__(self, method):
+        async def call(**kwargs):
+            return getattr(self.container, method)(**kwargs)
+        return call
+
+    def query_items(self, query, parameters, response_hook=None):
+        async def items():
+            for item in self.container.query_items(query, parameters, True, response_hook):
+                yield item
+        return items()
+
+
+@pytest.fixture
+def cosmos_index():
+    container = IndexContainer()
+    index = CosmosNameIndex(container, "crm-names")
+    for client_id, full_name in NAMES:
+        index.update(client_id, full_name)
+    return index
+
+
+@pytest.fixture
+def local_index():
+    index = NameIndex(LocalDatabase(":memory:"), "crm")
+    index.rebuild(NAMES)
+    return index
+
+
+@pytest.mark.parametrize("query", ["jose garcia", "GARCIA LOPEZ José", "Zoe Muler", "Silva", "nobody at all"])
+def test_cosmos_index_ranks_like_the_local_index(cosmos_index, local_index, query):
+    assert cosmos_index.search(query) == local_index.search(query)
+
+
+def test_cosmos_index_follows_renames_and_deletes(cosmos_index):
+    cosmos_index.update("PRO004", "Ana Souza")
+    assert cosmos_index.search("Silva") == []
+    assert cosmos_index.search("Ana Souza")[0] == {"clientID": "PRO004", "fullName": "Ana Souza", "score": 1.0}
+    cosmos_index.remove("PRO004")
+    assert cosmos_index.search("Ana Souza") == []
+    # Counts follow the postings: a rebuild recounts the same numbers
+    counts = {trigram: item["postings"] for (trigram, item_id), item in cosmos_index.container.items.items()
+              if item_id == "_count"}
+    cosmos_index.rebuild([])
+    assert {trigram: count for trigram, count in counts.items() if count} == \
+        {trigram: item["postings"] for (trigram, item_id), item in cosmos_index.container.items.items()
+         if item_id == "_count" and item["postings"]}
+
+
+def test_zero_threshold_is_not_the_default(local_index, monkeypatch):
+    monkeypatch.setenv("AO_NAME_SEARCH_THRESHOLD", "0.9")
+    assert local_index.search("Jose Garcia Lopes", limit=10) == []
+    assert local_index.search("Jose Garcia Lopes", limit=10, threshold=0)
+
+
+def test_cosmos_index_is_stale_until_built():
+    index = CosmosNameIndex(IndexContainer(), "crm-names")
+    assert index.stale()
+    index.rebuild(NAMES)
+    assert not index.stale()
+    assert index.search("Silva")[0]["clientID"] == "PRO004"
+
+
+def test_cosmos_index_update_tolerates_missing_postings(cosmos_index):
+    # A posting already gone (e.g. a concurrent rename) does not fail the update
+    del cosmos_index.container.items[("ilv", "PRO004")]
+    cosmos_index.update("PRO004", "Ana Souza")
+    assert cosmos_index.search("Ana Souza")[0]["clientID"] == "PRO004"
+
+
+class ProfileContainer:
+    """
+    CRM container stand-in for CRMStore.patch_customer_profile: the server-side patch succeeds, a
+    client-side replace (a patch applied twice) fails the test.
+    """
+    def __init__(self, profile):
+        self.profile = profile
+
+    def read(self):
+        return {"partitionKey": {"paths": ["/clientID"]}}
+
+    def patch_item(self, item, partition_key, patch_operations, response_hook=None, **conditions):
+        for operation in patch_operations:
+            self.profile[operation["path"].lstrip("/")] = operation["value"]
+        return dict(self.profile, _etag="2")
+
+    def replace_item(self, *args, **kwargs):
+        raise AssertionError("patch re-applied client side")
+
+
+def test_name_index_failure_does_not_fail_the_write(monkeypatch):
+    import types
+    import crm_store
+
+    def failing_index(container_name):
+        raise exceptions.CosmosResourceNotFoundError(message="index container gone")
+    monkeypatch.setattr(crm_store, "get_name_index", failing_index)
+    profiles = ProfileContainer({"id": "PRO001", "clientID": "PRO001", "fullName": "Ana Silva", "_etag": "1"})
+    crm_database = types.SimpleNamespace(get_container_client=lambda container: profiles)
+    client = types.SimpleNamespace(get_database_client=lambda database: crm_database)
+    store = crm_store.CRMStore(None, None, "crm", "clientdata", client=client, provision=False)
+
+    patched = store.patch_customer_profile("PRO001", [{"op": "replace", "path": "/fullName", "value": "Ana Souza"}],
+                                           etag="1")
+    assert patched["fullName"] == "Ana Souza" and patched["_etag"] == "2"
+
+
+def test_async_cosmos_index_shares_the_cosmos_index(cosmos_index):
+    async def names():
+        for name in NAMES:
+            yield name
+
+    async def run():
+        index = AsyncCosmosNameIndex(AsyncIndexContainer(IndexContainer()), "crm-names")
+        stale = await index.stale()
+        await index.rebuild(names())
+        await index.update("PRO004", "Ana Souza")
+        await index.remove("PRO003")
+        return stale, await index.stale(), [await index.search(query) for query in ("jose garcia", "Souza", "Zoe")]
+
+    cosmos_index.update("PRO004", "Ana Souza")
+    cosmos_index.remove("PRO003")
+    stale, built_stale, results = asyncio.run(run())
+    assert stale and not built_stale
+    assert results == [cosmos_index.search(query) for query in ("jose garcia", "Souza", "Zoe")]
@@ -0,0 +1,77 @@
+import pytest
+
+from patching import JsonPatchError, apply_json_patch
+
+PROFILE = {"clientID": "PRO1", "status": "new", "kyc_reviews": [{"id": "a"}, {"id": "b"}]}
+
+
+@pytest.mark.parametrize("operations", [
+    [{"op": "add", "path": "/a"}],
+    [{"op": "replace", "path": "/status"}],
+    [{"op": "test", "path": "/status"}],
+    [{"op": "move", "path": "/a"}],
+    [{"op": "copy", "path": "/a"}],
+    [{"op": "remove"}],
+    [{"op": "add", "path": 3, "value": 1}],
+    [{"op": "add", "path": "status", "value": 1}],
+    [{"op": "merge", "path": "/status", "value": 1}],
+    [{"op": "remove", "path": "/kyc_reviews/x"}],
+    [{"op": "remove", "path": "/kyc_reviews/-1"}],
+    [{"op": "remove", "path": "/kyc_reviews/01"}],
+    [{"op": "remove", "path": "/kyc_reviews/2"}],
+    [{"op": "add", "path": "/kyc_reviews/3", "value": {}}],
+    [{"op": "replace", "path": "/kyc_reviews/x/id", "value": "c"}],
+    [{"op": "add", "path": "/status/x", "value": 1}],
+    [{"op": "test", "path": "/status", "value": "old"}],
+    [["add", "/a", 1]],
+    {"op": "add", "path": "/a", "value": 1},
+])
+def test_malformed_patch_raises_json_patch_error(operations):
+    with pytest.raises(JsonPatchError):
+        apply_json_patch(PROFILE, operations)
+
+
+def test_apply_json_patch():
+    patched = apply_json_patch(PROFILE, [
+        {"op": "test", "path": "/status", "value": "new"},
+        {"op": "replace", "path": "/status", "value": "KYC data collected successfully"},
+        {"op": "add", "path": "/kyc_reviews/-", "value": {"id": "c"}},
+        {"op": "add", "path": "/kyc_reviews/0", "value": {"id": "z"}},
+        {"op": "remove", "path": "/kyc_reviews/1"},
+        {"op": "copy", "from": "/status", "path": "/previous_status"},
+        {"op": "move", "from": "/previous_status", "path": "/last_status"},
+    ])
+    assert patched == {
+        "clientID": "PRO1",
+        "status": "KYC data collected successfully",
+        "kyc_reviews": [{"id": "z"}, {"id": "b"}, {"id": "c"}],
+        "last_status": "KYC data collected successfully",
+    }
+    assert PROFILE["status"] == "new"
+
+
+def test_patch_prospect_rejects_malformed_patch(client):
+    from crm_store import get_crm_store
+    get_crm_store().create_customer_profile({"id": "PRO1", "clientID": "PRO1", "status": "new"})
+
+    response = client.post("/patch_prospect", json={"user_id": "u", "client_id": "PRO1",
+                                                     "patch": [{"op": "add", "path": "/a"}]})
+    assert response.status_code == 422
+    assert "value" in response.json()["detail"]
+
+
+@pytest.mark.parametrize("request_patch", [
+    {"patch": [{"op": "replace", "path": "/clientID", "value": "PRO2"}]},
+    {"patch": [{"op": "replace", "path": "/id", "value": "PRO2"}]},
+    {"patch": [{"op": "remove", "path": "/_etag"}]},
+    {"patch": [{"op": "move", "from": "/_ts", "path": "/ts"}]},
+    {"merge_patch": {"clientID": "PRO2"}},
+    {"merge_patch": {"_rid": None}},
+])
+def test_patch_prospect_rejects_protected_properties(client, request_patch):
+    from crm_store import get_crm_store
+    get_crm_store().create_customer_profile({"id": "PRO1", "clientID": "PRO1", "status": "new"})
+
+    response = client.post("/patch_prospect", json={"user_id": "u", "client_id": "PRO1", **request_patch})
+    assert response.status_code == 400
+    assert get_crm_store().get_customer_profile_by_client_id("PRO1")["clientID"] == "PRO1"
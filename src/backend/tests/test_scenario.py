@@ -0,0 +1,26 @@
+from accountopening.planner_executor import PLANNER_PROMPT
+from accountopening.scenario import project_scenario, projected_fields
+
+
+def test_projected_fields():
+    _, _, fields = PLANNER_PROMPT.compile()
+    assert set(fields) == {
+        # identify the prospect, resume status, politically exposed person
+        "clientID", "fullName", "status", "pep_status",
+        # read by the tools
+        "firstName", "lastName", "dateOfBirth", "nationality", "declared_source_of_wealth", "documents_provided",
+        "corporation_name", "incorporation_year", "name_screening_result", "risk_level",
+    }
+
+
+def test_tool_results_and_wildcard_reads_are_not_fields():
+    business_logic = 'If the returned "status" is "Done" then stop. If `"risk_level"` is `"High"` escalate.'
+    effects = {"load": {"reads": {"*"}, "writes": set()}, "screen": {"reads": {"lastName"}, "writes": {"status"}}}
+    assert projected_fields(business_logic, effects) == \
+        ("clientID", "fullName", "status", "pep_status", "lastName", "risk_level")
+
+
+def test_project_scenario():
+    scenario = {"clientID": "PRO001", "status": "new", "onboarding": [{"step": "KYC"}], "risk_level": "Low"}
+    assert project_scenario(scenario, ("clientID", "status", "risk_level", "pep_status")) == \
+        '{"clientID":"PRO001","status":"new","risk_level":"Low"}'
@@ -0,0 +1,44 @@
+import pytest
+
+from crm_store import get_crm_store
+from accountopening.state_machine import UnsupportedScenario, compile_business_logic, get_state_machine
+
+_RULESET = """
+1. **Check KYC Information**
+   `call the collect_kyc_info function`
+   If the returned "status" is "SOW information captured" then proceed to step: **Gather Source of Wealth**
+
+2. **Gather Source of Wealth**
+   `call the collect_sow_info function`
+   stop the process by invoking **Complete Instructions**.
+
+3. **Perform Name Screening**
+   `call the perform_name_screening function`
+"""
+
+
+def test_every_step_is_reachable():
+    machine = get_state_machine()
+    compliance = machine.states["Compliance & Risk Assessment"]
+    assert (compliance.status_field, compliance.expected_status) == ("overall_status", "First KYC checks passed.")
+    assert compliance.next_state == "First Line of Defence"
+    assert machine.resume_after["First KYC checks passed."] == "First Line of Defence"
+
+
+def test_unreachable_step_fails_to_compile():
+    with pytest.raises(ValueError, match="Perform Name Screening"):
+        compile_business_logic(_RULESET)
+
+
+def test_run_resumes_at_first_line_of_defence(client):
+    prospect = {"clientID": "PRO001", "firstName": "Ana", "lastName": "Silva", "status": "First KYC checks passed."}
+    get_crm_store().create_customer_profile(dict(prospect))
+    report = get_state_machine().run(prospect)
+    assert [step["function"] for step in report["steps"]] == ["assign_first_line_of_defence"]
+    assert get_crm_store().get_customer_profile_by_client_id("PRO001")["status"] == \
+        "Assigned to human review (first line of defence)"
+
+
+def test_unknown_status_is_unsupported():
+    with pytest.raises(UnsupportedScenario):
+        get_state_machine().run({"clientID": "PRO001", "status": "X"})
@@ -0,0 +1,23 @@
+import types
+
+from accountopening.tool_calls import tool_call_waves
+
+
+def _calls(*names):
+    return [types.SimpleNamespace(id=f"call_{i}", function=types.SimpleNamespace(name=name, arguments="{}"))
+            for i, name in enumerate(names)]
+
+
+def _waves(*names):
+    return [[call.function.name for call in wave] for wave in tool_call_waves(_calls(*names))]
+
+
+def test_status_gated_steps_run_one_after_the_other():
+    assert _waves("collect_kyc_info", "collect_sow_info") == [["collect_kyc_info"], ["collect_sow_info"]]
+    assert _waves("perform_data_management_ai_extraction", "perform_name_screening") == \
+        [["perform_data_management_ai_extraction"], ["perform_name_screening"]]
+
+
+def test_reads_run_together():
+    assert _waves("fetch_prospect_details", "fetch_prospect_details") == \
+        [["fetch_prospect_details", "fetch_prospect_details"]]
@@ -0,0 +1,83 @@
+import asyncio
+
+import pytest
+
+from skills import account_opening_tools
+from skills.account_opening_tools import TOOLS, update_prospect_details, update_prospect_details_async
+
+IDENTITY = {"clientID": "string", "firstName": "string", "lastName": "string", "dateOfBirth": "string", "nationality": "string"}
+
+# Parameter types and required fields of the former hand-written tool definitions
+EXPECTED = {
+    "fetch_prospect_details": ({"full_name": "string"}, ["full_name"]),
+    "collect_kyc_info": ({"prospect_data": (IDENTITY, list(IDENTITY))}, ["prospect_data"]),
+    "collect_sow_info": ({"prospect_data": (IDENTITY, list(IDENTITY))}, ["prospect_data"]),
+    "perform_data_management_ai_extraction": (
+        {"prospect_data": ({"clientID": "string", "documents_provided": ("array", "string")}, ["clientID", "documents_provided"])},
+        ["prospect_data"]),
+    "perform_name_screening": ({"prospect_data": (IDENTITY, list(IDENTITY))}, ["prospect_data"]),
+    "create_client_profile": (
+        {"prospect_data": ({"clientID": "string", "risk_level": "string", "risk_score": "integer", "nationality": "string"},
+                           ["clientID", "risk_level", "risk_score", "nationality"]),
+         "name_screening_result": "string"},
+        ["prospect_data", "name_screening_result"]),
+    "perform_compliance_risk_assessment": (
+        {"prospect_data": ({"clientID": "string", "name_screening_result": "string", "risk_level": "string"},
+                           ["clientID", "name_screening_result", "risk_level"])},
+        ["prospect_data"]),
+    "assign_first_line_of_defence": ({"prospect_data": ({"clientID": "string"}, ["clientID"])}, ["prospect_data"]),
+    "instructions_complete": None,
+}
+
+
+def _types(schema):
+    # The type of a parameter schema in the form of EXPECTED
+    if schema["type"] == "object":
+        return {name: _types(value) for name, value in schema["properties"].items()}, schema["required"]
+    if schema["type"] == "array":
+        return "array", _types(schema["items"])
+    return schema["type"]
+
+
+def _signature(definition):
+    parameters = definition["function"].get("parameters")
+    if parameters is None:
+        return None
+    return {name: _types(value) for name, value in parameters["properties"].items()}, parameters["required"]
+
+
+def _unordered(signature):
+    # Required fields compared as sets: their order is not part of the schema
+    if isinstance(signature, tuple) and len(signature) == 2 and isinstance(signature[0], dict):
+        properties, required = signature
+        return {name: _unordered(value) for name, value in properties.items()}, set(required)
+    return signature
+
+
+def test_generated_schemas_match_the_hand_written_definitions():
+    generated = {definition["function"]["name"]: definition for definition in TOOLS}
+    assert list(generated) == list(EXPECTED)
+    for name, expected in EXPECTED.items():
+        assert _unordered(_signature(generated[name])) == _unordered(expected), name
+        assert generated[name]["function"]["description"]
+
+
+@pytest.mark.parametrize("name", [name for name, expected in EXPECTED.items() if expected])
+def test_every_parameter_is_described(name):
+    definition = next(definition for definition in TOOLS if definition["function"]["name"] == name)
+    for schema in definition["function"]["parameters"]["properties"].values():
+        assert schema["description"]
+
+
+def test_update_prospect_details_returns_a_dict_on_error(monkeypatch):
+    def unavailable():
+        raise RuntimeError("CRM unavailable")
+
+    async def aunavailable():
+        unavailable()
+
+    monkeypatch.setattr(account_opening_tools, "get_crm_store", unavailable)
+    monkeypatch.setattr(account_opening_tools, "get_async_crm_store", aunavailable)
+    expected = {"error": "update_prospect_details failed with error: CRM unavailable"}
+    assert update_prospect_details("PRO001", {"status": "Prospect"}) == expected
+    assert asyncio.run(update_prospect_details_async("PRO001", {"status": "Prospect"})) == expected
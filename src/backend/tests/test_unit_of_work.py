@@ -0,0 +1,40 @@
+import asyncio
+
+from local_store import AsyncSQLiteCRMStore, AsyncSQLiteEventStore, LocalDatabase, SQLiteCRMStore, SQLiteEventStore
+from unit_of_work import ProspectUnitOfWork
+
+PROFILE = {"clientID": "PRO001", "fullName": "Ana Silva", "status": "Prospect", "email": "ana@example.com"}
+
+
+def test_commit_rebases_on_a_concurrent_write():
+    database = LocalDatabase(":memory:")
+    store = SQLiteCRMStore(database, "clientdata")
+    store.create_customer_profile(dict(PROFILE))
+    uow = ProspectUnitOfWork(store, events=SQLiteEventStore(database, "prospectevents"))
+
+    uow.stage("PRO001", {"status": "Name screening passed."})
+    store.update_customer_profile("PRO001", {"email": "ana.silva@example.com"})
+    uow.commit()
+
+    profile = store.get_customer_profile_by_client_id("PRO001")
+    assert profile["status"] == "Name screening passed."
+    assert profile["email"] == "ana.silva@example.com"
+    assert uow.stats["commits"] == 1 and uow.stats["rebased_commits"] == 1
+
+
+def test_acommit_rebases_on_a_concurrent_write():
+    database = LocalDatabase(":memory:")
+    store = AsyncSQLiteCRMStore(database, "clientdata")
+
+    async def run():
+        await store.create_customer_profile(dict(PROFILE))
+        uow = ProspectUnitOfWork(store, events=AsyncSQLiteEventStore(database, "prospectevents"))
+        await uow.astage("PRO001", {"status": "Name screening passed."})
+        await store.update_customer_profile("PRO001", {"email": "ana.silva@example.com"})
+        await uow.acommit()
+        return uow, await store.get_customer_profile_by_client_id("PRO001")
+
+    uow, profile = asyncio.run(run())
+    assert profile["status"] == "Name screening passed."
+    assert profile["email"] == "ana.silva@example.com"
+    assert uow.stats["commits"] == 1 and uow.stats["rebased_commits"] == 1
@@ -0,0 +1,402 @@
+import os
+import copy
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager, asynccontextmanager
+
+from crm_store import PreconditionFailedError
+from patching import SYSTEM_PROPERTIES, diff
+from event_store import EVENT_FIELDS, summarize, adopt_legacy_entries, get_event_store, get_async_event_store
+from telemetry import tracer, record_status_transition
+
+# Conditional write attempts before giving up on a hot document
+MAX_COMMIT_ATTEMPTS = 3
+
+_current_unit_of_work = contextvars.ContextVar("unit_of_work", default=None)
+
+
+class ConcurrencyConflictError(Exception):
+    """
+    Raised at commit when a field changed by the run was also changed, differently, by another writer.
+    """
+
+
+def _staged_fields(updated_data, events=None, fields=None):
+    """
+    The fields of `updated_data` a write stages: only `fields` when given (the fields the tool writes:
+    the prospect_data a tool is given may be an older copy, its other fields must not overwrite newer
+    values) and, with events, never the history fields (derived from the events, see _record_events).
+    """
+    return {
+        key: value for key, value in updated_data.items()
+        if key not in SYSTEM_PROPERTIES and (fields is None or key in fields)
+        and (events is None or key not in EVENT_FIELDS.values())
+    }
+
+
+def current_unit_of_work():
+    """
+    Returns the unit of work of the running agent run, or None outside of a run.
+    """
+    return _current_unit_of_work.get()
+
+
+def rebase(base: dict, working: dict, latest: dict) -> dict:
+    """
+    Re-applies the changes of the run (base -> working) on top of the latest stored profile.
+
+    - fields only the run changed are taken from the working copy;
+    - lists both sides appended to (e.g. "onboarding") keep the latest items followed by the run's new ones;
+    - any other field changed on both sides to different values is a conflict.
+    """
+    merged = copy.deepcopy(latest)
+    conflicts = []
+    for key, value in working.items():
+        if key in SYSTEM_PROPERTIES or base.get(key) == value:
+            continue
+        base_value, latest_value = base.get(key), latest.get(key)
+        if latest_value == base_value or latest_value == value:
+            merged[key] = value
+        elif isinstance(value, list) and isinstance(latest_value, list) and isinstance(base_value, list) \
+                and value[:len(base_value)] == base_value and latest_value[:len(base_value)] == base_value:
+            merged[key] = latest_value + value[len(base_value):]
+        else:
+            conflicts.append(key)
+    if conflicts:
+        raise ConcurrencyConflictError(f"Profile {working.get('clientID')} changed concurrently on {conflicts}")
+    return merged
+
+
+def _run(calls):
+    """
+    Makes the store calls yielded by `calls` (a generator of (function, args, kwargs)), sending back
+    each result or throwing the exception it raised, and returns the generator's return value.
+    """
+    result, error = None, None
+    while True:
+        try:
+            function, args, kwargs = calls.throw(error) if error is not None else calls.send(result)
+        except StopIteration as done:
+            return done.value
+        try:
+            result, error = function(*args, **kwargs), None
+        except Exception as e:
+            result, error = None, e
+
+
+async def _arun(calls):
+    """
+    Async variant of _run: the yielded store calls are coroutine functions (AsyncCRMStore).
+    """
+    result, error = None, None
+    while True:
+        try:
+            function, args, kwargs = calls.throw(error) if error is not None else calls.send(result)
+        except StopIteration as done:
+            return done.value
+        try:
+            result, error = await function(*args, **kwargs), None
+        except Exception as e:
+            result, error = None, e
+
+
+class ProspectUnitOfWork:
+    """
+    Collects the profile writes of one agent run: tools mutate an in-memory working copy and the
+    run commits once, with a single ETag-conditional write of the changed fields per profile.
+
+    History events (onboarding, KYC reviews) are appended to the events container at commit and
+    only a bounded summary of the most recent ones is kept in the profile.
+
+    Args:
+    - store: The CRMStore (or AsyncCRMStore) the profiles are read from and committed to.
+    - commit_every (int): Commit after this many staged writes (checkpoints), 0 to commit only at the end.
+    - events: The EventStore (or AsyncEventStore) the history events are appended to.
+    - on_event: Called with a "status" event when a staged write changes a prospect status
+      and with a "commit" event when a profile is written.
+    """
+    def __init__(self, store, commit_every=0, events=None, on_event=None):
+        self.store = store
+        self.commit_every = commit_every
+        self.events = events
+        self.on_event = on_event
+        self.stats = {"reads": 0, "staged_writes": 0, "commits": 0, "rebased_commits": 0, "events": 0}
+        self._base = {}
+        self._working = {}
+        self._pending_events = {}
+        self._dirty = set()
+        self._staged_since_commit = 0
+        self._lock = threading.RLock()
+
+    def _track(self, client_id, profile):
+        self.stats["reads"] += 1
+        self._base[client_id] = copy.deepcopy(profile)
+        self._working[client_id] = profile
+
+    def _merge(self, client_id, updated_data, events=None, fields=None):
+        working = self._working[client_id]
+        status = working.get("status")
+        for key, value in _staged_fields(updated_data, events, fields).items():
+            working[key] = copy.deepcopy(value)
+        if events:
+            self._record_events(client_id, working, events)
+        if working.get("status") != status:
+            record_status_transition(client_id, status, working.get("status"))
+            if self.on_event is not None:
+                self.on_event({"type": "status", "clientID": client_id, "status": working.get("status")})
+        self._dirty.add(client_id)
+        self.stats["staged_writes"] += 1
+        self._staged_since_commit += 1
+        return working
+
+    def _record_events(self, client_id, working, events):
+        pending = self._pending_events.setdefault(client_id, [])
+        for kind, field in EVENT_FIELDS.items():
+            kind_events = [event for event in events if event["kind"] == kind]
+            if not kind_events:
+                continue
+            recent, legacy_events = adopt_legacy_entries(client_id, kind, working.get(field, []))
+            pending.extend(legacy_events + kind_events)
+            working[field] = summarize(recent, kind_events)
+
+    def _rebase(self, client_id, latest):
+        # History summaries are rebuilt from the latest ones plus the run's events, the other fields are rebased
+        base, working = self._base[client_id], self._working[client_id]
+        fields = set(EVENT_FIELDS.values())
+        merged = rebase(
+            {key: value for key, value in base.items() if key not in fields},
+            {key: value for key, value in working.items() if key not in fields},
+            latest
+        )
+        for field in fields:
+            base_ids = {entry.get("id") for entry in base.get(field, [])}
+            new_entries = [entry for entry in working.get(field, []) if entry.get("id") not in base_ids]
+            if new_entries:
+                merged[field] = summarize(latest.get(field, []), new_entries)
+        return merged
+
+    def _take_pending_events(self):
+        pending, self._pending_events = self._pending_events, {}
+        self.stats["events"] += sum(len(events) for events in pending.values())
+        return pending
+
+    def _checkpoint_due(self):
+        return self.commit_every and self._staged_since_commit >= self.commit_every
+
+    # sync API
+
+    def get(self, client_id):
+        """
+        Returns the working copy of a profile (read from the store on first access), or None.
+        """
+        with self._lock:
+            if client_id not in self._working:
+                profile = self.store.get_customer_profile_by_client_id(client_id)
+                if profile is None:
+                    return None
+                self._track(client_id, profile)
+            return self._working[client_id]
+
+    def stage(self, client_id, updated_data, events=None, fields=None):
+        """
+        Merges `updated_data` into the working copy instead of writing it to the store.
+
+        Args:
+        - client_id (str): The profile to update.
+        - updated_data (dict): The fields to set.
+        - events (list): History events logged by the step (see event_store.new_event), if any.
+        - fields (set): Only stage these fields of `updated_data` (the fields the tool writes), None for all.
+        """
+        with self._lock:
+            if self.get(client_id) is None:
+                logging.info(f"No profile found for clientID: {client_id}")
+                return None
+            working = self._merge(client_id, updated_data, events, fields)
+            if self._checkpoint_due():
+                self.commit()
+            return working
+
+    def commit(self):
+        """
+        Writes what changed in every dirty profile with one ETag-conditional patch (or replace),
+        rebasing on the latest document when another writer got there first.
+        """
+        with self._lock, tracer.start_as_current_span("ao.commit") as span:
+            span.set_attribute("ao.commit.profiles", len(self._dirty))
+            # Events first: the profile summary never references an event that was not stored
+            for client_id, events in self._take_pending_events().items():
+                (self.events or get_event_store()).append_events(client_id, events)
+            for client_id in sorted(self._dirty):
+                self._committed(client_id, _run(self._commit_calls(client_id)))
+            self._dirty.clear()
+            self._staged_since_commit = 0
+
+    # async API (AsyncCRMStore)
+
+    async def aget(self, client_id):
+        if client_id not in self._working:
+            profile = await self.store.get_customer_profile_by_client_id(client_id)
+            if profile is None:
+                return None
+            self._track(client_id, profile)
+        return self._working[client_id]
+
+    async def astage(self, client_id, updated_data, events=None, fields=None):
+        if await self.aget(client_id) is None:
+            logging.info(f"No profile found for clientID: {client_id}")
+            return None
+        working = self._merge(client_id, updated_data, events, fields)
+        if self._checkpoint_due():
+            await self.acommit()
+        return working
+
+    async def acommit(self):
+        with tracer.start_as_current_span("ao.commit") as span:
+            span.set_attribute("ao.commit.profiles", len(self._dirty))
+            for client_id, events in self._take_pending_events().items():
+                await (self.events or await get_async_event_store()).append_events(client_id, events)
+            for client_id in sorted(self._dirty):
+                self._committed(client_id, await _arun(self._commit_calls(client_id)))
+            self._dirty.clear()
+            self._staged_since_commit = 0
+
+    # concurrent tool calls
+
+    def fork(self):
+        """
+        Returns a unit of work for one of several tool calls run concurrently: it reads through this
+        unit of work and records its writes, which join() applies here in the order of the calls.
+        """
+        return ForkedUnitOfWork(self)
+
+    def join(self, forks):
+        for fork in forks:
+            for client_id, updated_data, events, fields in fork.staged:
+                self.stage(client_id, updated_data, events, fields)
+
+    async def ajoin(self, forks):
+        for fork in forks:
+            for client_id, updated_data, events, fields in fork.staged:
+                await self.astage(client_id, updated_data, events, fields)
+
+    def _commit_calls(self, client_id):
+        # The commit of one dirty profile, shared by commit and acommit: yields the store calls
+        # (function, args, kwargs) that _run / _arun make, and returns the committed document (None: no change)
+        current, target = self._base[client_id], self._working[client_id]
+        for attempt in range(MAX_COMMIT_ATTEMPTS):
+            operations = diff(current, target)
+            if not operations:
+                return None
+            try:
+                return (yield self.store.patch_customer_profile,
+                        (client_id, operations), {"etag": current.get("_etag"), "current": current})
+            except PreconditionFailedError:
+                if attempt == MAX_COMMIT_ATTEMPTS - 1:
+                    raise
+            current = yield self.store.get_customer_profile_by_client_id, (client_id,), {}
+            target = self._rebase(client_id, current)
+            self.stats["rebased_commits"] += 1
+
+    def _committed(self, client_id, committed):
+        # The committed document becomes the new base (and ETag) of the next checkpoint
+        if committed is None:
+            self._base[client_id] = copy.deepcopy(self._working[client_id])
+            return
+        self.stats["commits"] += 1
+        self._base[client_id] = copy.deepcopy(committed)
+        self._working[client_id] = committed
+        if self.on_event is not None:
+            self.on_event({"type": "commit", "clientID": client_id, "status": committed.get("status")})
+
+
+class ForkedUnitOfWork:
+    """
+    Unit of work of a tool call running concurrently with others (see ProspectUnitOfWork.fork).
+    """
+    def __init__(self, parent):
+        self.parent = parent
+        self.staged = []
+
+    def get(self, client_id):
+        return self.parent.get(client_id)
+
+    async def aget(self, client_id):
+        return await self.parent.aget(client_id)
+
+    def stage(self, client_id, updated_data, events=None, fields=None):
+        return self._record(client_id, self.parent.get(client_id), updated_data, events, fields)
+
+    async def astage(self, client_id, updated_data, events=None, fields=None):
+        return self._record(client_id, await self.parent.aget(client_id), updated_data, events, fields)
+
+    def _record(self, client_id, working, updated_data, events, fields):
+        if working is None:
+            logging.info(f"No profile found for clientID: {client_id}")
+            return None
+        self.staged.append((client_id, copy.deepcopy(updated_data), events, fields))
+        # Preview of the working copy once this write is joined
+        preview = copy.deepcopy(working)
+        preview.update(copy.deepcopy(_staged_fields(updated_data, events, fields)))
+        return preview
+
+    @contextmanager
+    def activate(self):
+        """
+        Makes this fork the current unit of work of the enclosed tool call.
+        """
+        token = _current_unit_of_work.set(self)
+        try:
+            yield self
+        finally:
+            _current_unit_of_work.reset(token)
+
+
+def _commit_every():
+    return int(os.getenv("AO_COMMIT_EVERY", "0"))
+
+
+@contextmanager
+def unit_of_work(store, commit_every=None, events=None, on_event=None):
+    """
+    Runs the enclosed agent run in a unit of work and commits it at exit.
+
+    The staged writes are committed even when the run fails: the steps already executed
+    (e.g. a name screening) happened and their status must not be lost. The run error is
+    raised then, not the error of that commit (logged).
+    """
+    uow = ProspectUnitOfWork(store, _commit_every() if commit_every is None else commit_every, events, on_event)
+    token = _current_unit_of_work.set(uow)
+    try:
+        yield uow
+    except BaseException:
+        _current_unit_of_work.reset(token)
+        try:
+            uow.commit()
+        except Exception as e:
+            logging.error(f"Unit of work of the failed run not committed: {str(e)}")
+        raise
+    _current_unit_of_work.reset(token)
+    uow.commit()
+    logging.info(f"Unit of work committed: {uow.stats}")
+
+
+@asynccontextmanager
+async def async_unit_of_work(store, commit_every=None, events=None, on_event=None):
+    """
+    Async variant of unit_of_work, for an AsyncCRMStore.
+    """
+    uow = ProspectUnitOfWork(store, _commit_every() if commit_every is None else commit_every, events, on_event)
+    token = _current_unit_of_work.set(uow)
+    try:
+        yield uow
+    except BaseException:
+        _current_unit_of_work.reset(token)
+        try:
+            await uow.acommit()
+        except Exception as e:
+            logging.error(f"Unit of work of the failed run not committed: {str(e)}")
+        raise
+    _current_unit_of_work.reset(token)
+    await uow.acommit()
+    logging.info(f"Unit of work committed: {uow.stats}")
@@ -2,13 +2,23 @@ import streamlit as st
 import requests
 import pandas as pd
 import json
+import time
 from datetime import datetime
 
 from ui_utils import *
 
 API_URL = "http://localhost:8000/prospects"
+PROSPECT_URL = "http://localhost:8000/prospect"
+SEARCH_PROSPECTS_URL = "http://localhost:8000/search_prospects"
+PROSPECTS_PAGE_SIZE = 50
 UPDATE_PROSPECT_URL = "http://localhost:8000/update_prospect" 
+PATCH_PROSPECT_URL = "http://localhost:8000/patch_prospect"
+HISTORY_URL = "http://localhost:8000/prospect_history"
+HISTORY_PAGE_SIZE = 20
 RUN_AGENTS_URL = "http://localhost:8000/run_ao_agents" 
+RUN_AGENTS_STREAM_URL = "http://localhost:8000/run_ao_agents/stream"
+RUN_AGENTS_BATCH_URL = "http://localhost:8000/run_ao_agents/batch"
+JOBS_URL = "http://localhost:8000/jobs"
 
 PHASES = [
     "KYC Information",
@@ -23,17 +33,77 @@ PHASES = [
     "Account opening"
 ]
 
-def fetch_prospects():
-    payload = {"user_id": "default_user"}  
+def fetch_prospects(continuation_token: str = None):
+    """
+    Calls the FastAPI endpoint /prospects for one page of the prospects list (list fields only).
+    Returns the prospects and the continuation token of the next page.
+    """
+    payload = {"user_id": "default_user", "page_size": PROSPECTS_PAGE_SIZE, "continuation_token": continuation_token}
     try:
         response = requests.post(API_URL, json=payload)
         response.raise_for_status()
         data = response.json()
         if isinstance(data, str):
             data = json.loads(data)
-        return data if data else []
+        if "error" in data:
+            st.error(data["error"])
+            return [], None
+        return data.get("prospects", []), data.get("continuation_token")
     except requests.exceptions.RequestException as e:
         st.error(f"Error fetching prospects: {e}")
+        return [], None
+
+
+def load_prospects_page(page: int = 0):
+    """
+    Loads a page of the prospects list into the session. The continuation token of every page reached
+    so far is kept, so that Previous goes back without reloading from the first page.
+    """
+    tokens = st.session_state.setdefault("prospects_page_tokens", [None])
+    st.session_state.prospects, next_token = fetch_prospects(tokens[page])
+    del tokens[page + 1:]
+    if next_token:
+        tokens.append(next_token)
+    st.session_state.prospects_page = page
+
+
+def fetch_prospect(client_id: str, user_id: str = "default_user"):
+    """
+    Calls the FastAPI endpoint /prospect for the full profile of a prospect (None if not found or failed).
+    """
+    try:
+        response = requests.post(PROSPECT_URL, json={"user_id": user_id, "client_id": client_id})
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        data = response.json()
+        if isinstance(data, str):
+            data = json.loads(data)
+        if "error" in data:
+            st.error(data["error"])
+            return None
+        return data
+    except requests.exceptions.RequestException as e:
+        st.error(f"Error fetching prospect {client_id}: {e}")
+        return None
+
+
+def search_prospects(query: str, user_id: str = "default_user"):
+    """
+    Calls the FastAPI endpoint /search_prospects for the prospects best matching a name (clientID, fullName, score).
+    """
+    try:
+        response = requests.post(SEARCH_PROSPECTS_URL, json={"user_id": user_id, "query": query})
+        response.raise_for_status()
+        data = response.json()
+        if isinstance(data, str):
+            data = json.loads(data)
+        if "error" in data:
+            st.error(data["error"])
+            return []
+        return data.get("matches", [])
+    except requests.exceptions.RequestException as e:
+        st.error(f"Error searching prospects: {e}")
         return []
 
 
@@ -109,7 +179,7 @@ def show_form_for_step(step_index: int, prospect):
                 st.session_state.selected_prospect = updated_p
 
                 # 2) Real API call to persist changes
-                api_response = update_prospect_in_backend(updated_p)
+                api_response = update_prospect_in_backend(updated_p, prospect)
                 if api_response:
                     # 3) Store the updated doc from the server back into local state
                     st.session_state.selected_prospect = api_response
@@ -138,7 +208,7 @@ def show_form_for_step(step_index: int, prospect):
                 updated_p["declared_source_of_wealth"] = selected_sow
 
                 st.session_state.selected_prospect = updated_p
-                api_response = update_prospect_in_backend(updated_p)
+                api_response = update_prospect_in_backend(updated_p, prospect)
                 if api_response:
                     st.success("Source of Wealth updated in backend!")
                     st.session_state.selected_prospect = api_response
@@ -204,7 +274,7 @@ def show_form_for_step(step_index: int, prospect):
                 st.session_state.selected_prospect = updated_p
 
                 # 4) API call to update in the backend (example)
-                api_response = update_prospect_in_backend(updated_p)
+                api_response = update_prospect_in_backend(updated_p, prospect)
                 if api_response:
                     # If your endpoint returns the updated doc, store it
                     st.session_state.selected_prospect = api_response
@@ -252,7 +322,7 @@ def show_form_for_step(step_index: int, prospect):
             updated_p["status"] = "First line of defence: approved"
 
             st.session_state.selected_prospect = updated_p
-            api_response = update_prospect_in_backend(updated_p)
+            api_response = update_prospect_in_backend(updated_p, prospect)
             if api_response:
                 st.success("Back-office approval updated in backend!")
                 st.session_state.selected_prospect = api_response
@@ -280,9 +350,9 @@ def show_form_for_step(step_index: int, prospect):
         
             updated_p = st.session_state.selected_prospect
 
-            with st.spinner("Running agentic workflow in the backend...", show_time=False):
-                # API call to run agentic process in the backend
-                api_response = run_agents_in_backend(updated_p)
+            with st.status("Running agentic workflow in the backend...", expanded=True) as run_status:
+                # Streamed API call: plan, tool calls and status changes are rendered as they happen
+                api_response = show_agent_run(stream_agents_from_backend(updated_p), run_status)
                 if api_response:
                     # If your endpoint returns the updated doc, store it
                     st.session_state.selected_prospect = api_response
@@ -291,6 +361,15 @@ def show_form_for_step(step_index: int, prospect):
                 else:
                     st.error("Agentic workflow failed.")
 
+        # Background job: the run goes on (and is retried) even if this page is closed
+        if st.button("Run Agents in background", type="tertiary", icon=":material/schedule:", use_container_width=False):
+            with st.spinner("Agentic workflow queued in the backend..."):
+                api_response = run_agents_in_backend(st.session_state.selected_prospect)
+            if api_response:
+                st.session_state.selected_prospect = api_response
+                st.success("Agentic workflow ran succesfully!")
+                st.rerun()
+
     with col_right:
         if st.button("Back to List", type="tertiary", icon=":material/list:",use_container_width=False):
             st.session_state.view = "list"
@@ -299,6 +378,13 @@ def show_form_for_step(step_index: int, prospect):
 def show_prospect_list():
     prospects = st.session_state.prospects
     st.markdown("<h2>Prospects</h2>", unsafe_allow_html=True)
+    query = st.text_input("Search by name", key="prospects_search")
+    if query:
+        # Ranked matches instead of the current page (search results have no DOB/status: shown on the details)
+        prospects = search_prospects(query)
+        if not prospects:
+            st.info(f"No prospect matches '{query}'.")
+            return
     if not prospects:
         st.info("No prospects found from the API.")
         return
@@ -319,14 +405,56 @@ def show_prospect_list():
         row_cols[3].write(p.get('status', ''))
 
         if row_cols[4].button("Show Details", key=f"show_{i}"):
-            st.session_state.selected_prospect = p
+            # The list only has the list fields: the details view needs the full profile
+            # (prospects created in this session are not saved yet: shown as entered)
+            st.session_state.selected_prospect = fetch_prospect(p.get('clientID')) or p
             st.session_state.view = "detail"
             st.rerun()
+
+    if not query:
+        page = st.session_state.get("prospects_page", 0)
+        tokens = st.session_state.get("prospects_page_tokens", [None])
+        nav_cols = st.columns([1, 1, 6])
+        if nav_cols[0].button("Previous", key="prospects_previous", disabled=page == 0):
+            load_prospects_page(page - 1)
+            st.rerun()
+        if nav_cols[1].button("Next", key="prospects_next", disabled=len(tokens) <= page + 1):
+            load_prospects_page(page + 1)
+            st.rerun()
+        nav_cols[2].caption(f"Page {page + 1}")
     # New button at the bottom for creating a new prospect
     if st.button("Create prospect", key="create_prospect"):
         st.session_state.view = "create"
         st.rerun()
 
+    show_batch_rerun_form(st.session_state.prospects)
+
+
+def show_batch_rerun_form(prospects):
+    """
+    Ops form: re-runs the agentic workflow, in one backend batch job, on every prospect at a given status.
+    """
+    with st.expander("Re-run agents in batch"):
+        statuses = sorted({p.get("status", "") for p in prospects})
+        status = st.selectbox("Prospects at status", statuses)
+        concurrency = st.number_input("Concurrency", min_value=1, max_value=20, value=5)
+        if st.button("Run batch", type="secondary", icon=":material/playlist_play:"):
+            progress_bar = st.progress(0.0, text="Batch queued...")
+            job = None
+            for job in run_agents_batch_in_backend({"prefix": "PRO", "status": status}, concurrency):
+                report = job.get("result") or {}
+                if report.get("total"):
+                    progress_bar.progress(report["done"] / report["total"],
+                                          text=f"{report['done']}/{report['total']} prospects")
+            if job and job["status"] == "succeeded":
+                report = job["result"]
+                st.success(f"{report['succeeded']} succeeded ({report.get('partial', 0)} partial), {report['failed']} failed "
+                           f"({report['items_per_minute']} prospects/min)")
+                st.dataframe(pd.DataFrame(report["items"]))
+                load_prospects_page(st.session_state.get("prospects_page", 0))
+            elif job:
+                st.error(f"Batch failed: {job.get('error')}")
+
 def show_prospect_details():
     """
     Left column: subway steps (clickable).
@@ -351,7 +479,7 @@ def show_prospect_details():
 
     # Right: the relevant form
     with col_right:
-        show_banner(p)
+        show_banner(p, fetch_prospect_history)
         show_form_for_step(st.session_state.active_step, p)
 
 def show_create_prospect_form():
@@ -398,18 +526,40 @@ def show_create_prospect_form():
             st.rerun()
 
 
-def update_prospect_in_backend(prospect_data: dict, user_id: str = "default_user"):
+def merge_patch_for(original: dict, updated: dict) -> dict:
+    """
+    Top-level JSON merge patch (RFC 7386) turning `original` into `updated`.
+    """
+    patch = {key: value for key, value in updated.items() if key not in original or original[key] != value}
+    patch.update({key: None for key in original if key not in updated})
+    return patch
+
+
+def update_prospect_in_backend(prospect_data: dict, original: dict = None, user_id: str = "default_user"):
     """
-    Calls the FastAPI endpoint /update_prospect to update the prospect data in Cosmos DB.
+    Persists the prospect changes in Cosmos DB. When the `original` document is known, only the
+    changed fields are sent to /patch_prospect (nothing is sent if nothing changed); otherwise the
+    whole document goes to /update_prospect.
     Returns the response data 
     """
-    payload = {
-        "user_id": user_id,
-        # The backend expects prospect_data as a JSON string
-        "prospect_data": json.dumps(prospect_data)
-    }
+    if original is not None:
+        merge_patch = merge_patch_for(original, prospect_data)
+        if not merge_patch:
+            return original
+        url = PATCH_PROSPECT_URL
+        payload = {
+            "user_id": user_id,
+            "client_id": original["clientID"],
+            "merge_patch": merge_patch
+        }
+    else:
+        url = UPDATE_PROSPECT_URL
+        payload = {
+            "user_id": user_id,
+            "prospect_data": prospect_data
+        }
     try:
-        resp = requests.post(UPDATE_PROSPECT_URL, json=payload)
+        resp = requests.post(url, json=payload)
         resp.raise_for_status()
         # The endpoint returns a JSON string or None
         data = resp.json()
@@ -422,25 +572,111 @@ def update_prospect_in_backend(prospect_data: dict, user_id: str = "default_user
         return None
 
 
-def run_agents_in_backend(prospect_data: dict, user_id: str = "default_user"):
+def fetch_prospect_history(client_id: str, continuation_token: str = None, user_id: str = "default_user"):
     """
-    Calls the FastAPI endpoint /run_ao_agents to update the status of the prospect.
-    Returns the response data 
+    Calls the FastAPI endpoint /prospect_history for one page of the prospect history.
+    Returns the events (newest first) and the continuation token of the next page.
     """
     payload = {
         "user_id": user_id,
-        # The backend expects prospect_data as a JSON string
-        "prospect_data": json.dumps(prospect_data)
+        "client_id": client_id,
+        "page_size": HISTORY_PAGE_SIZE,
+        "continuation_token": continuation_token
     }
     try:
-        resp = requests.post(RUN_AGENTS_URL, json=payload)
+        resp = requests.post(HISTORY_URL, json=payload)
         resp.raise_for_status()
-        # The endpoint returns a JSON string or None
         data = resp.json()
-        # If data is a JSON string, parse it
         if isinstance(data, str):
             data = json.loads(data)
-        return data  
+        if "error" in data:
+            st.error(data["error"])
+            return [], None
+        return data.get("events", []), data.get("continuation_token")
+    except requests.exceptions.RequestException as e:
+        st.error(f"Failed to load prospect history: {e}")
+        return [], None
+
+
+def stream_agents_from_backend(prospect_data: dict, user_id: str = "default_user"):
+    """
+    Calls the FastAPI endpoint /run_ao_agents/stream and yields the run events (Server-Sent Events)
+    as soon as the backend sends them; the last one is a "result" or an "error" event.
+    """
+    payload = {
+        "user_id": user_id,
+        "prospect_data": prospect_data
+    }
+    try:
+        with requests.post(RUN_AGENTS_STREAM_URL, json=payload, stream=True, timeout=(10, None)) as resp:
+            resp.raise_for_status()
+            # chunk_size=None: hand over each line as soon as it arrives
+            for line in resp.iter_lines(chunk_size=None, decode_unicode=True):
+                if line and line.startswith("data:"):
+                    yield json.loads(line[len("data:"):])
+    except requests.exceptions.RequestException as e:
+        yield {"type": "error", "error": f"Failed to run agents in backend: {e}"}
+
+
+def run_agents_batch_in_backend(batch_filter: dict, concurrency: int, user_id: str = "default_user", poll_interval: float = 1.0):
+    """
+    Queues a batch run with the FastAPI endpoint /run_ao_agents/batch and yields the job
+    (with the per-prospect results done so far) every `poll_interval` seconds until it is over.
+    """
+    payload = {
+        "user_id": user_id,
+        "filter": batch_filter,
+        "concurrency": concurrency
+    }
+    try:
+        resp = requests.post(RUN_AGENTS_BATCH_URL, json=payload)
+        resp.raise_for_status()
+        job = json.loads(resp.json())
+        if "error" in job:
+            st.error(job["error"])
+            return
+        while job["status"] in ("queued", "running"):
+            time.sleep(poll_interval)
+            resp = requests.get(f"{JOBS_URL}/{job['job_id']}")
+            resp.raise_for_status()
+            job = json.loads(resp.json())
+            yield job
+    except requests.exceptions.RequestException as e:
+        st.error(f"Failed to run ao agentic process in batch: {e}")
+
+
+def run_agents_in_backend(prospect_data: dict, user_id: str = "default_user", poll_interval: float = 1.0):
+    """
+    Queues the agentic process with the FastAPI endpoint /run_ao_agents, then polls /jobs/{job_id}
+    until the run is over (the job runs on the prospect as stored in the backend when it starts).
+    Returns the updated prospect (None if the run failed)
+    """
+    payload = {
+        "user_id": user_id,
+        "prospect_data": prospect_data
+    }
+    try:
+        resp = requests.post(RUN_AGENTS_URL, json=payload)
+        resp.raise_for_status()
+        # The endpoint returns a JSON string
+        job = json.loads(resp.json())
+        if "error" in job:
+            st.error(job["error"])
+            return None
+
+        while job["status"] in ("queued", "running"):
+            time.sleep(poll_interval)
+            resp = requests.get(f"{JOBS_URL}/{job['job_id']}")
+            resp.raise_for_status()
+            job = json.loads(resp.json())
+
+        if job["status"] == "failed":
+            st.error(f"Agentic process failed: {job['error']}")
+            return None
+        result = job["result"]
+        if result.get("run_status") == "partial":
+            st.warning(f"Agentic process stopped early: {result['stop_reason']['budget']} budget exceeded")
+        return result["prospect"]
     except requests.exceptions.RequestException as e:
         st.error(f"Failed to run ao agentic process in backend: {e}")
         return None
@@ -454,7 +690,7 @@ def main():
         st.session_state.view = "list"
 
     if "prospects" not in st.session_state:
-        st.session_state.prospects = fetch_prospects()
+        load_prospects_page()
 
     if "selected_prospect" not in st.session_state:
         st.session_state.selected_prospect = None
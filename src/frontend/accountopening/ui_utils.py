@@ -69,11 +69,13 @@ def subway_sidebar(active_phase_index: int, PHASES):
 
 
 
-def show_banner(prospect: dict):
+def show_banner(prospect: dict, fetch_history=None):
     """
     Renders a banner on top of the detail view with:
       1) A risk-level 
-      2) A compliance status section using a standard resizable text area.
+      2) A compliance status section using a standard resizable text area, with the most recent
+         onboarding steps embedded in the prospect; the full history is only fetched, page by page,
+         with `fetch_history(client_id, continuation_token)` when asked for.
     """
     col_risk, col_logs = st.columns([1, 6], gap="small")
     with col_risk:
@@ -83,8 +85,19 @@ def show_banner(prospect: dict):
         st.metric("Risk", risk_level, delta=risk_level, delta_color="normal", help=None, label_visibility="visible")
        
     with col_logs:
-        # 2) Retrieve the onboarding array
-        onboarding_entries = prospect.get("onboarding", [])
+        # 2) Recent onboarding steps, or the history pages loaded so far
+        client_id = prospect.get("clientID")
+        history = st.session_state.get("history", {})
+        if history.get("clientID") != client_id:
+            history = {"clientID": client_id, "events": None, "continuation_token": None}
+            st.session_state.history = history
+
+        if history["events"] is None:
+            onboarding_entries = prospect.get("onboarding", [])
+            label = "Onboarding History (most recent)"
+        else:
+            onboarding_entries = history["events"]
+            label = "Onboarding History (newest first)"
         onboarding_text = "\n".join([
             f"{entry.get('timestamp', 'N/A')} – {entry.get('step', '')} – {entry.get('action', '')}"
             for entry in onboarding_entries
@@ -92,9 +105,47 @@ def show_banner(prospect: dict):
 
     
         st.markdown("#### Compliance Status")
-        onboarding_text = st.text_area("Onboarding History", onboarding_text, height=100)
+        onboarding_text = st.text_area(label, onboarding_text, height=100)
 
+        if fetch_history is not None and (history["events"] is None or history["continuation_token"]):
+            button_label = "Full history" if history["events"] is None else "Load more"
+            if st.button(button_label, type="tertiary", icon=":material/history:", key="history_button"):
+                events, continuation_token = fetch_history(client_id, history["continuation_token"])
+                history["events"] = (history["events"] or []) + events
+                history["continuation_token"] = continuation_token
+                st.rerun()
 
-   
 
-    
+def show_agent_run(events, run_status):
+    """
+    Renders the events of a streamed agent run inside an st.status container:
+    the planner output token by token, each tool call with its duration and each status change.
+    Returns the updated prospect (or None if the run failed).
+    """
+    plan_placeholder = st.empty()
+    plan = ""
+    prospect = None
+    for event in events:
+        event_type = event.get("type")
+        if event_type == "plan_token":
+            plan += event["content"]
+            plan_placeholder.markdown(plan)
+        elif event_type == "tool_call":
+            st.write(f"🔧 {event['name']}…")
+        elif event_type == "tool_result":
+            st.write(f"✅ {event['name']} ({event['duration_ms']:.0f} ms)")
+        elif event_type == "status":
+            run_status.update(label=f"Status: {event['status']}")
+            st.caption(f"Status: {event['status']}")
+        elif event_type == "budget_exceeded":
+            st.warning(f"Run stopped: {event['budget']} budget exceeded ({event['used']} / {event['limit']})")
+        elif event_type == "result":
+            prospect = event.get("prospect")
+            if event.get("run_status") == "partial":
+                run_status.update(label="Agentic workflow stopped early (partial result)", state="error")
+            else:
+                run_status.update(label="Agentic workflow completed", state="complete")
+        elif event_type == "error":
+            st.error(event["error"])
+            run_status.update(label="Agentic workflow failed", state="error")
+    return prospect